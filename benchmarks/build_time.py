@@ -0,0 +1,141 @@
+#!/bin/python
+"""Measure how long the OpenCL driver takes to build the original and the
+minified version of each source. This is the time an application saves at
+startup by shipping minified source.
+
+Driver side caches are disabled so every build actually compiles. Any OpenCL
+runtime works but a local CPU runtime such as POCL gives the most stable
+numbers.
+
+    python benchmarks/build_time.py --repeat 20 kernel.cl
+    python benchmarks/build_time.py --output build_time.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import json
+import math
+import os
+import sys
+
+# Disable the kernel caches of common drivers. This must happen before the
+# OpenCL runtime is loaded.
+os.environ["POCL_KERNEL_CACHE"] = "0"
+os.environ["CUDA_CACHE_DISABLE"] = "1"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import SIZES, generate_kernel
+from oclminify.build import BuildChecker, _parse_device_selection
+from oclminify.lexer import OpenCLCLexer
+from oclminify.minify import DEFAULT_PREPROCESSOR_COMMAND, _preprocess, minify
+
+
+DEFAULT_REPEAT = 10
+
+
+def count_tokens(data):
+    def error_func(message, line, column):
+        raise ValueError("%s at %i:%i" % (message, line, column))
+
+    lexer = OpenCLCLexer(error_func=error_func,
+                         on_lbrace_func=lambda: None,
+                         on_rbrace_func=lambda: None,
+                         type_lookup_func=lambda name: False)
+    lexer.build(optimize=False)
+    lexer.input(data)
+    count = 0
+    while lexer.token() is not None:
+        count += 1
+    return count
+
+
+def summarize(times):
+    mean = sum(times) / len(times)
+    variance = sum((t - mean) ** 2 for t in times) / (len(times) - 1) if len(times) > 1 else 0.0
+    return {
+        "mean": mean,
+        "min": min(times),
+        "max": max(times),
+        "variance": variance,
+        "stdev": math.sqrt(variance),
+        "runs": len(times),
+    }
+
+
+def benchmark_build(build_checker, data, repeat, options=""):
+    """Build data repeat times on every device selected by build_checker.
+    Returns a dict of timing summaries keyed by device name.
+    """
+
+    # The first build after creating a context is usually much slower while
+    # the driver loads its compiler, so it isn't counted.
+    build_checker.build(data, options)
+
+    times = {}
+    for _ in range(repeat):
+        for result in build_checker.build(data, options):
+            if not result.success:
+                raise RuntimeError("Could not build program on %s:\n%s" % (result.device_name, result.log))
+            times.setdefault(result.device_name, []).append(result.build_time)
+    return dict((device_name, summarize(device_times)) for (device_name, device_times) in times.items())
+
+
+def benchmark_source(build_checker, name, original, repeat, preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND):
+    minified = minify(original, preprocessor_command=preprocessor_command)
+    result = {}
+    for (variant, data) in [("original", original), ("minified", minified)]:
+        if variant == "original":
+            tokens = count_tokens(_preprocess(data, preprocessor_command))
+        else:
+            tokens = count_tokens(data)
+        result[variant] = {
+            "size": len(data),
+            "tokens": tokens,
+            "devices": benchmark_build(build_checker, data, repeat),
+        }
+    for (device_name, original_stats) in result["original"]["devices"].items():
+        minified_stats = result["minified"]["devices"][device_name]
+        print("%s on %s:" % (name, device_name), file=sys.stderr)
+        for variant in ["original", "minified"]:
+            stats = result[variant]["devices"][device_name]
+            print("  %-9s size=%-8i tokens=%-8i mean=%.4fs stdev=%.4fs min=%.4fs" % (variant, result[variant]["size"], result[variant]["tokens"], stats["mean"], stats["stdev"], stats["min"]), file=sys.stderr)
+        print("  speedup   %.2fx" % (original_stats["mean"] / minified_stats["mean"]), file=sys.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OpenCL driver build times of original and minified sources.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Number of times each source is built on each device. Defaults to %i." % DEFAULT_REPEAT)
+    parser.add_argument("--device", type=str, action="append", default=[], help="Device to build on in the form PLATFORM[:DEVICE]. Can be specified more than once. Defaults to every device.")
+    parser.add_argument("--preprocessor-command", type=str, default=DEFAULT_PREPROCESSOR_COMMAND, help="Command used to preprocess sources before minification.")
+    parser.add_argument("--output", type=str, default="", help="File path where JSON results should be saved.")
+    parser.add_argument("inputs", nargs="*", help="OpenCL source files to benchmark. Defaults to the synthetic corpus used by run.py.")
+    args = parser.parse_args()
+
+    sources = []
+    if args.inputs:
+        for path in args.inputs:
+            with open(path, "r") as fd:
+                sources.append((path, fd.read()))
+    else:
+        for size_name in ["small", "medium", "large"]:
+            sources.append((size_name, generate_kernel(**SIZES[size_name])))
+
+    # Build caching is disabled so the driver compiles the source every time.
+    build_checker = BuildChecker([_parse_device_selection(device) for device in args.device] or None, cache=None)
+    results = {}
+    try:
+        for (name, data) in sources:
+            results[name] = benchmark_source(build_checker, name, data, args.repeat, args.preprocessor_command)
+    finally:
+        build_checker.close()
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+            fd.write("\n")
+
+if __name__ == "__main__":
+    main()
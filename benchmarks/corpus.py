@@ -0,0 +1,201 @@
+from __future__ import absolute_import
+from __future__ import division
+import random
+
+
+# Preset corpus sizes used by run.py. Each entry is passed directly to
+# generate_kernel() as keyword arguments.
+SIZES = {
+    "small": {"function_count": 4},
+    "medium": {"function_count": 32},
+    "large": {"function_count": 128},
+}
+
+SCALAR_BUILTINS_1 = ["sin", "cos", "sqrt", "fabs", "exp", "native_exp", "floor"]
+SCALAR_BUILTINS_2 = ["fmax", "fmin", "pow", "hypot"]
+VECTOR_BUILTINS_1 = ["normalize", "fabs", "floor", "native_sqrt"]
+VECTOR_BUILTINS_3 = ["mad", "clamp", "mix"]
+VECTOR_REDUCE_BUILTINS_2 = ["dot", "distance"]
+FLOAT4_SWIZZLES = ["wzyx", "xxyy", "s3210", "s0123", "xyzw", "yxwz", "s1032"]
+FLOAT4_SCALAR_SWIZZLES = ["x", "y", "z", "w", "s0", "s1", "s2", "s3"]
+FLOAT8_FLOAT4_SWIZZLES = ["lo", "hi", "even", "odd", "s0123", "s4567", "s0246", "s1357"]
+OPERATORS = ["+", "-", "*", "/"]
+
+
+class _KernelWriter(object):
+    def __init__(self, rng, struct_depth, swizzle_density, expression_depth, builtin_density):
+        self.rng = rng
+        self.struct_depth = struct_depth
+        self.swizzle_density = swizzle_density
+        self.expression_depth = expression_depth
+        self.builtin_density = builtin_density
+
+    def chance(self, probability):
+        return self.rng.random() < probability
+
+    def constant(self):
+        return "%i.%if" % (self.rng.randint(0, 9), self.rng.randint(0, 99))
+
+    def struct_member(self):
+        # Walk down through the nested structs to a float member at a random
+        # depth.
+        depth = self.rng.randint(0, self.struct_depth)
+        path = "st" + ".inner" * depth
+        return path + ".f%i" % (self.struct_depth - depth)
+
+    def scalar_leaf(self):
+        choice = self.rng.random()
+        if choice < self.swizzle_density:
+            return "v%i.%s" % (self.rng.randint(0, 1), self.rng.choice(FLOAT4_SCALAR_SWIZZLES))
+        elif choice < 0.5 and self.struct_depth > 0:
+            return self.struct_member()
+        elif choice < 0.75:
+            return self.rng.choice(["f0", "f1", "arg"])
+        return self.constant()
+
+    def vector_leaf(self):
+        choice = self.rng.random()
+        if choice < self.swizzle_density / 2:
+            return "e.%s" % self.rng.choice(FLOAT8_FLOAT4_SWIZZLES)
+        elif choice < self.swizzle_density:
+            return "v%i.%s" % (self.rng.randint(0, 1), self.rng.choice(FLOAT4_SWIZZLES))
+        elif choice < 0.8:
+            return "v%i" % self.rng.randint(0, 1)
+        return "(float4)(%s,%s,%s,%s)" % tuple(self.constant() for _ in range(4))
+
+    def scalar_expression(self, depth):
+        if depth <= 0:
+            return self.scalar_leaf()
+        if self.chance(self.builtin_density):
+            kind = self.rng.randint(0, 2)
+            if kind == 0:
+                return "%s(%s)" % (self.rng.choice(SCALAR_BUILTINS_1), self.scalar_expression(depth - 1))
+            elif kind == 1:
+                return "%s(%s, %s)" % (self.rng.choice(SCALAR_BUILTINS_2), self.scalar_expression(depth - 1), self.scalar_expression(depth - 1))
+            return "%s(%s, %s)" % (self.rng.choice(VECTOR_REDUCE_BUILTINS_2), self.vector_expression(depth - 1), self.vector_expression(depth - 1))
+        return "(%s %s %s)" % (self.scalar_expression(depth - 1), self.rng.choice(OPERATORS), self.scalar_expression(depth - 1))
+
+    def vector_expression(self, depth):
+        if depth <= 0:
+            return self.vector_leaf()
+        if self.chance(self.builtin_density):
+            if self.chance(0.5):
+                return "%s(%s)" % (self.rng.choice(VECTOR_BUILTINS_1), self.vector_expression(depth - 1))
+            return "%s(%s, %s, %s)" % (self.rng.choice(VECTOR_BUILTINS_3), self.vector_expression(depth - 1), self.vector_expression(depth - 1), self.vector_expression(depth - 1))
+        return "(%s %s %s)" % (self.vector_expression(depth - 1), self.rng.choice(OPERATORS[:3]), self.vector_expression(depth - 1))
+
+    def structs(self):
+        lines = []
+        for depth in range(self.struct_depth + 1):
+            lines.append("struct Nested%i" % depth)
+            lines.append("{")
+            if depth > 0:
+                lines.append("    struct Nested%i inner;" % (depth - 1))
+            lines.append("    float f%i;" % depth)
+            lines.append("    float4 v%i;" % depth)
+            lines.append("};")
+        return lines
+
+    def body(self, statement_count):
+        depth = self.expression_depth
+        # Initialize with constants only so nothing is referenced before it
+        # is declared.
+        lines = [
+            "    float4 v0 = (float4)(%s,%s,%s,%s);" % tuple(self.constant() for _ in range(4)),
+            "    float4 v1 = (float4)(%s,%s,%s,%s);" % tuple(self.constant() for _ in range(4)),
+            "    float8 e = (float8)(v0, v1);",
+            "    float f0 = %s;" % self.constant(),
+            "    float f1 = %s;" % self.constant(),
+            "    struct Nested%i st;" % self.struct_depth,
+        ]
+        for depth_index in range(self.struct_depth + 1):
+            lines.append("    st%s.f%i = %s;" % (".inner" * depth_index, self.struct_depth - depth_index, self.constant()))
+        for index in range(statement_count):
+            kind = index % 4
+            if kind == 0:
+                lines.append("    v%i = %s;" % (index % 2, self.vector_expression(depth)))
+            elif kind == 1:
+                lines.append("    f%i = %s;" % (index % 2, self.scalar_expression(depth)))
+            elif kind == 2:
+                lines.append("    for (int i = 0; i < 4; ++i)")
+                lines.append("    {")
+                lines.append("        f0 += %s;" % self.scalar_expression(depth - 1))
+                lines.append("    }")
+            else:
+                lines.append("    if (f0 > f1)")
+                lines.append("        v0 = %s;" % self.vector_expression(depth - 1))
+                lines.append("    else")
+                lines.append("        f1 = %s;" % self.scalar_expression(depth - 1))
+        return lines
+
+
+def generate_kernel(function_count=4,
+                    struct_depth=2,
+                    swizzle_density=0.3,
+                    expression_depth=3,
+                    builtin_density=0.2,
+                    statement_count=8,
+                    seed=0):
+    """Generate a synthetic OpenCL source file. Every second function is a
+    kernel that calls the helper function defined immediately before it. The
+    same arguments always produce the same source.
+    """
+
+    writer = _KernelWriter(random.Random(seed), struct_depth, swizzle_density, expression_depth, builtin_density)
+    lines = ["// Synthetic benchmark kernel. Generated by benchmarks/corpus.py.", ]
+    lines.extend(writer.structs())
+    for index in range(function_count):
+        if index % 2 == 0:
+            lines.append("float helper_function_%i(float arg)" % index)
+            lines.append("{")
+            lines.extend(writer.body(statement_count))
+            lines.append("    return %s;" % writer.scalar_expression(expression_depth))
+            lines.append("}")
+        else:
+            lines.append("__kernel void kernel_function_%i(__global float* output, float arg)" % index)
+            lines.append("{")
+            lines.extend(writer.body(statement_count))
+            lines.append("    output[get_global_id(0)] = helper_function_%i(%s);" % (index - 1, writer.scalar_expression(expression_depth)))
+            lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_symbol_kernel(symbol_count=50000, locals_per_function=200, struct_count=16, fields_per_struct=8):
+    """Generate an OpenCL source file that declares about symbol_count
+    symbols. Most are locals of helper functions, each function having
+    locals_per_function of them, and the rest are fields of structs that nest
+    the struct declared before them. Used to measure the size and speed of
+    the minifier's symbol tables rather than of expressions.
+    """
+
+    lines = ["// Synthetic symbol table benchmark kernel. Generated by benchmarks/corpus.py.", ]
+    for struct_index in range(struct_count):
+        lines.append("typedef struct Record%i" % struct_index)
+        lines.append("{")
+        if struct_index > 0:
+            lines.append("    struct Record%i inner;" % (struct_index - 1))
+        for field_index in range(fields_per_struct):
+            lines.append("    float%s field%i;" % ("4" if field_index % 2 else "", field_index))
+        lines.append("} record%i_t;" % struct_index)
+
+    symbol_total = struct_count * (fields_per_struct + 2)
+    function_index = 0
+    while symbol_total < symbol_count:
+        record = function_index % struct_count
+        lines.append("float helper_function_%i(float arg, record%i_t record)" % (function_index, record))
+        lines.append("{")
+        lines.append("    float local0 = arg + record.field0;")
+        for local_index in range(1, locals_per_function):
+            lines.append("    float local%i = local%i * %i.5f;" % (local_index, local_index - 1, local_index % 10))
+        lines.append("    return local%i;" % (locals_per_function - 1))
+        lines.append("}")
+        symbol_total += locals_per_function + 3
+        function_index += 1
+
+    lines.append("__kernel void kernel_function(__global float* output, float arg)")
+    lines.append("{")
+    lines.append("    record0_t record;")
+    lines.append("    record.field0 = arg;")
+    lines.append("    output[get_global_id(0)] = helper_function_0(arg, record);")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
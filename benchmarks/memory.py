@@ -0,0 +1,92 @@
+#!/bin/python
+"""Measure the peak memory and time used by the minify stage on a synthetic
+kernel with a large number of symbols. Parsing and generating aren't
+included since their cost doesn't depend on the minifier's symbol tables.
+retained_bytes is what is still allocated once the minifier is done, which
+includes the symbol tables and changes made to the parsed source.
+Requires Python 3.4 or newer for tracemalloc.
+
+    python benchmarks/memory.py
+    python benchmarks/memory.py --symbols 5000 --output memory.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import generate_symbol_kernel
+from oclminify.minifier import Minifier
+from oclminify.minify import DEFAULT_PREPROCESSOR_COMMAND, _preprocess
+from oclminify.parser import Parser
+
+
+DEFAULT_SYMBOLS = 50000
+DEFAULT_LOCALS_PER_FUNCTION = 200
+
+
+def measure(source, preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND):
+    import tracemalloc
+
+    # Time and memory are measured separately since tracing allocations
+    # slows everything down.
+    parser = Parser()
+    preprocessed = _preprocess(source, preprocessor_command)
+    ast = parser.parse(preprocessed)
+    start = timeit.default_timer()
+    minifier = Minifier(True, "")
+    minifier.visit(ast)
+    elapsed = timeit.default_timer() - start
+
+    ast = parser.parse(preprocessed)
+    gc.collect()
+    tracemalloc.start()
+    minifier = Minifier(True, "")
+    minifier.visit(ast)
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "source_size": len(source),
+        "functions": len(minifier.functions),
+        "minify": elapsed,
+        "retained_bytes": current,
+        "peak_bytes": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory used by the minifier's symbol tables.")
+    parser.add_argument("--symbols", type=int, default=DEFAULT_SYMBOLS, help="Approximate number of symbols declared by the generated source. Defaults to %i." % DEFAULT_SYMBOLS)
+    parser.add_argument("--locals-per-function", type=int, default=DEFAULT_LOCALS_PER_FUNCTION, help="Number of locals declared by each generated function. Defaults to %i." % DEFAULT_LOCALS_PER_FUNCTION)
+    parser.add_argument("--preprocessor-command", type=str, default=DEFAULT_PREPROCESSOR_COMMAND, help="Command used to preprocess the generated source.")
+    parser.add_argument("--output", type=str, default="", help="File path where JSON results should be saved. Omit to write to stdout.")
+    args = parser.parse_args()
+
+    try:
+        import tracemalloc  # noqa: F401
+    except ImportError:
+        print("tracemalloc is not available. Python 3.4 or newer is required.", file=sys.stderr)
+        sys.exit(1)
+
+    source = generate_symbol_kernel(args.symbols, args.locals_per_function)
+    result = measure(source, args.preprocessor_command)
+    result["symbols"] = args.symbols
+    result["python"] = platform.python_version()
+    result["platform"] = platform.platform()
+    print("symbols=%i minify=%.2fs peak=%.1fMB retained=%.1fMB" % (args.symbols, result["minify"], result["peak_bytes"] / 1024.0 / 1024.0, result["retained_bytes"] / 1024.0 / 1024.0), file=sys.stderr)
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
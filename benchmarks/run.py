@@ -0,0 +1,163 @@
+#!/bin/python
+"""Time each stage of the oclminify pipeline across a range of synthetic
+kernel sizes.
+
+Results are written as JSON and can be compared against a stored baseline. A
+stage is reported as a regression when it is slower than the baseline by more
+than the threshold. Everything runs offline using the default gcc
+preprocessor.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline benchmarks/baseline.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import SIZES, generate_kernel
+from oclminify.generator import Generator
+from oclminify.lexical import minify_lexical
+from oclminify.minifier import Minifier
+from oclminify.minify import DEFAULT_PREPROCESSOR_COMMAND, _preprocess
+from oclminify.parser import Parser
+
+
+# lexical is --lexical-only, which replaces every other stage.
+STAGES = ["preprocess", "parse", "minify", "generate", "lexical"]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+# Stages faster than this are too noisy to compare against a baseline.
+DEFAULT_MIN_TIME = 0.005
+
+
+def _best_time(func, setup, repeat):
+    # Keep the fastest run. Slower runs are almost always caused by something
+    # else on the machine rather than the code being measured.
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        start = timeit.default_timer()
+        func(state)
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_source(source, parser, preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND, repeat=DEFAULT_REPEAT):
+    preprocessed = _preprocess(source, preprocessor_command)
+
+    def minified_ast():
+        ast = parser.parse(preprocessed)
+        Minifier(True, "").visit(ast)
+        return ast
+
+    stages = {
+        "preprocess": _best_time(lambda state: _preprocess(source, preprocessor_command), lambda: None, repeat),
+        "parse": _best_time(lambda state: parser.parse(preprocessed), lambda: None, repeat),
+        "minify": _best_time(lambda ast: Minifier(True, "").visit(ast), lambda: parser.parse(preprocessed), repeat),
+        "generate": _best_time(lambda ast: Generator().visit(ast), minified_ast, repeat),
+        "lexical": _best_time(lambda state: minify_lexical(source), lambda: None, repeat),
+    }
+    return {
+        "source_size": len(source),
+        "minified_size": len(Generator().visit(minified_ast())),
+        "lexical_size": len(minify_lexical(source)),
+        "stages": stages,
+    }
+
+
+def run(sizes, preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND, repeat=DEFAULT_REPEAT, **corpus_options):
+    # The parser is built once and shared between sizes. Building the parse
+    # tables is a fixed cost that is recorded separately.
+    start = timeit.default_timer()
+    parser = Parser()
+    parser_init = timeit.default_timer() - start
+
+    results = {}
+    for size_name in sizes:
+        options = dict(SIZES[size_name])
+        options.update(corpus_options)
+        source = generate_kernel(**options)
+        results[size_name] = benchmark_source(source, parser, preprocessor_command, repeat)
+        print("%-8s %s" % (size_name, " ".join("%s=%.4fs" % (stage, results[size_name]["stages"][stage]) for stage in STAGES)), file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "corpus_options": corpus_options,
+        "parser_init": parser_init,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, min_time=DEFAULT_MIN_TIME):
+    """Compare two sets of results. Returns a list of
+    (size, stage, baseline_time, current_time) tuples for each stage that
+    regressed beyond the threshold.
+    """
+
+    regressions = []
+    for size_name, result in current["results"].items():
+        if size_name not in baseline["results"]:
+            continue
+        baseline_stages = baseline["results"][size_name]["stages"]
+        for stage, current_time in result["stages"].items():
+            if stage not in baseline_stages:
+                continue
+            baseline_time = baseline_stages[stage]
+            if max(baseline_time, current_time) < min_time:
+                continue
+            if current_time > baseline_time * (1.0 + threshold):
+                regressions.append((size_name, stage, baseline_time, current_time))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the oclminify pipeline.")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES.keys()), default=["small", "medium", "large"], help="Corpus sizes to benchmark.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Number of times each stage is timed. The fastest time is kept.")
+    parser.add_argument("--preprocessor-command", type=str, default=DEFAULT_PREPROCESSOR_COMMAND, help="Command used to preprocess the generated sources.")
+    parser.add_argument("--struct-depth", type=int, default=None, help="Depth of nested structs in the generated sources.")
+    parser.add_argument("--swizzle-density", type=float, default=None, help="Probability, from 0 to 1, that a vector operand uses a swizzle.")
+    parser.add_argument("--expression-depth", type=int, default=None, help="Depth of generated expression trees.")
+    parser.add_argument("--builtin-density", type=float, default=None, help="Probability, from 0 to 1, that an expression is a built-in function call.")
+    parser.add_argument("--output", type=str, default="", help="File path where JSON results should be saved. Omit to write to stdout.")
+    parser.add_argument("--baseline", type=str, default="", help="JSON results to compare against. Exits with a non-zero status on regression.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown relative to the baseline before a stage is reported as a regression. Defaults to %.2f." % DEFAULT_THRESHOLD)
+    parser.add_argument("--save-baseline", type=str, default="", help="Save results as a new baseline at the given file path.")
+    args = parser.parse_args()
+
+    corpus_options = {}
+    for option in ["struct_depth", "swizzle_density", "expression_depth", "builtin_density"]:
+        if getattr(args, option) is not None:
+            corpus_options[option] = getattr(args, option)
+    results = run(args.sizes, args.preprocessor_command, args.repeat, **corpus_options)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(path, "w") as fd:
+                fd.write(text + "\n")
+    if not args.output and not args.save_baseline:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r") as fd:
+            baseline = json.load(fd)
+        regressions = compare(results, baseline, args.threshold)
+        for (size_name, stage, baseline_time, current_time) in regressions:
+            print("REGRESSION: %s %s %.4fs -> %.4fs (+%.0f%%)" % (size_name, stage, baseline_time, current_time, (current_time / baseline_time - 1.0) * 100.0), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against %s." % args.baseline, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
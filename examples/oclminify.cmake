@@ -8,6 +8,8 @@ INCLUDE(CMakeParseArguments)
 #                            [PREPROCESSOR_COMMAND] preprocessor_command
 #                            [OUTPUT_FILE_POSTFIX] output_file_postfix
 #                            [OPTIONS] other_oclminify_options
+#                            [BATCH]
+#                            [WHOLE_PROGRAM]
 #                            )
 #
 # This command adds a build step to a target to minify the specified OpenCL
@@ -17,13 +19,22 @@ INCLUDE(CMakeParseArguments)
 # source file. For example, "MatrixMul.cl" will have a minified output called
 # "MatrixMul.cl.h". The output directory is automatically added as
 # an include directory to the target.
-# 
+#
+# When the generator supports it (Ninja, or any generator with CMake 3.20 or
+# later) and a GCC or Clang compatible compiler is used, oclminify writes a
+# dependency file so sources are minified again when any file they #include
+# changes. With BATCH, every source of the target is minified by a single
+# oclminify process instead of one process per source, which avoids starting
+# Python repeatedly for targets with many sources. WHOLE_PROGRAM implies BATCH
+# and minifies the sources with --whole-program so global names are shared
+# across every source instead of being given a postfix for each.
+#
 # Simple usage:
 # INCLUDE(/path/to/oclminify.cmake) 
 # OCLMINIFY_MINIFY_SOURCES(TARGET example_project SOURCES "kernel1.cl" "kernel2.cl")
 #
 FUNCTION(OCLMINIFY_MINIFY_SOURCES )
-	SET(options)
+	SET(options BATCH WHOLE_PROGRAM)
 	SET(one_value_args TARGET PYTHON_COMMAND PYTHON_MODULE_PATHS PREPROCESSOR_COMMAND OUTPUT_FILE_POSTFIX)
 	SET(multi_value_args SOURCES OPTIONS)
 	cmake_parse_arguments(OCLMINIFY_MINIFY_SOURCES "${options}" "${one_value_args}" "${multi_value_args}" ${ARGN})
@@ -36,7 +47,7 @@ FUNCTION(OCLMINIFY_MINIFY_SOURCES )
 			SET(OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_COMMAND ${CMAKE_C_COMPILER} -E -undef -P -std=c99 -)
 		ENDIF()
 	ENDIF()
-	IF("${OCLMINIFY_MINIFY_SOURCES_OUTPUT_FILE_PREFIX}" STREQUAL "")
+	IF("${OCLMINIFY_MINIFY_SOURCES_OUTPUT_FILE_POSTFIX}" STREQUAL "")
 		SET(OCLMINIFY_MINIFY_SOURCES_OUTPUT_FILE_POSTFIX ".cl.h")
 	ENDIF()
 	IF("${OCLMINIFY_MINIFY_SOURCES_OPTIONS}" STREQUAL "")
@@ -59,26 +70,86 @@ FUNCTION(OCLMINIFY_MINIFY_SOURCES )
 		SET(OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_NO_STDIN "--preprocessor-no-stdin")
 	ENDIF()
 
-	# Setup each source file to be minified. Each is given a unique global
-	# postfix so all kernels can be built and run together without their names
-	# colliding.
+	IF(OCLMINIFY_MINIFY_SOURCES_WHOLE_PROGRAM)
+		SET(OCLMINIFY_MINIFY_SOURCES_BATCH TRUE)
+	ENDIF()
+
+	# Dependency files list the headers each source includes. They require a
+	# preprocessor that understands -MD and -MF, and DEPFILE is only supported
+	# by Makefile generators starting with CMake 3.20.
+	SET(OCLMINIFY_MINIFY_SOURCES_USE_DEPFILE FALSE)
+	IF(NOT "${CMAKE_C_COMPILER_ID}" STREQUAL "MSVC")
+		IF("${CMAKE_GENERATOR}" MATCHES "Ninja" OR NOT CMAKE_VERSION VERSION_LESS 3.20)
+			SET(OCLMINIFY_MINIFY_SOURCES_USE_DEPFILE TRUE)
+		ENDIF()
+	ENDIF()
+
+	# Setup each source file to be minified. Unless minifying the whole
+	# program, each is given a unique global postfix so all kernels can be
+	# built and run together without their names colliding.
 	SET(SOURCE_INDEX 0)
+	SET(INPUT_FILE_LIST "")
 	SET(OUTPUT_FILE_LIST "")
+	SET(OUTPUT_ARGS "")
 	FOREACH(_file ${OCLMINIFY_MINIFY_SOURCES_SOURCES})
 		GET_FILENAME_COMPONENT(_file_name "${_file}" NAME_WE)
-		SET(file_output "${_file_name}${OCLMINIFY_MINIFY_SOURCES_OUTPUT_FILE_POSTFIX}")
-		ADD_CUSTOM_COMMAND(
-			OUTPUT ${file_output}
-			COMMAND ${CMAKE_COMMAND} -E env \"PYTHONPATH=${OCLMINIFY_MINIFY_SOURCES_PYTHON_MODULE_PATHS}\" ${OCLMINIFY_COMMAND} ${OCLMINIFY_MINIFY_SOURCES_OPTIONS} --preprocessor-command="${OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_COMMAND}" ${OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_NO_STDIN} --global-postfix="${SOURCE_INDEX}" --output-file="${CMAKE_CURRENT_BINARY_DIR}/${file_output}" "${CMAKE_CURRENT_SOURCE_DIR}/${_file}" 
-			DEPENDS "${CMAKE_CURRENT_SOURCE_DIR}/${_file}"
-		)
-		LIST(APPEND OUTPUT_FILE_LIST ${file_output})
+		SET(file_input "${CMAKE_CURRENT_SOURCE_DIR}/${_file}")
+		SET(file_output "${CMAKE_CURRENT_BINARY_DIR}/${_file_name}${OCLMINIFY_MINIFY_SOURCES_OUTPUT_FILE_POSTFIX}")
+		IF(OCLMINIFY_MINIFY_SOURCES_BATCH)
+			# Collect arguments for a single command that is added below.
+			IF(NOT OCLMINIFY_MINIFY_SOURCES_WHOLE_PROGRAM)
+				LIST(APPEND OUTPUT_ARGS --global-postfix="${SOURCE_INDEX}")
+			ENDIF()
+			LIST(APPEND OUTPUT_ARGS --output-file="${file_output}")
+		ELSE()
+			SET(DEPFILE_ARGS "")
+			SET(DEPFILE_OPTION "")
+			IF(OCLMINIFY_MINIFY_SOURCES_USE_DEPFILE)
+				SET(DEPFILE_ARGS DEPFILE "${file_output}.d")
+				SET(DEPFILE_OPTION --depfile="${file_output}.d")
+			ENDIF()
+			ADD_CUSTOM_COMMAND(
+				OUTPUT ${file_output}
+				COMMAND ${CMAKE_COMMAND} -E env \"PYTHONPATH=${OCLMINIFY_MINIFY_SOURCES_PYTHON_MODULE_PATHS}\" ${OCLMINIFY_COMMAND} ${OCLMINIFY_MINIFY_SOURCES_OPTIONS} --preprocessor-command="${OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_COMMAND}" ${OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_NO_STDIN} ${DEPFILE_OPTION} --global-postfix="${SOURCE_INDEX}" --output-file="${file_output}" "${file_input}"
+				DEPENDS "${file_input}"
+				WORKING_DIRECTORY "${CMAKE_CURRENT_SOURCE_DIR}"
+				${DEPFILE_ARGS}
+			)
+		ENDIF()
+		LIST(APPEND INPUT_FILE_LIST "${file_input}")
+		LIST(APPEND OUTPUT_FILE_LIST "${file_output}")
 		MATH(EXPR SOURCE_INDEX "${SOURCE_INDEX}+1")
 	ENDFOREACH()
 
-	# Attach minification to target.
-	ADD_CUSTOM_TARGET("oclminify_minify_sources" DEPENDS ${OUTPUT_FILE_LIST})
-	ADD_DEPENDENCIES(${OCLMINIFY_MINIFY_SOURCES_TARGET} "oclminify_minify_sources")
+	# Minify every source with one oclminify process. The output of each
+	# source is still a separate file and a single dependency file covers all
+	# of them.
+	IF(OCLMINIFY_MINIFY_SOURCES_BATCH AND NOT "${OUTPUT_FILE_LIST}" STREQUAL "")
+		IF(OCLMINIFY_MINIFY_SOURCES_WHOLE_PROGRAM)
+			# Kernel names are minified like they are with --global-postfix.
+			LIST(APPEND OUTPUT_ARGS --whole-program --minify-kernel-names)
+		ENDIF()
+		SET(batch_depfile "${CMAKE_CURRENT_BINARY_DIR}/oclminify_${OCLMINIFY_MINIFY_SOURCES_TARGET}.d")
+		SET(DEPFILE_ARGS "")
+		SET(DEPFILE_OPTION "")
+		IF(OCLMINIFY_MINIFY_SOURCES_USE_DEPFILE)
+			SET(DEPFILE_ARGS DEPFILE "${batch_depfile}")
+			SET(DEPFILE_OPTION --depfile="${batch_depfile}")
+		ENDIF()
+		ADD_CUSTOM_COMMAND(
+			OUTPUT ${OUTPUT_FILE_LIST}
+			COMMAND ${CMAKE_COMMAND} -E env \"PYTHONPATH=${OCLMINIFY_MINIFY_SOURCES_PYTHON_MODULE_PATHS}\" ${OCLMINIFY_COMMAND} ${OCLMINIFY_MINIFY_SOURCES_OPTIONS} --preprocessor-command="${OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_COMMAND}" ${OCLMINIFY_MINIFY_SOURCES_PREPROCESSOR_NO_STDIN} ${DEPFILE_OPTION} ${OUTPUT_ARGS} ${INPUT_FILE_LIST}
+			DEPENDS ${INPUT_FILE_LIST}
+			WORKING_DIRECTORY "${CMAKE_CURRENT_SOURCE_DIR}"
+			${DEPFILE_ARGS}
+		)
+	ENDIF()
+
+	# Attach minification to target. The custom target is named after the
+	# target so the function can be used for more than one target.
+	SET(minify_target "oclminify_minify_sources_${OCLMINIFY_MINIFY_SOURCES_TARGET}")
+	ADD_CUSTOM_TARGET(${minify_target} DEPENDS ${OUTPUT_FILE_LIST})
+	ADD_DEPENDENCIES(${OCLMINIFY_MINIFY_SOURCES_TARGET} ${minify_target})
 
 	# Setup include path so #include directives can find the minified output
 	# header files.
@@ -5,127 +5,516 @@ import argparse
 from io import open
 import os
 import sys
-import zlib
-from oclminify.minify import DEFAULT_PREPROCESSOR_COMMAND, _do_minify
-from oclminify.build import try_build
+import timeit
+# Only what's needed to parse arguments is imported up front. Each stage
+# imports its modules when it's used so commands like --help, and build systems
+# running the command many times, don't pay for the whole pipeline.
+from oclminify.minify import DEFAULT_PREPROCESSOR_COMMAND
+from oclminify.watch import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL
 
 
-def main():
+class _Job(object):
+    # One input file and the options that are specific to it.
+    def __init__(self, input_path, output_file, global_postfix):
+        self.input_path = input_path
+        self.output_file = output_file
+        self.global_postfix = global_postfix
+        self.dependencies = []
+
+
+class _Output(object):
+    # One file written for each input from the same minified source. path may
+    # contain {name}, which is replaced by the input's file name without its
+    # extension. A path of None writes to the job's --output-file instead.
+    KINDS = {
+        "minified": ("compress", "strip-zlib-header"),
+        "header": ("compress", "strip-zlib-header", "function-args", "binaries"),
+        "manifest": ("header", ),
+    }
+
+    def __init__(self, kind, path=None, modifiers=()):
+        self.kind = kind
+        self.path = path
+        self.compress = "compress" in modifiers or "strip-zlib-header" in modifiers
+        self.strip_zlib_header = "strip-zlib-header" in modifiers
+        self.function_args = "function-args" in modifiers
+        self.binaries = "binaries" in modifiers
+        self.header = "header" in modifiers
+
+    @classmethod
+    def parse(cls, text):
+        # KIND[+MODIFIER...]=PATH
+        (spec, separator, path) = text.partition("=")
+        if not separator or not path:
+            raise ValueError("--emit must be in the form KIND[+MODIFIER...]=PATH: %s" % text)
+        modifiers = spec.split("+")
+        kind = modifiers.pop(0)
+        if kind not in cls.KINDS:
+            raise ValueError("Unknown --emit kind '%s'. Must be one of: %s." % (kind, ", ".join(sorted(cls.KINDS))))
+        for modifier in modifiers:
+            if modifier not in cls.KINDS[kind]:
+                raise ValueError("Unknown --emit modifier '%s' for %s." % (modifier, kind))
+        return cls(kind, path, modifiers)
+
+    def output_path(self, job):
+        if self.path is None:
+            return job.output_file
+        name = "stdin" if job.input_path == "-" else os.path.splitext(os.path.basename(job.input_path))[0]
+        return self.path.replace("{name}", name)
+
+
+def _print_error(error, message_prefix=""):
+    from oclminify.errors import PreprocessError
+    if isinstance(error, PreprocessError) and error.stderr:
+        print(error.stderr, file=sys.stderr)
+    print(message_prefix + str(error), file=sys.stderr)
+
+
+def _parse_args(argv=None):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                      description="Version 0.8.0\nMinify OpenCL source files.",
                                      epilog="OpenCL is a trademark of Apple Inc., used under license by Khronos.\nCopyright (c) 2016 StarByte Software, Inc. All rights reserved.")
     parser.add_argument("--preprocessor-command", type=str, default=DEFAULT_PREPROCESSOR_COMMAND, help="Command to preprocess input source before minification. Defaults to \"%s\"" % DEFAULT_PREPROCESSOR_COMMAND)
     parser.add_argument("--preprocessor-no-stdin", action="store_true", default=False, help="Pass input to preprocessor using a temporary file instead of stdin.")
     parser.add_argument("--no-preprocess", action="store_true", default=False, help="Skip preprocessing step. Implies --no-minify.")
+    parser.add_argument("--lexical-only", action="store_true", default=False, help="Only remove comments and unnecessary whitespace without preprocessing or parsing the input. Preprocessor directives are kept and nothing is renamed. Many times faster on large inputs. Can't be used with --no-preprocess, --no-minify, --minify-kernel-names, --global-postfix, --fold-float-constants, --remove-dead-code, --whole-program, or --bundle.")
     parser.add_argument("--no-minify", action="store_true", default=False, help="Skip minification step. Useful when debugging.")
     parser.add_argument("--compress", action="store_true", default=False, help="Compress output using zlib.")
     parser.add_argument("--strip-zlib-header", action="store_true", default=False, help="Strips the two byte zlib header from the compressed output when --compress is used.")
     parser.add_argument("--header", action="store_true", default=False, help="Embed output in a C header file.")
     parser.add_argument("--header-function-args", action="store_true", default=False, help="Include function argument mappings in C header file.")
+    parser.add_argument("--header-binaries", action="store_true", default=False, help="Build the output for each device selected by --try-build-device and embed the program binaries in the C header alongside the source. Requires pyopencl. Implies --header.")
     parser.add_argument("--minify-kernel-names", action="store_true", default=False, help="Replace kernel function names with shorter names.")
-    parser.add_argument("--global-postfix", type=str, default="", help="Postfix appended to each symbol name in the global scope. Used for preventing name collisions when minifying multiple source files separately. Implies --minify-kernel-names.")
+    parser.add_argument("--fold-float-constants", action="store_true", default=False, help="Replace additions, subtractions, and multiplications of float literals with their result. The result is rounded exactly like the OpenCL compiler would, but may differ when building with options that relax floating point precision such as -cl-fast-relaxed-math. Integer constant expressions are always folded.")
+    parser.add_argument("--remove-dead-code", action="store_true", default=False, help="Remove local variables that are never read, and assignments to local variables that are always overwritten before being read. Pointers, volatile and __local variables, variables whose address is taken, and anything with side effects like a function call are kept.")
+    parser.add_argument("--global-postfix", type=str, action="append", default=[], help="Postfix appended to each symbol name in the global scope. Used for preventing name collisions when minifying multiple source files separately. Implies --minify-kernel-names. When there is more than one input, specify once for each input in the same order.")
+    parser.add_argument("--whole-program", action="store_true", default=False, help="Minify every input together as one program that is loaded into the same context. Global names are allocated once across all inputs so they can't collide, without the bytes added by --global-postfix. A global symbol declared in several inputs keeps the same name in each. One output is still written for each input.")
+    parser.add_argument("--bundle", action="store_true", default=False, help="Combine every input into a single output, keeping only one copy of declarations repeated by several inputs, like everything from a header each of them includes. Functions that are identical apart from their names are merged. Implies --whole-program. --output-file is specified at most once.")
     parser.add_argument("--try-build", action="store_true", default=False, help="Try to build the input using an OpenCL compiler before minifying. The compiled output is discarded. Requires pyopencl.")
-    parser.add_argument("--output-file", type=str, default="", help="File path where output should be saved. Omit to write to stdout.")
-    parser.add_argument("input", help="File path to OpenCL file that should be minified. A \"-\" indicates that input should be read from stdin.")
-    args = parser.parse_args()
+    parser.add_argument("--try-build-device", type=str, action="append", default=[], help="Device used by --try-build in the form PLATFORM[:DEVICE] where each is an index. Can be specified more than once. Builds on every device of every platform when omitted.")
+    parser.add_argument("--no-build-cache", action="store_true", default=False, help="Always build with the OpenCL compiler when using --try-build instead of reusing cached results for unchanged sources. The cache is stored in $OCLMINIFY_BUILD_CACHE_DIR or ~/.cache/oclminify/build.")
+    parser.add_argument("--verbose", action="store_true", default=False, help="Print every diagnostic message as it occurs instead of a deduplicated summary at the end.")
+    parser.add_argument("--profile", action="store_true", default=False, help="Print the number of calls and time spent in each stage, visitor method, and helper function to stderr.")
+    parser.add_argument("--profile-output", type=str, default="", help="File path where profiling results should be saved. Saved in pstats format if the path ends with .prof or .pstats, otherwise as collapsed stacks for flame graph tools. Implies --profile.")
+    parser.add_argument("--watch", action="store_true", default=False, help="Keep running and minify each input again whenever it or a file it includes changes. Requires --output-file or --emit and a GCC or Clang compatible preprocessor to find included files.")
+    parser.add_argument("--watch-interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between checks for changed files when using --watch. Defaults to %s." % DEFAULT_INTERVAL)
+    parser.add_argument("--watch-debounce", type=float, default=DEFAULT_DEBOUNCE, help="Seconds files must stop changing before minifying again when using --watch. Defaults to %s." % DEFAULT_DEBOUNCE)
+    parser.add_argument("--depfile", type=str, default="", help="File path where a Makefile style dependency file listing every file read while minifying should be saved. Used by build systems such as Ninja and CMake to know when outputs must be regenerated. Requires --output-file or --emit and a GCC or Clang compatible preprocessor.")
+    parser.add_argument("--output-file", type=str, action="append", default=[], help="File path where output should be saved. Omit to write to stdout. When there is more than one input, specify once for each input in the same order.")
+    parser.add_argument("--emit", type=str, action="append", default=[], metavar="KIND[+MODIFIER...]=PATH", help="Write an output of the given kind to PATH. Can be specified more than once to write several outputs from a single run. KIND is minified for the minified source, header for a C header, or manifest for a JSON description of every kernel and its arguments, including their address and access qualifiers, types, and sizes. Modifiers are compress and strip-zlib-header for minified and header, function-args and binaries for header, which work like the options of the same name, and header for manifest to write it as a C header. {name} in PATH is replaced by the input's file name without its extension and is required when there is more than one input. Can't be used with --output-file, --compress, --strip-zlib-header, or the --header options.")
+    parser.add_argument("inputs", metavar="input", nargs="+", help="File path to OpenCL file that should be minified. A \"-\" indicates that input should be read from stdin.")
+    args = parser.parse_args(argv)
+    if args.emit and (args.output_file or args.compress or args.strip_zlib_header or args.header or args.header_function_args or args.header_binaries):
+        parser.error("--emit can't be used with --output-file, --compress, --strip-zlib-header, or the --header options.")
+    if args.header_binaries:
+        args.header = True
+    if args.bundle:
+        args.whole_program = True
+
+    # Every output is described the same way whether it came from --emit or
+    # the older single output options.
+    try:
+        args.outputs = [_Output.parse(text) for text in args.emit]
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.outputs:
+        modifiers = [name for (name, enabled) in [("compress", args.compress),
+                                                  ("strip-zlib-header", args.compress and args.strip_zlib_header),
+                                                  ("function-args", args.header_function_args),
+                                                  ("binaries", args.header_binaries)] if enabled]
+        args.outputs = [_Output("header" if args.header else "minified", None, modifiers)]
+    elif len(args.inputs) > 1 and not args.bundle and any("{name}" not in output.path for output in args.outputs):
+        parser.error("--emit paths must contain {name} when there is more than one input.")
 
+    # Per input options are matched to inputs by position.
+    for (name, values) in [("--output-file", [] if args.bundle else args.output_file), ("--global-postfix", args.global_postfix)]:
+        if len(values) > 0 and len(values) != len(args.inputs):
+            parser.error("%s must be specified once for each input." % name)
+    if args.bundle and len(args.output_file) > 1:
+        parser.error("--output-file can only be specified once with --bundle.")
+    if args.bundle and (args.no_minify or args.no_preprocess):
+        parser.error("--bundle can't be used with --no-minify or --no-preprocess.")
+    if args.lexical_only and (args.no_preprocess or args.no_minify or args.minify_kernel_names or args.global_postfix or args.fold_float_constants or args.remove_dead_code or args.whole_program):
+        parser.error("--lexical-only can't be used with --no-preprocess, --no-minify, --minify-kernel-names, --global-postfix, --fold-float-constants, --remove-dead-code, --whole-program, or --bundle.")
+    if args.whole_program and len(args.global_postfix) > 0:
+        parser.error("--whole-program and --global-postfix can't be used together.")
+    if args.watch and ((len(args.output_file) == 0 and not args.emit) or "-" in args.inputs):
+        parser.error("--watch requires --output-file or --emit and can't read from stdin.")
+    if args.depfile and len(args.output_file) == 0 and not args.emit:
+        parser.error("--depfile requires --output-file or --emit.")
+    return args
+
+
+def _read_input(path):
     # Read input from the specified file. If the specified file is "-", just
     # read from stdin so text can be piped in from a shell or whatever.
-    if args.input == "-":
+    if path == "-":
         data = ""
         while True:
             c = sys.stdin.read(1)
             if len(c) == 0:
                 break
             data += c
-    else:
-        # Read entire file into memory.
-        fd = open(args.input, "rb")
-        if not fd:
-            print("Could not open input file.", file=sys.stderr)
-            sys.exit(-1)
-        data = fd.read()
-        fd.close()
+        return data
+
+    # Read entire file into memory.
+    try:
+        with open(path, "rb") as fd:
+            return fd.read()
+    except (IOError, OSError):
+        print("Could not open input file.", file=sys.stderr)
+        return None
+
+
+def _write_output(path, data):
+    # Save output to file if run with --output-file, otherwise just print to
+    # stdout so it can be processed further in a shell or whatever.
+    if not path:
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        print(data)
+        return True
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8", "ignore")
+    try:
+        with open(path, "wb") as fd:
+            fd.write(data)
+    except (IOError, OSError):
+        print("Could not open output file", file=sys.stderr)
+        return False
+    return True
+
+
+def _escape_make_path(path):
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def _write_depfile(path, jobs, outputs, bundle=False):
+    # A single rule lists every output as a target so one depfile covers a
+    # batch of inputs minified by the same command. Bundled outputs are named
+    # after the first input.
+    targets = []
+    for job in jobs[:1] if bundle else jobs:
+        for output in outputs:
+            if output.output_path(job) not in targets:
+                targets.append(output.output_path(job))
+    targets = " ".join(_escape_make_path(target) for target in targets)
+    dependencies = []
+    for job in jobs:
+        for dependency in [os.path.abspath(job.input_path)] + job.dependencies:
+            if dependency not in dependencies:
+                dependencies.append(dependency)
+    text = "%s:" % targets
+    for dependency in dependencies:
+        text += " \\\n  %s" % _escape_make_path(dependency)
+    try:
+        with open(path, "wb") as fd:
+            fd.write((text + "\n").encode("utf-8"))
+    except (IOError, OSError):
+        print("Could not open dependency file", file=sys.stderr)
+        return False
+    return True
+
+
+def _create_build_checker(args):
+    if not args.try_build and not any(output.binaries for output in args.outputs):
+        return None
+    from oclminify.build import BuildChecker, _parse_device_selection
+    from oclminify.build_cache import BuildCache
+    try:
+        devices = [_parse_device_selection(device) for device in args.try_build_device] or None
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(-1)
+    cache = None if args.no_build_cache else BuildCache()
+    return BuildChecker(devices, cache)
+
+
+def _minify_options(args, global_postfix="", parse_cache=None):
+    return dict(parse_cache=parse_cache,
+                preprocessor_command=args.preprocessor_command,
+                preprocessor_no_stdin=args.preprocessor_no_stdin,
+                minify=not args.no_minify,
+                minify_kernel_names=(args.minify_kernel_names or len(global_postfix) > 0) and not args.no_minify,
+                fold_float_constants=args.fold_float_constants,
+                remove_dead_code=args.remove_dead_code,
+                dependencies=args.watch or len(args.depfile) > 0)
+
+
+def _print_diagnostics(args, diagnostics, message_prefix=""):
+    # Print a single summary of symbols that could not be resolved rather
+    # than a message for every occurrence.
+    if not args.verbose and len(diagnostics) > 0:
+        print(message_prefix + diagnostics.summary(), file=sys.stderr)
+
+
+def _keep_dependencies(jobs, error):
+    # Files read before minifying failed are watched too, so fixing an error
+    # in an included file minifies the input again. Files from earlier runs
+    # are kept in case the preprocessor stopped before listing them.
+    for job in jobs:
+        for dependency in getattr(error, "dependencies", None) or []:
+            if dependency not in job.dependencies:
+                job.dependencies = job.dependencies + [dependency]
+
+
+def _process(args, job, build_checker, profiler, message_prefix="", parse_cache=None):
+    """Minify a single input and write the output. Problems are printed to
+    stderr and False is returned so other inputs can still be processed.
+    """
+
+    data = _read_input(job.input_path)
+    if data is None:
+        return False
 
     if args.try_build:
-        if not try_build(data):
-            sys.exit(-1)
+        if not build_checker.try_build(data):
+            return False
 
     # Perform preprocessing and minification.
-    original_size = len(data)
-    original_data = data
-    minifier, data = _do_minify(data,
-                                preprocessor_command=args.preprocessor_command,
-                                preprocessor_no_stdin=args.preprocessor_no_stdin,
-                                minify=not args.no_minify,
-                                minify_kernel_names=(args.minify_kernel_names or len(args.global_postfix) > 0) and not args.no_minify,
-                                global_postfix=args.global_postfix)
+    from oclminify.diagnostics import Diagnostics
+    from oclminify.errors import MinifyError
+    from oclminify.minify import minify_result
+    diagnostics = Diagnostics(verbose=args.verbose)
+    try:
+        if args.lexical_only:
+            from oclminify.lexical import minify_lexical_result
+            result = minify_lexical_result(data)
+        else:
+            result = minify_result(data,
+                                   global_postfix=job.global_postfix,
+                                   profiler=profiler,
+                                   diagnostics=diagnostics,
+                                   **_minify_options(args, job.global_postfix, parse_cache))
+    except MinifyError as e:
+        _keep_dependencies([job], e)
+        _print_error(e, message_prefix)
+        return False
+    _print_diagnostics(args, diagnostics, message_prefix)
+    return _write_result(args, job, result, build_checker, message_prefix, data)
+
+
+def _write_result(args, job, result, build_checker, message_prefix="", original_data=None):
+    # Everything after minification: building binaries, compression, the
+    # header, and writing each output.
+    job.dependencies = result.dependencies
+    data = result.data
     if args.no_preprocess:
         data = original_data
-    minified_size = len(data)
-
-    # Perform zlib compression.
     if not isinstance(data, bytes):
         data = data.encode("utf-8", "ignore")
-    if args.compress:
+    original_size = result.original_size
+    minified_size = len(data)
+
+    # Build program binaries from the final source so they can be embedded in
+    # the header.
+    binaries = None
+    if any(output.binaries for output in args.outputs):
+        binaries = build_checker.build(data, binaries=True)
+        if not build_checker.print_results(binaries):
+            return False
+
+    # Perform zlib compression. It's done once and shared by every output
+    # that's compressed.
+    compressed_data = None
+    if any(output.compress for output in args.outputs):
+        import zlib
         compressed_data = zlib.compress(data, 9)
-        if args.strip_zlib_header:
+
+    def encode(output):
+        if not output.compress:
+            return data
+        if output.strip_zlib_header:
             # Strip header: 0x78 0xDA
-            data = compressed_data[2:]
-        else:
-            data = compressed_data
+            return compressed_data[2:]
+        return compressed_data
 
     # Print sizes of output after each stage. This is a minifier, might as well
     # see how well we did.
-    compressed_size = len(data)
     result_message = "Original Size: %i, Minified Size: %i" % (original_size, minified_size)
-    if args.compress:
-        result_message += ", Compressed Size: %i" % compressed_size
-    print(result_message, file=sys.stderr)
-
-    # Transform minified output into a C header file if run with --header.
-    if args.header:
-        guard_name = os.path.split(args.input)[-1].upper().replace(".", "_") + "_DATA_H"
-        var_base_name = os.path.split(args.input)[-1].lower()
-        var_base_name = var_base_name[:var_base_name.find(".")].capitalize()
-        header_text = "#ifndef %s\n#define %s\n\n" % (guard_name, guard_name)
-        header_text += "static const size_t %s_SIZE = %i;\n" % (var_base_name.upper(), len(data))
-        header_text += "static const unsigned char %s_DATA[] = {" % var_base_name.upper()
-        for (i, byte) in enumerate(data):
-            if isinstance(byte, str):
-                byte = ord(byte)
-            header_text += str(hex(byte))
-            if i != (len(data) - 1):
-                header_text += ","
-        header_text += "};\n\n"
-        for (old_name, func) in minifier.functions.items():
-            if old_name not in minifier.kernel_functions:
-                continue  # Not a kernel, no need to make available.
-            header_text += "#define %s_FUNCTION_%s \"%s\"\n" % (var_base_name.upper(), old_name.upper(), func.name)
-            if args.header_function_args:
-                for (old_arg, new_arg) in minifier.functions_args[old_name].items():
-                    header_text += "#define %s_FUNCTION_%s_ARG_%s = \"%s\"\n" % (var_base_name.upper(), old_name.upper(), old_arg.upper(), new_arg)
-                header_text += "\n"
-        if not args.header_function_args:
-            header_text += "\n"
-        header_text += "#endif"
-        data = header_text
+    compressed_sizes = []
+    for output in args.outputs:
+        if output.compress and len(encode(output)) not in compressed_sizes:
+            compressed_sizes.append(len(encode(output)))
+    if compressed_sizes:
+        result_message += ", Compressed Size: %s" % ", ".join("%i" % size for size in compressed_sizes)
+    print(message_prefix + result_message, file=sys.stderr)
 
-    # Save output to file if run with --output-file, otherwise just print to
-    # stdout so it can be processed further in a shell or whatever.
-    if args.output_file == "":
-        if isinstance(data, bytes):
-            data = data.decode("utf-8")
-        print(data)
+    success = True
+    for output in args.outputs:
+        if output.kind == "manifest":
+            from oclminify.manifest import generate_manifest_header, generate_manifest_json
+            if output.header:
+                output_data = generate_manifest_header(job.input_path, result)
+            else:
+                output_data = generate_manifest_json(job.input_path, result)
+        elif output.kind == "header":
+            # Transform minified output into a C header file.
+            from oclminify.errors import MinifyError
+            from oclminify.header import generate_header
+            try:
+                output_data = generate_header(job.input_path, encode(output), result, output.function_args, binaries if output.binaries else None)
+            except MinifyError as e:
+                _print_error(e, message_prefix)
+                success = False
+                continue
+        else:
+            output_data = encode(output)
+        success = _write_output(output.output_path(job), output_data) and success
+    return success
+
+
+def _process_whole_program(args, jobs, build_checker, profiler, parse_cache=None):
+    """Minify every input together with one table of global names. The names
+    depend on every input, so nothing is written when any input fails.
+    Returns the jobs that failed.
+    """
+
+    sources = []
+    for job in jobs:
+        data = _read_input(job.input_path)
+        if data is None or (args.try_build and not build_checker.try_build(data)):
+            return jobs
+        sources.append(data)
+
+    from oclminify.diagnostics import Diagnostics
+    from oclminify.errors import MinifyError
+    from oclminify.minify import minify_whole_program
+    diagnostics = Diagnostics(verbose=args.verbose)
+    try:
+        results = minify_whole_program(sources, profiler=profiler, diagnostics=diagnostics, **_minify_options(args, parse_cache=parse_cache))
+    except MinifyError as e:
+        _keep_dependencies([jobs[e.source_index]], e)
+        _print_error(e, "%s: " % jobs[e.source_index].input_path)
+        return jobs
+    _print_diagnostics(args, diagnostics)
+
+    failed = []
+    for (job, data, result) in zip(jobs, sources, results):
+        if not _write_result(args, job, result, build_checker, "%s: " % job.input_path, data):
+            failed.append(job)
+    return failed
+
+
+def _process_bundle(args, jobs, build_checker, profiler, parse_cache=None):
+    """Minify every input into a single output with repeated declarations
+    removed. Returns the jobs that failed, which is all of them when anything
+    fails since they share one output.
+    """
+
+    sources = []
+    for job in jobs:
+        data = _read_input(job.input_path)
+        if data is None or (args.try_build and not build_checker.try_build(data)):
+            return jobs
+        sources.append(data)
+
+    from oclminify.diagnostics import Diagnostics
+    from oclminify.errors import MinifyError
+    from oclminify.minify import minify_bundle
+    diagnostics = Diagnostics(verbose=args.verbose)
+    options = _minify_options(args, parse_cache=parse_cache)
+    del options["minify"]  # Always minified.
+    try:
+        result = minify_bundle(sources, profiler=profiler, diagnostics=diagnostics, **options)
+    except MinifyError as e:
+        _keep_dependencies(jobs, e)
+        prefix = "%s: " % jobs[e.source_index].input_path if hasattr(e, "source_index") else ""
+        _print_error(e, prefix)
+        return jobs
+    _print_diagnostics(args, diagnostics)
+
+    # The header is named after the output, or the first input when writing
+    # to stdout.
+    output_file = jobs[0].output_file
+    bundle_job = _Job(output_file or jobs[0].input_path, output_file, "")
+    if not _write_result(args, bundle_job, result, build_checker):
+        return jobs
+    for job in jobs:
+        job.dependencies = result.dependencies
+    return []
+
+
+def _process_all(args, jobs, build_checker, parse_cache=None):
+    # Returns the jobs that failed.
+    profiler = None
+    if args.profile or args.profile_output:
+        from oclminify.profiler import Profiler
+        profiler = Profiler()
+
+    failed = []
+    if args.whole_program:
+        start = timeit.default_timer()
+        if args.bundle:
+            failed = _process_bundle(args, jobs, build_checker, profiler, parse_cache)
+        else:
+            failed = _process_whole_program(args, jobs, build_checker, profiler, parse_cache)
+        if args.watch:
+            print("Finished in %.3fs" % (timeit.default_timer() - start), file=sys.stderr)
     else:
-        fd = open(args.output_file, "wb")
-        if not fd:
-            print("Could not open output file", file=sys.stderr)
-            sys.exit(-1)
-        if not isinstance(data, bytes):
-            data = data.encode("utf-8", "ignore")
-        fd.write(data)
-        fd.close()
+        for job in jobs:
+            start = timeit.default_timer()
+            prefix = "%s: " % job.input_path if len(jobs) > 1 or args.watch else ""
+            if not _process(args, job, build_checker, profiler, prefix, parse_cache):
+                failed.append(job)
+            if args.watch:
+                print("%sFinished in %.3fs" % (prefix, timeit.default_timer() - start), file=sys.stderr)
+
+    if profiler:
+        print(profiler.report(), file=sys.stderr)
+        if args.profile_output:
+            profiler.write(args.profile_output)
+    return failed
+
+
+def _watch(args, jobs, build_checker):
+    # The parser built for the first run stays warm in this thread, so only
+    # the inputs affected by a change are minified again, without the start
+    # up cost of a new process. Parsed sources are cached too, so inputs whose
+    # preprocessed source didn't change, like after editing a comment or
+    # when every input of a whole program is minified again, skip the parser.
+    from oclminify.parse_cache import ParseCache
+    from oclminify.watch import Watcher
+    watcher = Watcher(args.watch_interval, args.watch_debounce)
+    parse_cache = ParseCache()
+
+    def watched_paths(job):
+        return [os.path.abspath(job.input_path)] + job.dependencies
+
+    # Record file states before each run so changes made while minifying are
+    # picked up by the next poll.
+    watcher.update(sum([watched_paths(job) for job in jobs], []))
+    _process_all(args, jobs, build_checker, parse_cache)
+    print("Watching for changes. Press Ctrl+C to stop.", file=sys.stderr)
+    try:
+        while True:
+            changed = watcher.wait(sum([watched_paths(job) for job in jobs], []))
+            affected = [job for job in jobs if changed.intersection(watched_paths(job))]
+            if args.whole_program:
+                # Global names are shared by every input, so they're all
+                # minified again.
+                affected = jobs
+            _process_all(args, affected, build_checker, parse_cache)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    jobs = []
+    for (index, input_path) in enumerate(args.inputs):
+        # Every input shares the single output when bundling.
+        output_file = args.output_file[0 if args.bundle else index] if args.output_file else ""
+        global_postfix = args.global_postfix[index] if args.global_postfix else ""
+        jobs.append(_Job(input_path, output_file, global_postfix))
+
+    build_checker = _create_build_checker(args)
+    if args.watch:
+        _watch(args, jobs, build_checker)
+    elif _process_all(args, jobs, build_checker):
+        sys.exit(-1)
+    elif args.depfile and not _write_depfile(args.depfile, jobs, args.outputs, args.bundle):
+        sys.exit(-1)
 
 if __name__ == "__main__":
     main()
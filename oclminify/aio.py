@@ -0,0 +1,95 @@
+"""Minify from asyncio applications without blocking the event loop. The
+preprocessor runs as an asyncio subprocess and parsing, minifying, and
+generating the output run in an executor. Requires Python 3.5 or newer.
+"""
+import asyncio
+import functools
+import os
+import timeit
+from oclminify.minify import DEFAULT_PREPROCESSOR_COMMAND, DEFAULT_PREPROCESSOR_NO_STDIN, DEFAULT_MINIFY, DEFAULT_MINIFY_KERNEL_NAMES, DEFAULT_GLOBAL_POSTFIX, DEFAULT_FOLD_FLOAT_CONSTANTS, DEFAULT_REMOVE_DEAD_CODE
+from oclminify.minify import _minify_preprocessed, _preprocessor_args, _preprocessor_output
+from oclminify.result import MinifyResult
+
+# get_running_loop() is only available on Python 3.7 and newer, where calling
+# get_event_loop() from a coroutine is deprecated.
+_get_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+async def _preprocess_async(data, preprocessor_command, preprocessor_no_stdin):
+    (data, args, temp_input_file) = _preprocessor_args(data, preprocessor_command, preprocessor_no_stdin)
+    try:
+        p = await asyncio.create_subprocess_exec(*args,
+                                                 stdin=asyncio.subprocess.PIPE,
+                                                 stdout=asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.PIPE)
+        data, err = await p.communicate(data)
+    finally:
+        if temp_input_file:
+            os.remove(temp_input_file)
+    return _preprocessor_output(data, err, p.returncode)
+
+
+def _minify_worker(data, original_size, timings, minify, minify_kernel_names, global_postfix, fold_float_constants, remove_dead_code):
+    # A MinifyResult is returned instead of the Minifier because it is much
+    # cheaper to send back from a process pool.
+    (minifier, output) = _minify_preprocessed(data, minify, minify_kernel_names, global_postfix, fold_float_constants, remove_dead_code, timings=timings)
+    return MinifyResult.from_minifier(minifier, output, original_size, timings)
+
+
+async def minify_result_async(data,
+                              preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
+                              preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
+                              minify=DEFAULT_MINIFY,
+                              minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
+                              global_postfix=DEFAULT_GLOBAL_POSTFIX,
+                              fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+                              remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+                              executor=None):
+    """Coroutine version of oclminify.minify.minify_result(). Parsing,
+    minifying, and generating run in executor, which can be a thread or
+    process pool from concurrent.futures. The event loop's default executor is
+    used when None.
+
+    Raises the same oclminify.errors exceptions as minify().
+    """
+
+    start = timeit.default_timer()
+    preprocessed = await _preprocess_async(data, preprocessor_command, preprocessor_no_stdin)
+    timings = {"preprocess": timeit.default_timer() - start}
+    loop = _get_running_loop()
+    worker = functools.partial(_minify_worker, preprocessed, len(data), timings, minify, minify_kernel_names, global_postfix, fold_float_constants, remove_dead_code)
+    return await loop.run_in_executor(executor, worker)
+
+
+async def minify_async(data, **kwargs):
+    """Coroutine version of oclminify.minify.minify(). Takes the same
+    arguments as minify_result_async().
+    """
+
+    result = await minify_result_async(data, **kwargs)
+    return result.text()
+
+
+class AsyncMinifier(object):
+    """Run minify_async() with at most max_concurrency sources being minified
+    at once, including their preprocessor processes. Useful for services that
+    may receive many requests at the same time. A max_concurrency of None
+    means no limit.
+    """
+
+    def __init__(self, executor=None, max_concurrency=None):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def minify(self, data, **kwargs):
+        kwargs.setdefault("executor", self.executor)
+        if self.max_concurrency is None:
+            return await minify_async(data, **kwargs)
+
+        # The semaphore is created on first use so it belongs to the running
+        # event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await minify_async(data, **kwargs)
@@ -2,48 +2,208 @@ from __future__ import absolute_import
 from __future__ import print_function
 import os
 import sys
+import threading
+import timeit
 
 
-def try_build(data):
-    """Try to build OpenCL script to test for errors instead of having to wait
-    until after the minified version is used during run time which is much
-    harder to debug.
+class BuildResult(object):
+    def __init__(self, platform_name, device_name, driver_version, success, log, build_time=0.0, cached=False, binary=None):
+        self.platform_name = platform_name
+        self.device_name = device_name
+        self.driver_version = driver_version
+        self.success = success
+        self.log = log
+        self.build_time = build_time
+        self.cached = cached
+        self.binary = binary
+
+    def __repr__(self):
+        return "BuildResult(%r, %r, success=%r)" % (self.platform_name, self.device_name, self.success)
+
+
+class BuildChecker(object):
+    """Try to build OpenCL programs on one or more devices to test for errors
+    instead of having to wait until after the minified version is used during
+    run time which is much harder to debug.
+
+    A context is created once for each selected device and reused for every
+    build, so a single BuildChecker should be shared by everything that needs
+    to check builds in the same process. Builds for different devices run
+    concurrently. When a BuildCache is provided, results are looked up there
+    first and the driver is only used for sources it hasn't seen.
     """
 
-    if isinstance(data, str) and sys.version_info.major >= 3:
-        data = data.encode("utf-8", "ignore")
+    def __init__(self, devices=None, cache=None):
+        # Devices are selected using a list of (platform index, device index)
+        # tuples. A device index of None selects every device on the platform.
+        # None selects every device on every platform.
+        self.device_selection = devices
+        self.cache = cache
+        self._targets = None
+        self._pool = None
+        self._lock = threading.Lock()
 
-    try:
+    def _create_targets(self):
         # PyOpenCL is required.
         import pyopencl as cl
-        import pyopencl.cffi_cl as _cl
 
-        # Use the default context and the first device because it's
-        # convenient. We could add a command line flag later if necessary.
-        ctx = cl.create_some_context(interactive=False)
-        device = ctx.devices[0]
+        # Make sure the driver actually compiles each program so the build log
+        # is always available instead of PyOpenCL's cached binaries being
+        # used.
+        os.environ["PYOPENCL_NO_CACHE"] = "true"
+
+        targets = []
+        platforms = cl.get_platforms()
+        selection = self.device_selection
+        if selection is None:
+            selection = [(platform_index, None) for platform_index in range(len(platforms))]
+        for (platform_index, device_index) in selection:
+            devices = platforms[platform_index].get_devices()
+            if device_index is not None:
+                devices = [devices[device_index], ]
+            for device in devices:
+                targets.append((cl.Context(devices=[device, ]), device, _device_identity(device)))
+        return targets
 
-        # Just build and check for errors. Some drivers output whitespace in
-        # the log, so  we strip for consistency to prevent printing a blank
-        # line to stdout.
-        prg = None
+    def _get_targets(self):
+        with self._lock:
+            if self._targets is None:
+                try:
+                    self._targets = self._create_targets()
+                    if len(self._targets) == 0:
+                        print("No OpenCL devices detected. Skipping test program build.", file=sys.stderr)
+                    else:
+                        from multiprocessing.pool import ThreadPool
+                        self._pool = ThreadPool(len(self._targets))
+                except ImportError:
+                    print("PyOpenCL not found. Skipping test program build.", file=sys.stderr)
+                    self._targets = []
+                except IndexError:
+                    print("Selected OpenCL device does not exist. Skipping test program build.", file=sys.stderr)
+                    self._targets = []
+            return self._targets
+
+    def _build_on_device(self, data, options, binaries, context, device, identity):
+        import pyopencl as cl
         try:
-            os.environ["PYOPENCL_NO_CACHE"] = "true"
-            prg = cl.Program(ctx, data).build(devices=[device, ])
-        except _cl.RuntimeError as e:
-            # Print error log but strip off the parts PyOpenCL adds since we
-            # don't need them.
-            print("\n".join(e.what.split("\n")[0:-2]), file=sys.stderr)
-            print("Could not build program.", file=sys.stderr)
-            return False
+            import pyopencl.cffi_cl as _cl
+        except ImportError:
+            _cl = cl
+
+        (platform_name, _, device_name, _, driver_version) = identity
+        # Binaries are not cached so they are always built by the driver.
+        cache_key = None
+        if self.cache is not None and not binaries:
+            cache_key = self.cache.key(data, options, identity)
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                return BuildResult(platform_name, device_name, driver_version, entry[0], entry[1], cached=True)
+
+        start = timeit.default_timer()
+        prg = cl.Program(context, data)
+        try:
+            prg.build(options=options, devices=[device, ])
+        except _cl.RuntimeError:
+            # The error PyOpenCL raises repeats the build log with extra
+            # details we don't need. The log is read from the program below
+            # instead.
+            pass
+        build_time = timeit.default_timer() - start
+
+        # Some drivers output whitespace in the log, so we strip for
+        # consistency to prevent printing a blank line to stdout.
         log = prg.get_build_info(device, cl.program_build_info.LOG).strip()
-        if len(log) > 0:
-            print(log, file=sys.stderr)
-        if prg.get_build_info(device, cl.program_build_info.STATUS) != 0:
-            print("Error while building program.", file=sys.stderr)
-            return False
-    except ImportError:
-        print("PyOpenCL not found. Skipping test program build.", file=sys.stderr)
-    except IndexError:
-        print("No OpenCL devices detected. Skipping test program build.", file=sys.stderr)
-    return True
+        success = prg.get_build_info(device, cl.program_build_info.STATUS) == 0
+        if cache_key is not None:
+            self.cache.put(cache_key, success, log)
+        binary = None
+        if binaries and success:
+            binary = bytes(prg.get_info(cl.program_info.BINARIES)[0])
+        return BuildResult(platform_name, device_name, driver_version, success, log, build_time, binary=binary)
+
+    def build(self, data, options="", binaries=False):
+        """Build data on every selected device. Returns a list of BuildResult,
+        one for each device, which is empty if no devices are available. When
+        binaries is True, each successful result includes the program binary
+        for its device.
+        """
+
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "ignore")
+
+        targets = self._get_targets()
+        if len(targets) == 0:
+            return []
+        return self._pool.map(lambda target: self._build_on_device(data, options, binaries, *target), targets)
+
+    def try_build(self, data, options=""):
+        """Build data on every selected device and print any build logs.
+        Returns False if the build failed on any device.
+        """
+
+        return self.print_results(self.build(data, options))
+
+    def print_results(self, results):
+        """Print the build logs in results, a list of BuildResult returned by
+        build(). Returns False if the build failed on any device.
+        """
+
+        success = True
+        for result in results:
+            prefix = ""
+            if len(results) > 1:
+                prefix = "%s (%s): " % (result.device_name, result.platform_name)
+            if len(result.log) > 0:
+                print(prefix + result.log, file=sys.stderr)
+            if not result.success:
+                print(prefix + "Could not build program.", file=sys.stderr)
+                success = False
+        return success
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+            self._targets = None
+
+
+def _device_identity(device):
+    # Strings that identify the platform, device, and driver a program is built
+    # with. Used to key cached build results.
+    return (device.platform.name.strip(),
+            device.platform.version.strip(),
+            device.name.strip(),
+            device.version.strip(),
+            device.driver_version.strip())
+
+
+def _parse_device_selection(text):
+    """Convert a device selection string in the form "platform[:device]" into
+    a (platform index, device index) tuple for BuildChecker.
+    """
+
+    parts = text.split(":")
+    if len(parts) > 2 or not all(part.isdigit() for part in parts):
+        raise ValueError("Invalid device selection '%s'. Expected PLATFORM[:DEVICE]." % text)
+    return (int(parts[0]), int(parts[1]) if len(parts) == 2 else None)
+
+
+_default_build_checker = None
+_default_build_checker_lock = threading.Lock()
+
+
+def try_build(data, build_checker=None):
+    """Try to build OpenCL script to test for errors instead of having to wait
+    until after the minified version is used during run time which is much
+    harder to debug.
+    """
+
+    global _default_build_checker
+    if build_checker is None:
+        with _default_build_checker_lock:
+            if _default_build_checker is None:
+                _default_build_checker = BuildChecker()
+        build_checker = _default_build_checker
+    return build_checker.try_build(data)
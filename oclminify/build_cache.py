@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # 30 days in seconds.
+
+
+def _default_directory():
+    if os.environ.get("OCLMINIFY_BUILD_CACHE_DIR"):
+        return os.environ["OCLMINIFY_BUILD_CACHE_DIR"]
+    if os.environ.get("XDG_CACHE_HOME"):
+        return os.path.join(os.environ["XDG_CACHE_HOME"], "oclminify", "build")
+    return os.path.join(os.path.expanduser("~"), ".cache", "oclminify", "build")
+
+
+class BuildCache(object):
+    """Store the result of building a program on a device so unchanged sources
+    don't have to be compiled by the OpenCL driver again. Each entry is a small
+    JSON file keyed by a hash of the source, the build options, and the
+    platform, device, and driver versions.
+
+    Entries are evicted least recently used first once there are more than
+    max_entries, and entries not used for max_age seconds are removed.
+    """
+
+    def __init__(self, directory=None, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory or _default_directory()
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+    @staticmethod
+    def key(data, options, device_identity):
+        """Generate a cache key. device_identity is a sequence of strings that
+        identify the platform, device, and driver the program is built with.
+        """
+
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8", "ignore")
+        digest = hashlib.sha256()
+        digest.update(data)
+        for part in [options, ] + list(device_identity):
+            digest.update(b"\0")
+            digest.update(part.encode("utf-8", "ignore"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Return the (success, log) stored for key or None if there is no
+        entry.
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, "r") as fd:
+                entry = json.load(fd)
+            # Mark as recently used.
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return (entry["success"], entry["log"])
+
+    def put(self, key, success, log):
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            # Write to a temporary file first and then move it into place so
+            # concurrent readers never see a partially written entry.
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as temp_file:
+                json.dump({"success": success, "log": log}, temp_file)
+            getattr(os, "replace", os.rename)(temp_path, self._path(key))
+        except (IOError, OSError):
+            return  # The cache is only an optimization.
+        self.evict()
+
+    def evict(self):
+        self._remove_entries(self.max_entries)
+
+    def clear(self):
+        self._remove_entries(0)
+
+    def _remove_entries(self, max_entries):
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except OSError:
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass  # Removed by another process.
+        entries.sort(reverse=True)
+
+        now = time.time()
+        for (index, (mtime, path)) in enumerate(entries):
+            if index >= max_entries or (self.max_age is not None and now - mtime > self.max_age):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
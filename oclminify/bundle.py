@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+import copy
+from pycparser import c_ast
+from oclminify.errors import MinifyError
+
+
+# Stands in for names while comparing functions. It can't appear in generated
+# source, so it never matches a real name.
+_PLACEHOLDER = "$"
+
+
+class _LocalNames(c_ast.NodeVisitor):
+    # Collect the names of the parameters, variables, and typedefs declared
+    # inside of a function.
+    def __init__(self):
+        self.names = set()
+
+    def visit_TypeDecl(self, node):
+        if node.declname:
+            self.names.add(node.declname)
+        self.generic_visit(node)
+
+
+class _LocalRenamer(c_ast.NodeVisitor):
+    # Rename local names in order of first appearance. Struct fields are
+    # skipped because they are not local names even when they are spelled the
+    # same.
+    def __init__(self, names):
+        self.names = names
+        self.renames = {}
+
+    def _rename(self, name):
+        if name not in self.names:
+            return name
+        if name not in self.renames:
+            self.renames[name] = "%s%i" % (_PLACEHOLDER, len(self.renames))
+        return self.renames[name]
+
+    def visit_TypeDecl(self, node):
+        node.declname = self._rename(node.declname)
+        self.generic_visit(node)
+
+    def visit_ID(self, node):
+        node.name = self._rename(node.name)
+
+    def visit_IdentifierType(self, node):
+        node.names = [self._rename(name) for name in node.names]
+
+    def visit_StructRef(self, node):
+        self.visit(node.name)
+
+
+class _CallRenamer(c_ast.NodeVisitor):
+    # Point calls to removed functions at the copy that was kept.
+    def __init__(self, renames):
+        self.renames = renames
+
+    def visit_FuncCall(self, node):
+        if isinstance(node.name, c_ast.ID) and node.name.name in self.renames:
+            node.name.name = self.renames[node.name.name]
+        self.generic_visit(node)
+
+
+def _is_kernel(node):
+    return "__kernel" in (node.decl.funcspec or [])
+
+
+def _function_key(node, generator):
+    # The generated source of a copy of the function with its local names,
+    # and its own name unless it's a kernel, replaced. The minifier gives
+    # locals different names in each source depending on which globals are
+    # visible, so identical helpers would not match otherwise.
+    node = copy.deepcopy(node)
+    if not _is_kernel(node):
+        node.decl.type.type.declname = _PLACEHOLDER
+    scopes = [node.body] if node.decl.type.args is None else [node.decl.type.args, node.body]
+    local_names = _LocalNames()
+    for scope in scopes:
+        local_names.visit(scope)
+    renamer = _LocalRenamer(local_names.names)
+    for scope in scopes:
+        renamer.visit(scope)
+    return generator.visit(node)
+
+
+def deduplicate(ast, generator):
+    """Remove every top level declaration from ast, a FileAST combining
+    minified sources, that is identical to an earlier one. Functions that only
+    differ in their name and the names of their locals are identical too, in
+    which case calls to the removed function are pointed at the one that was
+    kept. Returns a dict mapping the name of each removed function to the name
+    of the function that replaced it.
+
+    Raises MinifyError when a function is defined more than once with
+    different bodies since the combined source could not be built.
+    """
+
+    renames = {}
+    function_names = {}  # Key of each kept function to its name.
+    function_keys = {}  # Name of each kept function to its key.
+    declarations = set()
+    ext = []
+    for node in ast.ext:
+        # Functions are declared before they are used, so calls only need to
+        # be updated for functions that were already removed.
+        if renames:
+            _CallRenamer(renames).visit(node)
+
+        if isinstance(node, c_ast.FuncDef):
+            name = node.decl.type.type.declname
+            key = _function_key(node, generator)
+            if name in function_keys:
+                if function_keys[name] != key:
+                    raise MinifyError("Function '%s' is defined more than once with different bodies" % node.decl.name)
+                continue
+            if key in function_names:
+                renames[name] = function_names[key]
+                continue
+            function_names[key] = name
+            function_keys[name] = key
+        elif not isinstance(node, c_ast.Pragma):
+            # Pragmas are always kept because they take effect in order, like
+            # enabling an extension and disabling it again.
+            key = generator.visit(node)
+            if key in declarations:
+                continue
+            declarations.add(key)
+        ext.append(node)
+    ast.ext = ext
+    return renames
@@ -0,0 +1,272 @@
+"""Removal of local variables that are never read and of stores to local
+variables that are overwritten before they are read.
+"""
+from __future__ import absolute_import
+from pycparser import c_ast
+
+
+# Statements that can jump past the statements after them.
+_JUMPS = (c_ast.Break, c_ast.Continue, c_ast.Return, c_ast.Goto, c_ast.Label, c_ast.Case, c_ast.Default)
+_INCREMENTS = ("++", "--", "p++", "p--")
+_ADDRESS_SPACES = ("__global", "global", "__local", "local", "__constant", "constant")
+
+
+class _Variable(object):
+    __slots__ = ("decl", "candidate", "volatile", "reads", "escaped", "init_pure")
+
+    def __init__(self, decl, candidate, volatile):
+        self.decl = decl
+        self.candidate = candidate
+        self.volatile = volatile
+        self.reads = 0
+        self.escaped = False
+        self.init_pure = True
+
+
+class _Store(object):
+    # A statement that only assigns to, increments, or decrements a variable.
+    __slots__ = ("variable", "plain", "pure")
+
+    def __init__(self, variable, plain, pure):
+        self.variable = variable
+        self.plain = plain  # An assignment with = that doesn't read the variable.
+        self.pure = pure
+
+
+def _type_quals(decl):
+    # Qualifiers of the declaration and every type it's made of, and whether
+    # it's a pointer or function.
+    quals = list(decl.quals)
+    indirect = False
+    node = decl.type
+    while node is not None and not isinstance(node, (c_ast.IdentifierType, c_ast.Struct, c_ast.Union, c_ast.Enum)):
+        if isinstance(node, (c_ast.PtrDecl, c_ast.FuncDecl)) or not hasattr(node, "type"):
+            indirect = True
+            break
+        quals.extend(getattr(node, "quals", None) or [])
+        node = node.type
+    return (quals, indirect)
+
+
+def _defines_type(decl):
+    # Whether the declaration also defines a struct, union, or enum, which
+    # would be lost along with it.
+    node = decl.type
+    while hasattr(node, "type") and not isinstance(node, (c_ast.Struct, c_ast.Union, c_ast.Enum)):
+        node = node.type
+    if isinstance(node, (c_ast.Struct, c_ast.Union)):
+        return node.decls is not None
+    return isinstance(node, c_ast.Enum) and node.values is not None
+
+
+def _names(node, names):
+    # Add every identifier below node to names regardless of scope and return
+    # whether there's a jump.
+    if isinstance(node, c_ast.ID):
+        names.add(node.name)
+    elif isinstance(node, c_ast.Decl) and node.name:
+        names.add(node.name)
+    jumps = isinstance(node, _JUMPS)
+    for (_, child) in node.children():
+        jumps = _names(child, names) or jumps
+    return jumps
+
+
+class DeadCodeEliminator(object):
+    """Remove declarations of local variables that are never read along with
+    the statements that only store to them, and stores that are always
+    overwritten before being read. Only variables that can't be reached any
+    other way are considered, so pointers, volatile, static, and __local
+    variables, and variables whose address is taken, are left alone, as is
+    any statement with a side effect like a function call.
+    """
+
+    def eliminate(self, node):
+        for ext in node.ext:
+            if isinstance(ext, c_ast.FuncDef):
+                # Removing statements can leave other variables unread.
+                while self._eliminate_function(ext):
+                    pass
+
+    def _eliminate_function(self, node):
+        self.scopes = [{}]
+        self.variables = []
+        self.declarations = {}  # id() of each declaration to its _Variable.
+        self.stores = {}  # id() of each store statement to its _Store.
+        self.lists = []  # Every statement list visited.
+        args = node.decl.type.args
+        for param in (args.params if args else []):
+            if isinstance(param, c_ast.Decl) and param.name:
+                self._declare(param, None)
+        self._walk(node.body)
+        removed = self._remove_unused()
+        return self._remove_overwritten() or removed
+
+    def _declare(self, decl, statements):
+        # Only variables declared directly in a list of statements can be
+        # removed.
+        (quals, indirect) = _type_quals(decl)
+        volatile = "volatile" in quals
+        candidate = statements is not None and not decl.storage and not indirect and not volatile and not any(qual in _ADDRESS_SPACES for qual in quals) and not _defines_type(decl)
+        variable = _Variable(decl, candidate, volatile)
+        self.scopes[-1][decl.name] = variable
+        self.variables.append(variable)
+        self.declarations[id(decl)] = variable
+        return variable
+
+    def _lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def _candidate(self, node):
+        # The variable node refers to when it could be removed.
+        if not isinstance(node, c_ast.ID):
+            return None
+        variable = self._lookup(node.name)
+        return variable if variable is not None and variable.candidate else None
+
+    def _walk_statements(self, statements):
+        if statements is None:
+            return
+        self.lists.append(statements)
+        for statement in statements:
+            if isinstance(statement, c_ast.Decl) and statement.name:
+                self._walk_decl(statement, statements)
+            elif isinstance(statement, c_ast.Assignment) and self._candidate(statement.lvalue):
+                variable = self._candidate(statement.lvalue)
+                pure = not self._walk(statement.rvalue)
+                names = set()
+                _names(statement.rvalue, names)
+                plain = statement.op == "=" and statement.lvalue.name not in names
+                self.stores[id(statement)] = _Store(variable, plain, pure)
+            elif isinstance(statement, c_ast.UnaryOp) and statement.op in _INCREMENTS and self._candidate(statement.expr):
+                self.stores[id(statement)] = _Store(self._candidate(statement.expr), False, True)
+            else:
+                self._walk(statement)
+
+    def _walk_decl(self, node, statements=None):
+        # Sizes of arrays are read before the variable exists.
+        effects = False
+        declarator = node.type
+        while isinstance(declarator, (c_ast.ArrayDecl, c_ast.PtrDecl)):
+            if isinstance(declarator, c_ast.ArrayDecl) and declarator.dim is not None:
+                effects = self._walk(declarator.dim) or effects
+            declarator = declarator.type
+        variable = self._declare(node, statements)
+        if node.init is not None:
+            variable.init_pure = not self._walk(node.init)
+            effects = effects or not variable.init_pure
+        return effects
+
+    def _walk(self, node):
+        # Count reads of variables below node and return whether it has side
+        # effects or reads memory through a pointer.
+        if isinstance(node, c_ast.ID):
+            variable = self._lookup(node.name)
+            if variable is None:
+                return False
+            variable.reads += 1
+            return variable.volatile
+        if isinstance(node, c_ast.Compound):
+            self.scopes.append({})
+            self._walk_statements(node.block_items)
+            self.scopes.pop()
+            return True
+        if isinstance(node, (c_ast.Case, c_ast.Default)):
+            if isinstance(node, c_ast.Case):
+                self._walk(node.expr)
+            self._walk_statements(node.stmts)
+            return True
+        if isinstance(node, c_ast.Decl):
+            return self._walk_decl(node) if node.name else False
+        if isinstance(node, (c_ast.Typename, c_ast.Typedef, c_ast.Struct, c_ast.Union, c_ast.Enum)):
+            return False
+        if isinstance(node, c_ast.Cast):
+            return self._walk(node.expr)
+        if isinstance(node, c_ast.StructRef):
+            return self._walk(node.name) or node.type == "->"
+        if isinstance(node, c_ast.ArrayRef):
+            effects = self._walk(node.subscript)
+            return self._walk(node.name) or effects or self._candidate(node.name) is None
+        if isinstance(node, c_ast.UnaryOp) and node.op == "&":
+            # The variable may now be read or written through the pointer.
+            base = node.expr
+            while isinstance(base, (c_ast.StructRef, c_ast.ArrayRef)):
+                base = base.name
+            if isinstance(base, c_ast.ID) and self._lookup(base.name) is not None:
+                self._lookup(base.name).escaped = True
+
+        if isinstance(node, c_ast.For):
+            self.scopes.append({})
+        effects = False
+        for (_, child) in node.children():
+            effects = self._walk(child) or effects
+        if isinstance(node, c_ast.For):
+            self.scopes.pop()
+        if isinstance(node, (c_ast.FuncCall, c_ast.Assignment)):
+            return True
+        if isinstance(node, c_ast.UnaryOp) and node.op in _INCREMENTS + ("*", ):
+            return True
+        return effects
+
+    def _remove_unused(self):
+        stores = {}
+        for (key, store) in self.stores.items():
+            stores.setdefault(id(store.variable), []).append((key, store))
+
+        dead = set()
+        for variable in self.variables:
+            if not variable.candidate or variable.reads or variable.escaped or not variable.init_pure:
+                continue
+            variable_stores = stores.get(id(variable), [])
+            if all(store.pure for (_, store) in variable_stores):
+                dead.add(id(variable.decl))
+                dead.update(key for (key, _) in variable_stores)
+        if not dead:
+            return False
+        for statements in self.lists:
+            statements[:] = [statement for statement in statements if id(statement) not in dead]
+        return True
+
+    def _remove_overwritten(self):
+        removed = False
+        for statements in self.lists:
+            dead = set()
+            names = [None] * len(statements)
+            for (index, statement) in enumerate(statements):
+                # A store or an initializer that is later overwritten.
+                if isinstance(statement, c_ast.Decl):
+                    variable = self.declarations.get(id(statement))
+                    if variable is None or not variable.candidate or statement.init is None or not variable.init_pure:
+                        continue
+                else:
+                    store = self.stores.get(id(statement))
+                    if store is None or not store.pure:
+                        continue
+                    variable = store.variable
+                if variable.escaped:
+                    continue
+
+                name = variable.decl.name
+                for later_index in range(index + 1, len(statements)):
+                    later = statements[later_index]
+                    later_store = self.stores.get(id(later))
+                    if later_store is not None and later_store.variable is variable and later_store.plain:
+                        dead.add(id(statement))
+                        break
+                    if names[later_index] is None:
+                        later_names = set()
+                        names[later_index] = (later_names, _names(later, later_names))
+                    (later_names, jumps) = names[later_index]
+                    if name in later_names or jumps:
+                        break
+
+            if dead:
+                removed = True
+                for statement in statements:
+                    if id(statement) in dead and isinstance(statement, c_ast.Decl):
+                        statement.init = None
+                statements[:] = [statement for statement in statements if id(statement) not in dead or isinstance(statement, c_ast.Decl)]
+        return removed
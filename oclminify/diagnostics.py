@@ -0,0 +1,66 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from collections import OrderedDict
+import sys
+
+
+class Diagnostics(object):
+    """Collect messages produced while minifying. Messages are deduplicated by
+    symbol and counted instead of being printed every time they occur, which
+    can be thousands of times for built-ins, macros, and undeclared
+    identifiers in real kernels.
+    """
+
+    class Diagnostic(object):
+        def __init__(self, message, symbol):
+            self.message = message
+            self.symbol = symbol
+            self.count = 0
+
+        def __str__(self):
+            return self.message % self.symbol
+
+        def __repr__(self):
+            return "Diagnostic(%r, %r, count=%i)" % (self.message, self.symbol, self.count)
+
+    def __init__(self, verbose=False):
+        # When verbose, every occurrence is also printed to stderr as it
+        # happens.
+        self.verbose = verbose
+        self._diagnostics = OrderedDict()
+
+    def report(self, message, symbol):
+        """Record a message about symbol. The message should contain a single
+        %s where the symbol name is inserted.
+        """
+
+        key = (message, symbol)
+        diagnostic = self._diagnostics.get(key)
+        if diagnostic is None:
+            diagnostic = Diagnostics.Diagnostic(message, symbol)
+            self._diagnostics[key] = diagnostic
+        diagnostic.count += 1
+        if self.verbose:
+            print(str(diagnostic), file=sys.stderr)
+
+    def __iter__(self):
+        return iter(self._diagnostics.values())
+
+    def __len__(self):
+        return len(self._diagnostics)
+
+    def symbols(self):
+        """Return the unique symbols that have at least one message."""
+
+        return list(OrderedDict((diagnostic.symbol, None) for diagnostic in self).keys())
+
+    def summary(self):
+        if not self._diagnostics:
+            return ""
+        lines = ["%i diagnostic(s) for %i symbol(s):" % (len(self), len(self.symbols()))]
+        for diagnostic in self:
+            line = "  " + str(diagnostic)
+            if diagnostic.count > 1:
+                line += " (%i times)" % diagnostic.count
+            lines.append(line)
+        return "\n".join(lines)
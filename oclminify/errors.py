@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+import re
+
+
+class MinifyError(Exception):
+    """Base class of every error raised while minifying. When known, the
+    location in the preprocessed source that caused the error is stored in
+    file, line, and column. Each is None otherwise.
+    """
+
+    def __init__(self, message, file=None, line=None, column=None):
+        Exception.__init__(self, message)
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+
+    def location(self):
+        if self.line is None:
+            return ""
+        location = "%s:%i" % (self.file or "<input>", self.line)
+        if self.column is not None:
+            location += ":%i" % self.column
+        return location
+
+    def __str__(self):
+        location = self.location()
+        if location:
+            return "%s: %s" % (location, self.message)
+        return self.message
+
+    def __reduce__(self):
+        # Subclasses take different constructor arguments, so restore the
+        # attributes directly. This lets errors raised in a process pool reach
+        # the caller intact.
+        return (_restore_error, (self.__class__, self.message, self.__dict__))
+
+
+class PreprocessError(MinifyError):
+    """The preprocessor exited with an error. stderr holds everything the
+    preprocessor printed, which usually explains what went wrong.
+    """
+
+    def __init__(self, returncode, stderr):
+        MinifyError.__init__(self, "Failed to preprocess file")
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class ParseError(MinifyError):
+    """The preprocessed source could not be parsed."""
+
+    # pycparser formats its errors as "file:line[:column]: message".
+    _PYCPARSER_MESSAGE = re.compile(r"^(.*?):(\d+)(?::(\d+))?: (.*)$", re.DOTALL)
+
+    @classmethod
+    def from_pycparser(cls, error):
+        match = cls._PYCPARSER_MESSAGE.match(str(error))
+        if match is None:
+            return cls("Parse error: %s" % error)
+        (file, line, column, message) = match.groups()
+        return cls("Parse error: %s" % message, file or None, int(line), int(column) if column else None)
+
+
+class UnsupportedNodeError(MinifyError):
+    """The minifier doesn't know how to handle a node in the parsed source.
+    node_type is the name of the node's class.
+    """
+
+    def __init__(self, node, visitor_name="Minifier"):
+        coord = getattr(node, "coord", None)
+        MinifyError.__init__(self,
+                             "Could not find method %s.visit_%s" % (visitor_name, node.__class__.__name__),
+                             getattr(coord, "file", None) or None,
+                             getattr(coord, "line", None),
+                             getattr(coord, "column", None))
+        self.node = node
+        self.node_type = node.__class__.__name__
+
+
+def _restore_error(cls, message, state):
+    error = cls.__new__(cls)
+    Exception.__init__(error, message)
+    error.__dict__.update(state)
+    return error
@@ -115,7 +115,7 @@ class BUILTIN:
         # Math Functions (float/double)
         "acos",
         "acosh",
-        "acospi"
+        "acospi",
         "asin",
         "asinh",
         "asinpi",
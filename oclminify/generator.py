@@ -256,8 +256,10 @@ class Generator(OpenCLCGenerator):
                 result += self.visit(ext) + ";"
         return result
 
-    def _generate_type(self, n, modifiers=[]):
-        result = super(Generator, self)._generate_type(n, modifiers)
+    def _generate_type(self, n, modifiers=None):
+        # Avoid a shared mutable default argument so generators running in
+        # different threads never touch the same list.
+        result = super(Generator, self)._generate_type(n, modifiers or [])
 
         # Remove space between closing bracket and name.
         if "declname" in n.attr_names and n.declname and result.endswith("} " + n.declname):
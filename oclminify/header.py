@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+import os
+import re
+from oclminify.errors import MinifyError
+
+
+# The name of every define, variable, and enum value in a header.
+_HEADER_NAME = re.compile(r"^(?:#define (\w+)|.*?(\w+)(?:\[\])? = )", re.MULTILINE)
+
+
+def _header_names(input_path):
+    # Derive the include guard and the prefix used for every symbol in the
+    # header from the input file name. For example, "MatrixMul.cl" becomes
+    # MATRIXMUL_CL_DATA_H and MATRIXMUL.
+    file_name = os.path.split(input_path)[-1]
+    guard_name = file_name.upper().replace(".", "_") + "_DATA_H"
+    var_base_name = file_name.lower()
+    var_base_name = var_base_name[:var_base_name.find(".")].capitalize()
+    return (guard_name, var_base_name.upper())
+
+
+def _byte_array(data):
+    return ",".join(str(hex(byte)) for byte in bytearray(data))
+
+
+def _c_string(text):
+    return "\"%s\"" % text.replace("\\", "\\\\").replace("\"", "\\\"")
+
+
+def _binaries_text(prefix, binaries):
+    text = ""
+    for (index, result) in enumerate(binaries):
+        text += "static const unsigned char %s_BINARY_%i_DATA[] = {%s};\n" % (prefix, index, _byte_array(result.binary))
+    text += "#define %s_BINARY_COUNT %i\n" % (prefix, len(binaries))
+    if binaries:
+        text += "static const char* const %s_BINARY_DEVICE_NAMES[] = {%s};\n" % (prefix, ",".join(_c_string(result.device_name) for result in binaries))
+        text += "static const char* const %s_BINARY_DRIVER_VERSIONS[] = {%s};\n" % (prefix, ",".join(_c_string(result.driver_version) for result in binaries))
+        text += "static const size_t %s_BINARY_SIZES[] = {%s};\n" % (prefix, ",".join(str(len(result.binary)) for result in binaries))
+        text += "static const unsigned char* const %s_BINARY_DATA[] = {%s};\n" % (prefix, ",".join("%s_BINARY_%i_DATA" % (prefix, index) for index in range(len(binaries))))
+    return text + "\n"
+
+
+def _enum_text(names, count_name):
+    text = "enum\n{\n"
+    for (index, name) in enumerate(names):
+        text += "    %s = %i,\n" % (name, index)
+    text += "    %s = %i\n};\n" % (count_name, len(names))
+    return text
+
+
+def _index_tables_text(prefix, result):
+    # Numeric indices let applications store kernels and set arguments without
+    # any string handling. The name table is in declaration order which is the
+    # order clCreateKernelsInProgram() returns kernels in on common drivers.
+    # The order is not guaranteed by the specification, so portable code
+    # should match each kernel's CL_KERNEL_FUNCTION_NAME against the table.
+    # The counts use a separate NUM_ prefix so they can't collide with a
+    # kernel or argument that is named "count". Argument names are put after
+    # the kernel name like the FUNCTION_ defines so "a_b" and "c" can't
+    # collide with "a" and "b_c", and no kernel name can produce the name of
+    # the table.
+    text = _enum_text(["%s_KERNEL_%s" % (prefix, name.upper()) for name in result.kernel_names], "%s_NUM_KERNELS" % prefix)
+    if result.kernel_names:
+        # An empty initializer isn't valid C, so there's no table for a source
+        # with only helper functions.
+        text += "static const char* const %s_NAMES_OF_KERNELS[] = {%s};\n" % (prefix, ",".join(_c_string(new_name) for new_name in result.kernel_names.values()))
+    for (name, args) in result.kernel_args.items():
+        text += _enum_text(["%s_%s_ARG_%s" % (prefix, name.upper(), arg.upper()) for arg in args], "%s_NUM_ARGS_%s" % (prefix, name.upper()))
+    return text + "\n"
+
+
+def _check_names(header_text):
+    # Kernel and argument names are joined with underscores, so different
+    # names can produce the same one. For example, kernel kernel_x with
+    # argument y and kernel x_arg_y, or kernel function_x with argument y and
+    # the define for argument y of kernel x.
+    names = set()
+    for match in _HEADER_NAME.finditer(header_text):
+        name = match.group(1) or match.group(2)
+        if name in names:
+            raise MinifyError("Kernel and argument names produce %s more than once in the C header" % name)
+        names.add(name)
+
+
+def generate_header(input_path, data, result, function_args=False, binaries=None):
+    """Embed data, the minified and optionally compressed source, in a C
+    header file along with the names of each kernel from result, a
+    MinifyResult.
+
+    binaries is an optional list of BuildResult with program binaries. Each
+    binary is embedded with the name and driver version of the device it was
+    built for so applications can use clCreateProgramWithBinary() on known
+    hardware and fall back to building the source otherwise.
+
+    Raises a MinifyError when kernel and argument names produce the same
+    name more than once, since the header couldn't be compiled.
+    """
+
+    (guard_name, prefix) = _header_names(input_path)
+    header_text = "#ifndef %s\n#define %s\n\n" % (guard_name, guard_name)
+    header_text += "static const size_t %s_SIZE = %i;\n" % (prefix, len(data))
+    header_text += "static const unsigned char %s_DATA[] = {%s};\n\n" % (prefix, _byte_array(data))
+    if binaries is not None:
+        header_text += _binaries_text(prefix, binaries)
+    for (old_name, new_name) in result.kernel_names.items():
+        header_text += "#define %s_FUNCTION_%s \"%s\"\n" % (prefix, old_name.upper(), new_name)
+        if function_args:
+            for (old_arg, new_arg) in result.kernel_args[old_name].items():
+                header_text += "#define %s_FUNCTION_%s_ARG_%s \"%s\"\n" % (prefix, old_name.upper(), old_arg.upper(), new_arg)
+            header_text += "\n"
+    if not function_args:
+        header_text += "\n"
+    header_text += _index_tables_text(prefix, result)
+    header_text += "#endif"
+    _check_names(header_text)
+    return header_text
@@ -0,0 +1,134 @@
+"""Describe kernel arguments with the same information clGetKernelArgInfo()
+returns so applications can allocate buffers and bind arguments without
+querying the driver, which many drivers only support when the program is
+built with -cl-kernel-arg-info.
+"""
+from __future__ import absolute_import
+from collections import OrderedDict
+from pycparser import c_ast
+from oclminify.swizzle import parse_vector_type
+
+
+# Values of cl_kernel_arg_address_qualifier and cl_kernel_arg_access_qualifier
+# from cl.h.
+ADDRESS_QUALIFIERS = OrderedDict([
+    ("global", 0x119B),
+    ("local", 0x119C),
+    ("constant", 0x119D),
+    ("private", 0x119E),
+])
+ACCESS_QUALIFIERS = OrderedDict([
+    ("read_only", 0x11A0),
+    ("write_only", 0x11A1),
+    ("read_write", 0x11A2),
+    ("none", 0x11A3),
+])
+
+# Size in bytes of each scalar type. size_t and friends depend on the device
+# so they're left out.
+_SCALAR_SIZES = {
+    "bool": 1,
+    "char": 1,
+    "uchar": 1,
+    "short": 2,
+    "ushort": 2,
+    "int": 4,
+    "uint": 4,
+    "long": 8,
+    "ulong": 8,
+    "half": 2,
+    "float": 4,
+    "double": 8,
+}
+
+
+class ArgType(object):
+    # A type with typedefs resolved. pointer_depth counts pointers and
+    # arrays, qualifiers are the address space, access, and type qualifiers
+    # without leading underscores, and name is the type that's pointed to,
+    # like float4 or struct particle.
+    __slots__ = ("pointer_depth", "qualifiers", "name")
+
+    def __init__(self, pointer_depth, qualifiers, name):
+        self.pointer_depth = pointer_depth
+        self.qualifiers = qualifiers
+        self.name = name
+
+
+def _type_name(names):
+    # Spell built-in types the way OpenCL does, like uint for unsigned int.
+    names = [name for name in names if name != "signed"]
+    unsigned = "unsigned" in names
+    names = [name for name in names if name != "unsigned"] or ["int"]
+    if len(names) > 1 and names[-1] == "int":
+        names = names[:-1]  # short int and long int.
+    name = " ".join(names)
+    return "u" + name if unsigned else name
+
+
+def _qualifiers(names):
+    return tuple(name.lstrip("_") for name in names or [])
+
+
+def resolve_type(node, typedefs, name=None):
+    """Return an ArgType for node, a declaration's type, looking up typedefs
+    in typedefs, a dict of typedef name to ArgType. name is used for an
+    anonymous struct, which is only known by its typedef.
+    """
+
+    pointer_depth = 0
+    while isinstance(node, (c_ast.PtrDecl, c_ast.ArrayDecl)):
+        pointer_depth += 1
+        node = node.type
+    qualifiers = _qualifiers(getattr(node, "quals", None))
+    node = getattr(node, "type", node)
+    if isinstance(node, c_ast.IdentifierType):
+        type_name = _type_name(node.names)
+        if type_name in typedefs:
+            resolved = typedefs[type_name]
+            return ArgType(pointer_depth + resolved.pointer_depth, qualifiers + resolved.qualifiers, resolved.name)
+        return ArgType(pointer_depth, qualifiers, type_name)
+    if isinstance(node, (c_ast.Struct, c_ast.Union, c_ast.Enum)) and node.name:
+        keyword = {c_ast.Struct: "struct", c_ast.Union: "union", c_ast.Enum: "enum"}[type(node)]
+        return ArgType(pointer_depth, qualifiers, "%s %s" % (keyword, node.name))
+    return ArgType(pointer_depth, qualifiers, name)
+
+
+def describe_argument(index, decl, typedefs):
+    """Describe decl, the declaration of the kernel argument at index, as an
+    OrderedDict containing only JSON compatible types. size is the size in
+    bytes of the type pointed to, or of the argument itself when it isn't a
+    pointer, and is None when it depends on the device or isn't known.
+    """
+
+    arg_type = resolve_type(decl.type, typedefs)
+    qualifiers = _qualifiers(decl.quals) + arg_type.qualifiers
+    is_image = arg_type.name is not None and arg_type.name.startswith("image")
+
+    address_qualifier = "global" if is_image else "private"
+    for qualifier in ADDRESS_QUALIFIERS:
+        if qualifier in qualifiers:
+            address_qualifier = qualifier
+    access_qualifier = "none"
+    if is_image:
+        access_qualifier = "read_only"  # The default for images.
+        for qualifier in ["read_only", "write_only", "read_write"]:
+            if qualifier in qualifiers:
+                access_qualifier = qualifier
+
+    (scalar, vector_width) = parse_vector_type(arg_type.name) or (arg_type.name, 1)
+    size = None
+    if scalar in _SCALAR_SIZES and arg_type.pointer_depth <= 1:
+        # Vectors with 3 components take as much space as 4.
+        size = _SCALAR_SIZES[scalar] * (4 if vector_width == 3 else vector_width)
+
+    return OrderedDict([
+        ("index", index),
+        ("name", decl.name),
+        ("address_qualifier", address_qualifier),
+        ("access_qualifier", access_qualifier),
+        ("type", arg_type.name),
+        ("pointer", arg_type.pointer_depth > 0),
+        ("vector_width", vector_width),
+        ("size", size),
+    ])
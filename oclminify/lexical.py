@@ -0,0 +1,221 @@
+"""Remove comments and whitespace by only splitting the source into tokens.
+Nothing is preprocessed, parsed, or renamed, so this is many times faster
+than minify() on large sources but the output is larger.
+"""
+from __future__ import absolute_import
+from collections import OrderedDict
+import re
+import timeit
+from oclminify.errors import ParseError
+from oclminify.lexer import OpenCLCLexer
+from oclminify.result import MinifyResult
+
+
+# Preprocessor directives, which may contain comments and be preceded by
+# them, comments, and string and character literals, which may contain
+# anything that looks like the other two. A comment that is never closed is
+# matched on its own so it can be reported.
+_SOURCE = re.compile(r"""
+    (?P<directive>^[ \t]*(?:/\*(?:[^*]|\*(?!/))*\*/[ \t]*)*\#(?:/\*.*?\*/|//[^\n]*|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|(?!/\*)[^\n])*)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<literal>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<unterminated>/\*)
+""", re.MULTILINE | re.DOTALL | re.VERBOSE)
+_DIRECTIVE_PART = re.compile(r"""("(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')|(//[^\n]*|/\*.*?\*/)|(\s+)""", re.DOTALL)
+_LINE_SPLICE = re.compile(r"\\\r?\n")
+
+_WORD_CHARACTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
+
+# Pairs of characters that would be read as a different token if the tokens
+# ending and starting with them weren't separated.
+_JOINING = frozenset(["++", "--", "+=", "-=", "->", "&&", "&=", "||", "|=", "<<", "<=", ">>", ">=", "==", "!=",
+                      "*=", "/=", "%=", "^=", "//", "/*", "##", "..", "<:", ":>", "<%", "%>", "%:"])
+
+
+def _token_pattern():
+    # A single pattern made from the token definitions of OpenCLCLexer, so
+    # tokens are split exactly like the parser would, but without calling
+    # into the lexer for every token. Only the kind of token matters here, not
+    # which keyword or operator it is.
+    lexer = OpenCLCLexer
+    operators = [getattr(lexer, name) for name in dir(lexer) if name.startswith("t_") and isinstance(getattr(lexer, name), str) and name not in ("t_ignore", "t_STRING_LITERAL") and not name.startswith("t_pp")]
+    operators.sort(key=len, reverse=True)  # Longest first, like >>= before >>.
+    return re.compile("|".join([
+        r"(?P<space>\s+)",
+        "(?P<literal>%s)" % "|".join([lexer.wstring_literal, lexer.wchar_const, lexer.string_literal, lexer.char_const]),
+        "(?P<number>%s)" % "|".join([lexer.hex_floating_constant, lexer.floating_constant, lexer.hex_constant, lexer.bin_constant, lexer.octal_constant, lexer.decimal_constant]),
+        "(?P<word>%s)" % lexer.identifier,
+        "(?P<operator>%s|[{}])" % "|".join(operators),
+        "(?P<error>.)",
+    ]))
+
+
+# Compiled once here rather than on first use so nothing is modified while
+# minifying.
+_TOKEN = _token_pattern()
+
+
+def _tokens(code, line, tokens, output):
+    # Append the tokens in code to tokens and output, adding a space only
+    # where two tokens would merge.
+    (kind, last) = (None, " ")
+    if tokens and not output[-1].endswith("\n"):
+        (kind, last) = (tokens[-1][0], tokens[-1][1][-1])
+    for match in _TOKEN.finditer(code):
+        token_kind = match.lastgroup
+        if token_kind == "space":
+            continue
+        value = match.group()
+        if token_kind == "error":
+            line += code.count("\n", 0, match.start())
+            column = match.start() - code.rfind("\n", 0, match.start())
+            raise ParseError("Parse error: Illegal character %r" % value, None, line, column)
+
+        first = value[0]
+        if last in _WORD_CHARACTERS:
+            separate = first in _WORD_CHARACTERS or first in "\"'" or (first == "." and token_kind == "number")
+        else:
+            separate = kind == "operator" and last + first in _JOINING
+        if kind == "number":
+            # The preprocessor reads numbers greedily, like 0x1E-1 being a
+            # single invalid number.
+            separate = separate or first == "." or (last in "eEpP" and first in "+-")
+        if separate:
+            output.append(" ")
+        output.append(value)
+        tokens.append((token_kind, value))
+        (kind, last) = (token_kind, value[-1])
+
+
+def _directive(text):
+    # Comments become a single space like in code, whitespace outside literals
+    # is collapsed, and the space after the # is removed.
+    def replace(match):
+        return match.group(1) or " "
+    text = _DIRECTIVE_PART.sub(replace, text).strip()
+    return "#" + text[1:].lstrip()
+
+
+def _read_kernel(tokens, index, kernels):
+    # Read the name and argument names of the kernel whose declaration starts
+    # at index, a list of (kind, value) tuples, and return the index after it.
+    name = None
+    while index < len(tokens) and tokens[index][1] not in (";", "{"):
+        if tokens[index][1] != "(":
+            name = tokens[index][1] if tokens[index][0] == "word" else None
+            index += 1
+        elif name in ("__attribute__", "__attribute"):
+            index = _skip_brackets(tokens, index)
+        else:
+            break
+    if index >= len(tokens) or tokens[index][1] != "(" or name is None:
+        return index
+
+    # The argument name is the last identifier outside any brackets.
+    args = []
+    arg = None
+    index += 1
+    while index < len(tokens) and tokens[index][1] != ")":
+        if tokens[index][1] in ("(", "["):
+            index = _skip_brackets(tokens, index)
+            continue
+        if tokens[index][1] == ",":
+            args.append(arg)
+            arg = None
+        elif tokens[index][0] == "word":
+            arg = tokens[index][1]
+        index += 1
+    args.append(arg)
+    if args == ["void"]:
+        args = []
+    if name not in kernels:
+        kernels[name] = OrderedDict((arg, arg) for arg in args if arg is not None)
+    return index
+
+
+def _skip_brackets(tokens, index):
+    depth = 0
+    while index < len(tokens):
+        if tokens[index][1] in ("(", "["):
+            depth += 1
+        elif tokens[index][1] in (")", "]"):
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return index
+
+
+def _minify_lexical(data):
+    # Returns the output and the argument names of each kernel.
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    data = _LINE_SPLICE.sub("", data.replace("\r\n", "\n"))
+
+    output = []
+    tokens = []
+    code = []
+    line = 1
+    code_line = 1
+
+    def flush():
+        _tokens("".join(code), code_line, tokens, output)
+        del code[:]
+
+    position = 0
+    for match in _SOURCE.finditer(data):
+        if match.group("unterminated"):
+            line += data.count("\n", position, match.start())
+            column = match.start() - data.rfind("\n", 0, match.start())
+            raise ParseError("Parse error: Unterminated comment", None, line, column)
+        code.append(data[position:match.start()])
+        text = match.group(0)
+        if match.group("directive"):
+            flush()
+            # Directives must be on their own line.
+            if output and not output[-1].endswith("\n"):
+                output.append("\n")
+            output.append(_directive(text) + "\n")
+        elif match.group("comment"):
+            # Keep the location of errors in the code after the comment.
+            code.append("\n" * text.count("\n") + " " * (len(text) - text.rfind("\n") - 1))
+        else:
+            code.append(text)
+        line += data.count("\n", position, match.end())
+        position = match.end()
+        if match.group("directive"):
+            code_line = line
+    code.append(data[position:])
+    flush()
+
+    text = "".join(output).rstrip("\n")
+    kernels = OrderedDict()
+    index = 0
+    while index < len(tokens):
+        if tokens[index][1] in ("__kernel", "kernel"):
+            index = _read_kernel(tokens, index + 1, kernels)
+        else:
+            index += 1
+    return (text, kernels)
+
+
+def minify_lexical(data):
+    """Remove comments and unnecessary whitespace from data, an OpenCL source,
+    without preprocessing it. Preprocessor directives are kept on their own
+    lines. Raises a ParseError when data contains a character that can't
+    start any token or a comment that is never closed.
+    """
+
+    return _minify_lexical(data)[0]
+
+
+def minify_lexical_result(data):
+    """Same as minify_lexical() but returns a MinifyResult. Kernel and
+    argument names are mapped to themselves since nothing is renamed.
+    """
+
+    start = timeit.default_timer()
+    (text, kernels) = _minify_lexical(data)
+    timings = {"minify": timeit.default_timer() - start}
+    kernel_names = OrderedDict((name, name) for name in kernels)
+    return MinifyResult(text, kernel_names, kernels, len(data), timings)
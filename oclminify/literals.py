@@ -0,0 +1,311 @@
+"""Shorter spellings of numeric literals and folding of constant expressions.
+Every rewrite keeps the value and type of the original exactly.
+"""
+from __future__ import absolute_import
+from __future__ import division
+import decimal
+import re
+from fractions import Fraction
+from pycparser import c_ast
+
+
+# Largest value of each integer type. OpenCL fixes int at 32 bits and long at
+# 64 bits.
+_INTEGER_MAX = {
+    "int": 2 ** 31 - 1,
+    "uint": 2 ** 32 - 1,
+    "long": 2 ** 63 - 1,
+    "ulong": 2 ** 64 - 1,
+}
+_INTEGER_BITS = {"int": 32, "uint": 32, "long": 64, "ulong": 64}
+_INTEGER_SUFFIX = {"int": "", "uint": "u", "long": "l", "ulong": "ul"}
+
+_INTEGER_LITERAL = re.compile(r"^(0[xX][0-9a-fA-F]+|0[0-7]*|[1-9][0-9]*)([uUlL]*)$")
+# Decimal floating point literals only. Hexadecimal floating point literals
+# and the half and long double suffixes are left alone.
+_FLOAT_LITERAL = re.compile(r"^((?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+(?=[eE]))(?:[eE][+-]?[0-9]+)?)([fF]?)$")
+
+_FLOAT32_MIN_NORMAL = Fraction(1, 2 ** 126)
+_FLOAT32_MAX = Fraction(2 ** 24 - 1) * 2 ** 104
+
+
+def _integer_type(value, decimal_base, suffix):
+    # The first type that can hold value. Unsuffixed hexadecimal and octal
+    # literals may also be unsigned, but decimal literals may not.
+    suffix = suffix.lower()
+    if "u" in suffix:
+        candidates = ["ulong"] if "l" in suffix else ["uint", "ulong"]
+    elif "l" in suffix:
+        candidates = ["long"] if decimal_base else ["long", "ulong"]
+    else:
+        candidates = ["int", "long"] if decimal_base else ["int", "uint", "long", "ulong"]
+    for candidate in candidates:
+        if value <= _INTEGER_MAX[candidate]:
+            return candidate
+    return None
+
+
+def _parse_integer(text):
+    # Returns (value, type, suffix) or None when text isn't an integer
+    # literal.
+    match = _INTEGER_LITERAL.match(text)
+    if match is None:
+        return None
+    (digits, suffix) = match.groups()
+    if digits[:2] in ("0x", "0X"):
+        (value, decimal_base) = (int(digits, 16), False)
+    elif len(digits) > 1 and digits[0] == "0":
+        (value, decimal_base) = (int(digits, 8), False)
+    else:
+        (value, decimal_base) = (int(digits), True)
+    value_type = _integer_type(value, decimal_base, suffix)
+    if value_type is None:
+        return None
+    return (value, value_type, suffix)
+
+
+def compact_integer(text):
+    """Return the shortest of text and its decimal and hexadecimal spellings
+    that has the same type. For example, 0xFF becomes 255 but 0xFFFFFFFF is
+    kept because 4294967295 would be a long instead of an uint.
+    """
+
+    parsed = _parse_integer(text)
+    if parsed is None:
+        return text
+    (value, value_type, suffix) = parsed
+    spellings = [text]
+    for (spelling, decimal_base) in [("%i" % value, True), ("0x%x" % value, False)]:
+        if _integer_type(value, decimal_base, suffix) == value_type:
+            spellings.append(spelling + suffix)
+    return min(spellings, key=len)
+
+
+def _round_float32(value):
+    # Round a non-negative Fraction to the nearest float, ties to even, and
+    # return its exact value. Returns None when value overflows.
+    if value == 0:
+        return Fraction(0)
+    exponent = value.numerator.bit_length() - value.denominator.bit_length() - 24
+    while value / Fraction(2) ** exponent >= 2 ** 24:
+        exponent += 1
+    while value / Fraction(2) ** exponent < 2 ** 23:
+        exponent -= 1
+    exponent = max(exponent, -149)  # Denormals all share the smallest exponent.
+    scaled = value / Fraction(2) ** exponent
+    mantissa = scaled.numerator // scaled.denominator
+    remainder = scaled - mantissa
+    if remainder > Fraction(1, 2) or (remainder == Fraction(1, 2) and mantissa % 2 == 1):
+        mantissa += 1
+    result = mantissa * Fraction(2) ** exponent
+    if result > _FLOAT32_MAX:
+        return None
+    return result
+
+
+def _spell_decimal(digits, exponent):
+    # The shortest floating point spelling of int(digits) * 10 ** exponent.
+    # Positional notation is preferred when scientific notation isn't
+    # shorter.
+    if exponent >= 0:
+        spellings = [digits + "0" * exponent + "."]
+    elif len(digits) > -exponent:
+        spellings = [digits[:exponent] + "." + digits[exponent:]]
+    else:
+        spellings = ["." + "0" * (-exponent - len(digits)) + digits]
+    for split in range(len(digits) + 1):
+        mantissa = digits if split == len(digits) else digits[:split] + "." + digits[split:]
+        spellings.append("%se%i" % (mantissa, exponent + len(digits) - split))
+    return min(spellings, key=len)
+
+
+def _decimal_parts(value):
+    # Digits without trailing zeros and the power of ten they're scaled by.
+    (_, digits, exponent) = value.normalize(decimal.Context(prec=100)).as_tuple()
+    return ("".join(str(digit) for digit in digits), exponent)
+
+
+def _shortest_float(targets, accept):
+    # Round each target to more and more significant digits until a spelling
+    # is accepted. The first target is the exact value of the original
+    # literal, so a spelling is always found once all of its digits are used.
+    max_digits = len(_decimal_parts(targets[0])[0])
+    for precision in range(1, max_digits + 1):
+        context = decimal.Context(prec=precision, rounding=decimal.ROUND_HALF_EVEN)
+        for target in targets:
+            candidate = context.plus(target)
+            if accept(Fraction(candidate)):
+                return _spell_decimal(*_decimal_parts(candidate))
+    return _spell_decimal(*_decimal_parts(targets[0]))
+
+
+def _decimal(value):
+    return decimal.Decimal(value.numerator) / decimal.Decimal(value.denominator)
+
+
+def compact_float(text):
+    """Return the shortest spelling of a decimal floating point literal that
+    rounds to the same value. For example, 1.0f becomes 1.f and 0.50000f
+    becomes .5f. Literals without a suffix are doubles, or floats on devices
+    without double precision support, so they must round to the same value
+    as both.
+    """
+
+    match = _FLOAT_LITERAL.match(text)
+    if match is None:
+        return text
+    (number, suffix) = match.groups()
+    exact = decimal.Decimal(number)
+    value32 = _round_float32(Fraction(exact))
+    if suffix:
+        if value32 is None:
+            return text
+        targets = [exact, decimal.Context(prec=9).plus(_decimal(value32))]
+        accept = lambda candidate: _round_float32(candidate) == value32
+    else:
+        value64 = float(number)
+        if value64 == float("inf"):
+            return text
+        targets = [exact]
+        accept = lambda candidate: float(candidate) == value64 and _round_float32(candidate) == value32
+    spelling = _shortest_float(targets, accept) + suffix
+    return spelling if len(spelling) < len(text) else text
+
+
+def compact_literal(text):
+    """Return the shortest spelling of a numeric literal with the same value
+    and type. Other literals are returned unchanged.
+    """
+
+    if _INTEGER_LITERAL.match(text):
+        return compact_integer(text)
+    return compact_float(text)
+
+
+def _fold_integer(op, left, right):
+    # Returns the literal for left op right or None when it can't be folded
+    # without changing behavior. Both operands must have the same type so no
+    # conversions are involved and only non-negative results are kept since
+    # a negative literal doesn't exist.
+    left = _parse_integer(left)
+    right = _parse_integer(right)
+    if left is None or right is None or left[1] != right[1]:
+        return None
+    (a, value_type, _) = left
+    b = right[0]
+    bits = _INTEGER_BITS[value_type]
+    if op in ("/", "%") and b == 0:
+        return None
+    if op in ("<<", ">>") and b >= bits:
+        return None
+    operations = {
+        "+": lambda: a + b,
+        "-": lambda: a - b,
+        "*": lambda: a * b,
+        "/": lambda: a // b,
+        "%": lambda: a % b,
+        "<<": lambda: a << b,
+        ">>": lambda: a >> b,
+        "&": lambda: a & b,
+        "|": lambda: a | b,
+        "^": lambda: a ^ b,
+    }
+    comparisons = {
+        "<": lambda: a < b,
+        "<=": lambda: a <= b,
+        ">": lambda: a > b,
+        ">=": lambda: a >= b,
+        "==": lambda: a == b,
+        "!=": lambda: a != b,
+        "&&": lambda: bool(a and b),
+        "||": lambda: bool(a or b),
+    }
+    if op in comparisons:
+        return "1" if comparisons[op]() else "0"
+    if op not in operations:
+        return None
+    result = operations[op]()
+    if value_type.startswith("u"):
+        # Unsigned arithmetic wraps.
+        result %= 2 ** bits
+    elif result < 0 or result > _INTEGER_MAX[value_type]:
+        return None  # Signed overflow is undefined.
+    return compact_integer("%i%s" % (result, _INTEGER_SUFFIX[value_type]))
+
+
+def _fold_float(op, left, right):
+    # Addition, subtraction, and multiplication of floats are correctly
+    # rounded in OpenCL, so they are computed exactly and rounded once to the
+    # nearest float. Division isn't required to be correctly rounded. Results
+    # and operands that are denormal are skipped because devices may flush
+    # them to zero.
+    left = _FLOAT_LITERAL.match(left)
+    right = _FLOAT_LITERAL.match(right)
+    if op not in ("+", "-", "*") or left is None or right is None or not left.group(2) or not right.group(2):
+        return None
+    a = _round_float32(Fraction(decimal.Decimal(left.group(1))))
+    b = _round_float32(Fraction(decimal.Decimal(right.group(1))))
+    if a is None or b is None or 0 < a < _FLOAT32_MIN_NORMAL or 0 < b < _FLOAT32_MIN_NORMAL:
+        return None
+    result = {"+": a + b, "-": a - b, "*": a * b}[op]
+    if result < 0:
+        return None
+    result = _round_float32(result)
+    if result is None or 0 < result < _FLOAT32_MIN_NORMAL:
+        return None
+    accept = lambda candidate: _round_float32(candidate) == result
+    return _shortest_float([decimal.Context(prec=9).plus(_decimal(result))], accept) + "f"
+
+
+class ConstantFolder(object):
+    """Replace binary operations on numeric literals with the literal they
+    evaluate to when it is no longer than the operation. Folding float
+    operations is optional because the result is only exact when the device
+    doesn't use a different rounding mode for constants, such as with
+    -cl-fast-relaxed-math.
+    """
+
+    # Name of each child from Node.children() split into the attribute and
+    # the optional list index.
+    _CHILD_NAME = re.compile(r"^(\w+)(?:\[(\d+)\])?$")
+
+    def __init__(self, fold_floats=False):
+        self.fold_floats = fold_floats
+
+    def fold(self, node, contractable=False):
+        """Fold every operation below node and return node or the literal
+        that replaces it.
+        """
+
+        # A multiplication that is an operand of an addition or subtraction
+        # may be contracted into a fused multiply-add, which is rounded
+        # differently, so it's left alone. Negation doesn't prevent
+        # contraction.
+        if isinstance(node, c_ast.BinaryOp):
+            child_contractable = node.op in ("+", "-")
+        else:
+            child_contractable = contractable and isinstance(node, c_ast.UnaryOp) and node.op in ("-", "+")
+
+        for (name, child) in node.children():
+            folded = self.fold(child, child_contractable)
+            if folded is not child:
+                (attribute, index) = self._CHILD_NAME.match(name).groups()
+                if index is None:
+                    setattr(node, attribute, folded)
+                else:
+                    getattr(node, attribute)[int(index)] = folded
+
+        if not isinstance(node, c_ast.BinaryOp):
+            return node
+        if not isinstance(node.left, c_ast.Constant) or not isinstance(node.right, c_ast.Constant):
+            return node
+        left = compact_literal(node.left.value)
+        right = compact_literal(node.right.value)
+        value = _fold_integer(node.op, left, right)
+        value_type = "int"
+        if value is None and self.fold_floats and not (contractable and node.op == "*"):
+            value = _fold_float(node.op, left, right)
+            value_type = "float"
+        if value is None or len(value) > len(left) + len(node.op) + len(right):
+            return node
+        return c_ast.Constant(value_type, value, node.coord)
@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import json
+from oclminify.header import _c_string, _header_names
+from oclminify.kernel_args import ACCESS_QUALIFIERS, ADDRESS_QUALIFIERS
+
+
+def _kernel_args(result, name):
+    # Full argument descriptions when the minifier produced them, otherwise
+    # only the names.
+    if result.kernel_arg_info.get(name):
+        return result.kernel_arg_info[name]
+    args = []
+    for (index, (arg, new_arg)) in enumerate(result.kernel_args[name].items()):
+        args.append(OrderedDict([("index", index), ("name", arg), ("minified_name", new_arg)]))
+    return args
+
+
+def generate_manifest(input_path, result):
+    """Describe the kernels in result, a MinifyResult, as a dict containing
+    only JSON compatible types. Kernels and their arguments are listed in
+    declaration order with their original and minified names, and each
+    argument with its address and access qualifiers, type, vector width, and
+    size, so applications can set up buffers and bind arguments without
+    calling clGetKernelArgInfo().
+    """
+
+    kernels = []
+    for (name, new_name) in result.kernel_names.items():
+        kernels.append(OrderedDict([("name", name), ("minified_name", new_name), ("args", _kernel_args(result, name))]))
+    return OrderedDict([
+        ("source", input_path),
+        ("original_size", result.original_size),
+        ("minified_size", result.minified_size),
+        ("kernels", kernels),
+    ])
+
+
+def generate_manifest_json(input_path, result):
+    return json.dumps(generate_manifest(input_path, result), indent=2) + "\n"
+
+
+def generate_manifest_header(input_path, result):
+    """Write the manifest as a C header of defines. Qualifiers use the values
+    of the matching cl_kernel_arg_address_qualifier and
+    cl_kernel_arg_access_qualifier constants. Every name has a MANIFEST
+    infix so the header can be included alongside the one made with
+    --header.
+    """
+
+    (guard_name, prefix) = _header_names(input_path)
+    guard_name = guard_name[:-len("_DATA_H")] + "_MANIFEST_H"
+    prefix += "_MANIFEST"
+    text = "#ifndef %s\n#define %s\n\n" % (guard_name, guard_name)
+    text += "#define %s_NUM_KERNELS %i\n\n" % (prefix, len(result.kernel_names))
+    for (name, new_name) in result.kernel_names.items():
+        kernel_prefix = "%s_KERNEL_%s" % (prefix, name.upper())
+        args = _kernel_args(result, name)
+        text += "#define %s_NAME %s\n" % (kernel_prefix, _c_string(new_name))
+        text += "#define %s_NUM_ARGS %i\n" % (kernel_prefix, len(args))
+        for arg in args:
+            arg_prefix = "%s_ARG_%s" % (kernel_prefix, arg["name"].upper())
+            text += "#define %s_INDEX %i\n" % (arg_prefix, arg["index"])
+            text += "#define %s_NAME %s\n" % (arg_prefix, _c_string(arg["minified_name"]))
+            if "address_qualifier" not in arg:
+                continue
+            text += "#define %s_ADDRESS_QUALIFIER 0x%X /* CL_KERNEL_ARG_ADDRESS_%s */\n" % (arg_prefix, ADDRESS_QUALIFIERS[arg["address_qualifier"]], arg["address_qualifier"].upper())
+            text += "#define %s_ACCESS_QUALIFIER 0x%X /* CL_KERNEL_ARG_ACCESS_%s */\n" % (arg_prefix, ACCESS_QUALIFIERS[arg["access_qualifier"]], arg["access_qualifier"].upper())
+            text += "#define %s_TYPE %s\n" % (arg_prefix, _c_string(arg["type"] or ""))
+            text += "#define %s_POINTER %i\n" % (arg_prefix, 1 if arg["pointer"] else 0)
+            text += "#define %s_VECTOR_WIDTH %i\n" % (arg_prefix, arg["vector_width"])
+            if arg["size"] is not None:
+                text += "#define %s_SIZE %i\n" % (arg_prefix, arg["size"])
+        text += "\n"
+    text += "#endif"
+    return text
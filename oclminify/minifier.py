@@ -2,10 +2,26 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import copy
-import itertools
-import sys
+import string
 from pycparser import c_ast
+from oclminify.dead_code import DeadCodeEliminator
+from oclminify.diagnostics import Diagnostics
+from oclminify.errors import UnsupportedNodeError
+from oclminify.functions import BUILTIN
+from oclminify.kernel_args import describe_argument, resolve_type
+from oclminify.lexer import OpenCLCLexer
+from oclminify.literals import ConstantFolder, compact_literal
 from oclminify.parser import Parser
+from oclminify.swizzle import compose, parse_accessor, parse_vector_type, shortest_accessor, vector_type
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = dict  # Python 2. Only _struct_to_declaration() adds children and it uses its own dict.
+
+# Shared by every declaration without children, which is nearly all of them,
+# so each one doesn't need its own dict.
+_NO_CHILDREN = MappingProxyType({})
 
 
 class Minifier(c_ast.NodeVisitor):
@@ -64,17 +80,27 @@ class Minifier(c_ast.NodeVisitor):
         "memory_scope_device",
         "memory_scope_all_svm_devices",
     ]
+    # Keywords, type names, and names of built-in functions and constants
+    # that a generated name must not be, or it would be a syntax error or
+    # hide a built-in.
+    RESERVED_NAMES = frozenset(set(OpenCLCLexer.keyword_map) | IGNORE_TYPE_SYMBOLS | set(CONSTANT_SYMBOLS) |
+                               set(BUILTIN.CONSTANTS) | set(BUILTIN.CAST_FUNCTIONS) | set(BUILTIN.GEN1_FUNCTIONS) |
+                               set(BUILTIN.GEN2_FUNCTIONS) | set(BUILTIN.FIXED_FUNCTIONS_MAP) | set(BUILTIN.OTHER_FUNCTIONS_MAP))
 
     class Function(object):
+        __slots__ = ("name", "return_type")
+
         def __init__(self, name="", return_type=None):
             self.name = name
             self.return_type = return_type
 
     class Declaration(object):
+        __slots__ = ("name", "type", "children", "is_definition")
+
         def __init__(self):
             self.name = ""
             self.type = ""
-            self.children = {}
+            self.children = _NO_CHILDREN
             self.is_definition = False
 
         def __eq__(self, other):
@@ -86,27 +112,63 @@ class Minifier(c_ast.NodeVisitor):
                 return NotImplemented
 
         def __repr__(self):
-            return "(%s) %s %s" % (self.type, self.name, repr(self.children))
-
-    def __init__(self, replace_kernel_names, global_postfix):
+            return "(%s) %s %s" % (self.type, self.name, repr(dict(self.children)))
+
+    class Scope(dict):
+        # Declarations visible in a block by their original name. Original
+        # names are also indexed by new name so looking up a new name doesn't
+        # scan every declaration. Every generated name with an index below
+        # name_hint is known to be in use.
+        __slots__ = ("new_names", "name_hint")
+
+        def __init__(self, name_hint=0):
+            dict.__init__(self)
+            self.new_names = {}
+            self.name_hint = name_hint
+
+        def __setitem__(self, name, declaration):
+            previous = self.get(name)
+            if previous is None or previous.name != declaration.name:
+                if previous is not None:
+                    self._unindex(name, previous.name)
+                self.new_names.setdefault(declaration.name, []).append(name)
+            dict.__setitem__(self, name, declaration)
+
+        def _unindex(self, name, new_name):
+            names = self.new_names[new_name]
+            names.remove(name)
+            if not names:
+                del self.new_names[new_name]
+                self.name_hint = 0  # The new name can be given out again.
+
+    def __init__(self, replace_kernel_names, global_postfix, diagnostics=None, share_global_names=False, fold_float_constants=False, remove_dead_code=False):
         self.functions = {}
         self.functions_args = {}
+        self.functions_arg_order = {}
+        self.functions_arg_info = {}
         self.kernel_functions = []
-        self.declaration_scopes = [{}]
+        self.typedefs = {}  # Original name of each typedef to the type it resolves to.
+        self.declaration_scopes = [Minifier.Scope()]
+        self._function_new_names = {}  # New name of each function to its original name.
+        self._types = {}  # Interned type names so equal types share one tuple.
         self.replace_kernel_names = replace_kernel_names
         self.global_postfix = global_postfix
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+        # When the same Minifier visits every source of a program, global
+        # symbols declared by more than one source keep a single new name.
+        self.share_global_names = share_global_names
+        self.fold_float_constants = fold_float_constants
+        self.remove_dead_code = remove_dead_code
 
     def generic_visit(self, node):
         if node is None:
             return
         else:
-            print("FOUND UNSUPPORTED NODE: " + str(node), file=sys.stderr)
-            print("Could not find method Minifier.visit_%s" % node.__class__.__name__, file=sys.stderr)
-            node.show()
-            sys.exit(-1)
+            raise UnsupportedNodeError(node)
 
     def visit_Constant(self, node):
-        pass  # Unused.
+        if node.type in ("int", "float"):
+            node.value = compact_literal(node.value)
 
     def visit_ID(self, node):
         node.name = self._get_new_declaration_name(node.name)
@@ -127,14 +189,18 @@ class Minifier(c_ast.NodeVisitor):
         # Walk through struct references in outer most order first
         # (ie. first.second.third). This way we can check the type of the
         # current reference when it's a member of another struct.
-        last_ref_type = []
+        last_ref_type = ()
+        last_swizzle = None
         for node_ref in reversed(refs):
             if not isinstance(node_ref.name, c_ast.StructRef):
                 self.visit(node_ref.name)
             decl_type = self._get_structref_type(node_ref)
+            inner_swizzle = None
             if decl_type is None:
                 decl_type = last_ref_type
-            last_ref_type = []
+                inner_swizzle = last_swizzle
+            last_ref_type = ()
+            last_swizzle = None
 
             # If accessing an anonymous struct, try and use the shortened IDs.
             if isinstance(decl_type, Minifier.Declaration):
@@ -145,18 +211,21 @@ class Minifier(c_ast.NodeVisitor):
                     last_ref_type = child.type
             elif len(decl_type) == 1:
                 # If accessing indices of a vector, try and shorten the syntax.
-                vector_components = "".join([char for char in decl_type[0] if char.isdigit()])
-                vector_types = ["".join(a) for a in itertools.product(["char", "uchar", "short", "ushort", "int", "uint", "long", "ulong", "float", "double", "half"], ["2", "3", "4", "8", "16"])]
-                if decl_type[0] in vector_types:
-                    node_ref.field.name = self._shorten_vector_access(int(vector_components), node_ref.field.name)
+                # The type of the result is kept so accessors applied to it
+                # can be shortened too.
+                vector = parse_vector_type(decl_type[0])
+                if vector is not None:
+                    last_swizzle = self._shorten_vector_access(node_ref, vector[1], inner_swizzle)
+                    if last_swizzle is not None:
+                        last_ref_type = self._intern_type([vector_type(vector[0], len(last_swizzle[1]))])
                 # If accessing a struct, try and use the shortened IDs.
                 if decl_type[0] not in self.IGNORE_TYPE_SYMBOLS:
                     declaration = self._get_declaration_by_new_name(decl_type[0])
                     if declaration and declaration.type == "struct":
                         if node_ref.field.name in declaration.children:
                             last_ref_type = declaration.children[node_ref.field.name].type
-                            if not isinstance(last_ref_type, list) and not isinstance(last_ref_type, Minifier.Declaration):
-                                last_ref_type = [last_ref_type, ]
+                            if not isinstance(last_ref_type, (list, tuple)) and not isinstance(last_ref_type, Minifier.Declaration):
+                                last_ref_type = self._intern_type([last_ref_type])
                             node_ref.field.name = declaration.children[node_ref.field.name].name
 
     def visit_FuncCall(self, node):
@@ -214,11 +283,16 @@ class Minifier(c_ast.NodeVisitor):
             self.visit(expr)
 
     def visit_FileAST(self, node):
+        # Fold constant expressions first so the results are compacted like
+        # any other literal.
+        ConstantFolder(self.fold_float_constants).fold(node)
+        if self.remove_dead_code:
+            DeadCodeEliminator().eliminate(node)
         for ext in node.ext:
             self.visit(ext)
 
     def visit_Compound(self, node):
-        self.declaration_scopes.append({})
+        self._push_scope()
         if node.block_items is not None:
             for item in node.block_items:
                 self.visit(item)
@@ -274,15 +348,21 @@ class Minifier(c_ast.NodeVisitor):
         if "__kernel" in node.decl.funcspec and not self.replace_kernel_names:
             new_name = old_name
         else:
-            new_name = self._generate_unique_declaration_name()
+            new_name = self._generate_global_name(old_name)
         node.decl.type.type.declname = new_name
 
-        self.functions[old_name] = Minifier.Function(new_name, [])  # Reserve the function name.
-        self.declaration_scopes.append({})
+        self._set_function(old_name, Minifier.Function(new_name, []))  # Reserve the function name.
+        params = node.decl.type.args.params if node.decl.type.args else []
+        self.functions_arg_order[old_name] = [param.name for param in params if getattr(param, "name", None)]
+        if "__kernel" in node.decl.funcspec:
+            # Described before the types are minified so typedefs can be
+            # resolved by their original names.
+            self.functions_arg_info[old_name] = [describe_argument(index, param, self.typedefs) for (index, param) in enumerate(params) if getattr(param, "name", None)]
+        self._push_scope()
         self.visit(node.decl.type.type.type)  # Return type
         self.visit(node.decl.type.args)  # Args
         self.functions_args[old_name] = self.declaration_scopes[-1]
-        self.functions[old_name] = Minifier.Function(new_name, node.decl.type.type.type)  # Include return type after it's processed.
+        self._set_function(old_name, Minifier.Function(new_name, node.decl.type.type.type))  # Include return type after it's processed.
 
         self.visit(node.body)
         self.declaration_scopes.pop()
@@ -295,12 +375,12 @@ class Minifier(c_ast.NodeVisitor):
 
     def visit_TypeDecl(self, node):
         self.visit(node.type)
-        new_name = self._generate_unique_declaration_name()
+        new_name = self._generate_global_name(node.declname)
         decl = Minifier.Declaration()
         decl.name = new_name
 
         if "names" in node.type.attr_names:
-            decl.type = node.type.names
+            decl.type = self._intern_type(node.type.names)
         elif isinstance(node.type, c_ast.Struct) and node.type.name is None:
             decl.type = self._struct_to_declaration(node.type)
         elif isinstance(node.type, c_ast.Struct):
@@ -308,9 +388,9 @@ class Minifier(c_ast.NodeVisitor):
 
         if decl.type is None:
             if "name" in node.type.attr_names:
-                decl.type = [node.type.name, ]
+                decl.type = self._intern_type([node.type.name])
             else:
-                print("DEBUG: No types for %s" % node.declname, file=sys.stderr)
+                self.diagnostics.report("No types for %s", node.declname)
 
         self.declaration_scopes[-1][node.declname] = decl
         node.declname = new_name
@@ -325,6 +405,7 @@ class Minifier(c_ast.NodeVisitor):
         self.visit(node.stmt)
 
     def visit_Typedef(self, node):
+        self.typedefs[node.name] = resolve_type(node.type, self.typedefs, node.name)
         self.visit(node.type)
 
     def visit_TypeDeclExt(self, node):
@@ -356,7 +437,7 @@ class Minifier(c_ast.NodeVisitor):
             # worth the added complexity.
             if node.values:
                 old_name = node.name
-                node.name = self._generate_unique_declaration_name()
+                node.name = self._generate_global_name(old_name)
                 self.declaration_scopes[-1][old_name] = node
             # Enum is being declared as a type of a variable, just get the
             # new name.
@@ -367,7 +448,7 @@ class Minifier(c_ast.NodeVisitor):
         if node.values:
             for enum in node.values.enumerators:
                 old_name = enum.name
-                enum.name = self._generate_unique_declaration_name()
+                enum.name = self._generate_global_name(old_name)
                 self.declaration_scopes[-1][old_name] = enum
 
     def visit_EmptyStatement(self, node):
@@ -412,20 +493,28 @@ class Minifier(c_ast.NodeVisitor):
 
     def _index_to_alpha_str(self, index):
         # TODO: Make this alpha numeric for the first character only and alpha numeric + other supported symbols for the rest.
-        if index == 0:
-            return 'a'
-        characters = list(range(ord('a'), ord('z') + 1)) + list(range(ord('A'), ord('Z') + 1))
+        # Bijective base 52 so every index has its own name: a to Z, then aa
+        # to ZZ, then aaa and so on.
+        characters = string.ascii_lowercase + string.ascii_uppercase
         result = ""
-        digit = 1
-        while index >= 0:
-            digit_min_value = len(characters) ** (digit - 1)
-            if index < digit_min_value:
-                break
-            value = index % ((len(characters) ** digit) // len(characters) ** (digit - 1))
-            result += chr(characters[value])
-            index -= value
-            digit += 1
-        return "".join(reversed(result))
+        index += 1
+        while index > 0:
+            (index, value) = divmod(index - 1, len(characters))
+            result = characters[value] + result
+        return result
+
+    def _member_names(self, count):
+        # Names of the first count members of a struct. They only have to be
+        # unique within the struct.
+        reserved = self.RESERVED_NAMES
+        names = []
+        index = 0
+        while len(names) < count:
+            name = self._index_to_alpha_str(index)
+            if name not in reserved:
+                names.append(name)
+            index += 1
+        return names
 
     def _get_new_function_name(self, name):
         if name in self.functions:
@@ -434,30 +523,68 @@ class Minifier(c_ast.NodeVisitor):
         return name
 
     def _get_function_by_new_name(self, new_name):
-        for func in self.functions.values():
-            if func.name == new_name:
-                return func
+        old_name = self._function_new_names.get(new_name)
+        if old_name is not None and self.functions[old_name].name == new_name:
+            return self.functions[old_name]
         # Remaining functions are probably built-in.
         return None
 
+    def _set_function(self, old_name, function):
+        previous = self.functions.get(old_name)
+        if previous is not None and previous.name != function.name:
+            # The previous name can be given out again.
+            for scope in self.declaration_scopes:
+                scope.name_hint = 0
+        self.functions[old_name] = function
+        self._function_new_names.setdefault(function.name, old_name)
+
+    def _intern_type(self, names):
+        names = tuple(names)
+        return self._types.setdefault(names, names)
+
+    def _push_scope(self):
+        # Names generated in the global scope have the postfix appended, so
+        # its hint doesn't apply to the scopes inside of it.
+        name_hint = 0 if len(self.declaration_scopes) == 1 and self.global_postfix else self.declaration_scopes[-1].name_hint
+        scope = Minifier.Scope(name_hint)
+        self.declaration_scopes.append(scope)
+        return scope
+
     def _is_declaration_name_unique(self, name):
         for scope in self.declaration_scopes:
-            if name in [declaration.name for declaration in scope.values()]:
+            if name in scope.new_names:
                 return False
         return True
 
     def _generate_unique_declaration_name(self):
         postfix = self.global_postfix if len(self.declaration_scopes) == 1 else ""
 
-        index = 0
+        # Start at the first name that might not be in use. The hint is only
+        # moved past names that were checked since the name returned isn't
+        # necessarily declared by the caller.
+        scope = self.declaration_scopes[-1]
+        index = scope.name_hint
+        reserved = self.RESERVED_NAMES
         while True:
             name = self._index_to_alpha_str(index) + postfix
-            index += 1
             # Make sure declaration name is not currently in use within the
             # visible scope. Also make sure the declaration name does not shadow
             # an existing declaration name.
-            if self._is_declaration_name_unique(name) and not self._get_function_by_new_name(name):
+            if name not in reserved and self._is_declaration_name_unique(name) and not self._get_function_by_new_name(name):
                 return name
+            index += 1
+            scope.name_hint = index
+
+    def _generate_global_name(self, old_name):
+        # Reuse the name given to a global symbol with the same original name
+        # by a source that was visited earlier. Otherwise, the symbol is
+        # treated like any other declaration.
+        if self.share_global_names and len(self.declaration_scopes) == 1:
+            if old_name in self.functions:
+                return self.functions[old_name].name
+            if old_name in self.declaration_scopes[0]:
+                return self.declaration_scopes[0][old_name].name
+        return self._generate_unique_declaration_name()
 
     def _get_new_declaration_name(self, name):
         if name in self.CONSTANT_SYMBOLS:
@@ -466,7 +593,7 @@ class Minifier(c_ast.NodeVisitor):
         for scope in reversed(self.declaration_scopes):
             if name in scope:
                 return scope[name].name
-        print("Could not find new declaration name for '%s'" % name, file=sys.stderr)
+        self.diagnostics.report("Could not find new declaration name for '%s'", name)
         return name
 
     def _get_declaration_by_name(self, name, type_filters=None):
@@ -484,16 +611,16 @@ class Minifier(c_ast.NodeVisitor):
         for scope in reversed(self.declaration_scopes):
             if name in scope:
                 if is_type_in_filters(scope[name].type):
-                    return copy.deepcopy(scope[name])
-        print("Could not find new declaration for '%s'" % name, file=sys.stderr)
+                    return copy.copy(scope[name])
+        self.diagnostics.report("Could not find new declaration for '%s'", name)
 
     def _get_declaration_by_new_name(self, new_name, type_filter=None):
         for scope in reversed(self.declaration_scopes):
-            for declaration in scope.values():
-                if declaration.name == new_name:
-                    if type_filter is None or declaration.type == type_filter:
-                        return copy.deepcopy(declaration)
-        print("Could not find declaration with new name '%s'" % new_name, file=sys.stderr)
+            for name in scope.new_names.get(new_name, ()):
+                declaration = scope[name]
+                if type_filter is None or declaration.type == type_filter:
+                    return copy.copy(declaration)
+        self.diagnostics.report("Could not find declaration with new name '%s'", new_name)
         return None
 
     def _get_structref_type(self, node):
@@ -548,9 +675,7 @@ class Minifier(c_ast.NodeVisitor):
                 arg_type = get_expr_type(arg)
                 arg_types.append(arg_type)
 
-            from oclminify.functions import BUILTIN
-            result = BUILTIN.get_func_return_type(func_name, arg_types)
-            return result
+            return self._get_builtin_func_return_type(func_name, arg_types)
 
         # Find type of struct variable being referenced. It might be accessed
         # as the result of a function, after indexing into an array, or just
@@ -560,21 +685,26 @@ class Minifier(c_ast.NodeVisitor):
             return None # Special case. See above.
 
         result = get_expr_type(node.name)
-        if isinstance(result, Minifier.Declaration) or isinstance(result, list):
+        if isinstance(result, Minifier.Declaration) or isinstance(result, (list, tuple)):
             return result
-        return [result, ]
+        return self._intern_type([result])
+
+    def _get_builtin_func_return_type(self, func_name, arg_types):
+        return BUILTIN.get_func_return_type(func_name, arg_types)
 
     def _struct_to_declaration(self, node):
         declaration = Minifier.Declaration()
         declaration.type = "struct"
+        declaration.children = {}
         declaration.is_definition = True
 
         # Generate a short name for this struct.
-        declaration.name = self._generate_unique_declaration_name()
+        declaration.name = self._generate_global_name(node.name) if node.name else self._generate_unique_declaration_name()
 
         # Generate short names for each declaration in the struct.
-        self.declaration_scopes.append({node.name: declaration})
-        self.declaration_scopes.append({})  # Allow outer struct name, defined immediately above, to be shadowed.
+        self._push_scope()[node.name] = declaration
+        self._push_scope()  # Allow outer struct name, defined immediately above, to be shadowed.
+        member_names = self._member_names(len(node.decls))
         for index, node_decl in enumerate(node.decls):
             if isinstance(node_decl.type, c_ast.Struct):
                 minify_decl = self._struct_to_declaration(node_decl.type)
@@ -583,7 +713,7 @@ class Minifier(c_ast.NodeVisitor):
                 # Replace the generated name with a likely shorter one because
                 # this is the scope inside of a struct. We don't have to worry
                 # about shadowing.
-                new_declname = self._index_to_alpha_str(index)
+                new_declname = member_names[index]
                 minify_decl.name = new_declname
                 node_decl.type.name = new_declname
 
@@ -598,7 +728,7 @@ class Minifier(c_ast.NodeVisitor):
 
                 # Generate child declaration name. It just has to be unique to this
                 # struct, not to the scope or anything like that.
-                new_declname = self._index_to_alpha_str(index)
+                new_declname = member_names[index]
                 node_decl.type.declname = new_declname
 
                 # Save as a child declaration so can rewrite references to this
@@ -616,66 +746,35 @@ class Minifier(c_ast.NodeVisitor):
 
         return declaration
 
-    def _shorten_vector_access(cls, vector_component_count, vector_components_specified):
+    def _shorten_vector_access(self, node, vector_component_count, inner_swizzle=None):
+        # Replace the accessor of node with the shortest one selecting the
+        # same components. inner_swizzle is what this returned for node.name
+        # when it's a vector access too, like the .lo of v.lo.hi, in which
+        # case both are combined into a single accessor of the inner vector
+        # unless that's longer. Returns (vector component count, components)
+        # for the vector the accessor is applied to or None when the
+        # accessor isn't understood.
         assert(vector_component_count >= 1)
 
-        # For vectors where all components are being accessed in stored order,
-        # use a blank accessor. The entire accessor will be removed in the
-        # generation stage.
-        def sequential_fast_components():
-            return "xyzw"[:vector_component_count]
-
-        def sequential_components():
-            return "0123456789abcdef"[:vector_component_count]
-
-        if vector_components_specified == sequential_fast_components() or \
-           vector_components_specified == "s" + sequential_components():
-            return ""
-
-        # For vectors of 1-4 components in the form .s0123, convert to the form .xyzw.
-        # According to the standard, the .xyzw syntax is only valid for vectors with
-        # no more than 4 components.
-        # https://www.khronos.org/registry/cl/specs/opencl-1.1.pdf#page=165
-        if vector_component_count <= 4 and vector_components_specified.startswith("s"):
-            return "".join(map(lambda a: {"0": "x", "1": "y", "2": "z", "3": "w"}[a], vector_components_specified[1:]))
-
-        # For vectors of length 2 and 4 using the even and odd syntax, use the
-        # shorter .xyzw syntax.
-        if vector_component_count == 2 or vector_component_count == 4:
-            def even_fast_components():
-                return sequential_fast_components()[::2]
-
-            def odd_fast_components():
-                return sequential_fast_components()[1::2]
-
-            if vector_components_specified == "even":
-                return even_fast_components()
-            elif vector_components_specified == "odd":
-                return odd_fast_components()
-
-        # For vectors with more than 4 components matching specific patterns
-        # are shortened to use the lo, hi, even, and odd syntax.
-        # https://www.khronos.org/registry/cl/specs/opencl-1.1.pdf#page=167
-        elif vector_component_count > 4 and vector_components_specified.startswith("s"):
-            def lo_components():
-                return sequential_components()[:vector_component_count // 2]
-
-            def hi_components():
-                return sequential_components()[vector_component_count // 2:]
-
-            def even_components():
-                return sequential_components()[::2]
-
-            def odd_components():
-                return sequential_components()[1::2]
-
-            indices = vector_components_specified[1:].lower()
-            if indices == lo_components():
-                return "lo"
-            elif indices == hi_components():
-                return "hi"
-            elif indices == even_components():
-                return "even"
-            elif indices == odd_components():
-                return "odd"
-        return vector_components_specified
+        accessor = node.field.name
+        components = parse_accessor(vector_component_count, accessor)
+        if components is None:
+            return None
+        spelling = shortest_accessor(vector_component_count, components)
+        if len(spelling) <= len(accessor):
+            node.field.name = spelling
+        if inner_swizzle is None:
+            return (vector_component_count, components)
+
+        # Each accessor costs its length plus the dot unless it was removed.
+        def accessor_length(accessor):
+            return len(accessor) + 1 if accessor else 0
+
+        (inner_count, inner_components) = inner_swizzle
+        combined = compose(inner_components, accessor)
+        combined_spelling = shortest_accessor(inner_count, combined)
+        if accessor_length(combined_spelling) > accessor_length(node.name.field.name) + accessor_length(node.field.name):
+            return (vector_component_count, components)
+        node.name = node.name.name
+        node.field.name = combined_spelling
+        return (inner_count, combined)
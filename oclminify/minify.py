@@ -1,12 +1,16 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import os
-import subprocess
+import re
 import sys
-import tempfile
-from oclminify.generator import Generator
-from oclminify.minifier import Minifier
-from oclminify.parser import Parser
+import threading
+import timeit
+from oclminify.errors import MinifyError, ParseError, PreprocessError
+from oclminify.profiler import Profiler, _profile_call
+from oclminify.result import MinifyResult
+
+# The parser, minifier, and generator pull in pycparser and PLY which are
+# slow to import, so they are only imported once minifying actually starts.
 
 
 DEFAULT_PREPROCESSOR_COMMAND = "gcc -E -undef -P -std=c99 -"
@@ -14,14 +18,18 @@ DEFAULT_PREPROCESSOR_NO_STDIN = False
 DEFAULT_MINIFY = True
 DEFAULT_MINIFY_KERNEL_NAMES = True
 DEFAULT_GLOBAL_POSTFIX = ""
+DEFAULT_FOLD_FLOAT_CONSTANTS = False
+DEFAULT_REMOVE_DEAD_CODE = False
 
+# Arguments appended to the preprocessor command, followed by a file path, to
+# have it list every file it reads in a Makefile style dependency file. These
+# are understood by GCC and Clang.
+DEPENDENCY_ARGS = ["-MD", "-MF"]
 
-def _do_minify(data,
-               preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
-               preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
-               minify=DEFAULT_MINIFY,
-               minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
-               global_postfix=DEFAULT_GLOBAL_POSTFIX):
+
+def _preprocessor_args(data, preprocessor_command, preprocessor_no_stdin, dependency_file=None):
+    # Returns the data to send over stdin, the command arguments, and the path
+    # of a temporary input file that must be removed afterwards, if any.
     if isinstance(data, str) and sys.version_info.major >= 3:
         data = data.encode("utf-8", "ignore")
 
@@ -30,57 +38,366 @@ def _do_minify(data,
     # source file using stdin.
     temp_input_file = None
     if preprocessor_no_stdin:
+        import tempfile
         temp_input_file = tempfile.NamedTemporaryFile(delete=False)
         temp_input_file.write(data)
         temp_input_file.close()
         temp_input_file = temp_input_file.name
         preprocessor_command += " " + temp_input_file
+    args = preprocessor_command.split(" ")
+    if dependency_file:
+        args += DEPENDENCY_ARGS + [dependency_file, ]
+    return (data, args, temp_input_file)
 
-    # Use GCC to do the preprocessing.
-    p = subprocess.Popen(preprocessor_command.split(" "),
-                         stdin=subprocess.PIPE,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-    data, err = p.communicate(data)
+
+def _read_dependencies(path, ignore=None):
+    # Parse a Makefile style dependency file written by the preprocessor and
+    # return the absolute path of every file listed as a prerequisite except
+    # stdin and the paths in ignore.
+    with open(path, "r") as fd:
+        text = fd.read().replace("\\\n", " ").replace("\\\r\n", " ")
+    ignore = set(os.path.abspath(ignored) for ignored in (ignore or []))
+
+    dependencies = []
+    for rule in text.split("\n"):
+        # Skip the target, being careful about drive letters on Windows.
+        match = re.search(r":(\s|$)", rule)
+        if match is None:
+            continue
+        for name in re.findall(r"(?:\\.|[^\s\\])+", rule[match.end():]):
+            name = re.sub(r"\\([ #])", r"\1", name).replace("$$", "$")
+            if name == "-" or name == "<stdin>":
+                continue
+            name = os.path.abspath(name)
+            if name not in ignore and name not in dependencies:
+                dependencies.append(name)
+    return dependencies
+
+
+def _preprocessor_output(data, err, returncode):
     err = err.decode("utf-8").replace("\r","")
+    if returncode != 0:
+        raise PreprocessError(returncode, err)
     if err:
         print(err, file=sys.stderr)
-    if temp_input_file:
-        # Clean-up temporary file if one was used above.
-        os.remove(temp_input_file)
-    if p.returncode != 0:
-        print("Failed to preprocess file", file=sys.stderr)
-        sys.exit(-1)
     data = data.decode("utf-8")
     data = data.replace("\r", "")  # Strip Windows newline character added by GCC on Windows.
+    return data
+
+
+def _preprocess(data,
+                preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
+                preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
+                dependencies=None):
+    # When dependencies is a list, the path of every file read by the
+    # preprocessor is appended to it.
+    import subprocess
+    dependency_file = None
+    if dependencies is not None:
+        import tempfile
+        (fd, dependency_file) = tempfile.mkstemp(suffix=".d")
+        os.close(fd)
+    (data, args, temp_input_file) = _preprocessor_args(data, preprocessor_command, preprocessor_no_stdin, dependency_file)
+
+    # Use GCC to do the preprocessing.
+    try:
+        p = subprocess.Popen(args,
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        data, err = p.communicate(data)
+    finally:
+        if temp_input_file:
+            # Clean-up temporary file if one was used above.
+            os.remove(temp_input_file)
+    try:
+        # The files read are still listed when there's an error, like in an
+        # included file, unless the preprocessor stopped without writing them.
+        if dependency_file and os.path.exists(dependency_file):
+            dependencies.extend(_read_dependencies(dependency_file, [temp_input_file] if temp_input_file else []))
+        data = _preprocessor_output(data, err, p.returncode)
+    finally:
+        if dependency_file and os.path.exists(dependency_file):
+            os.remove(dependency_file)
+    return data
+
+
+# Building a Parser generates its parse tables which takes a while, so each
+# thread keeps one around for reuse. Parsers hold state while parsing and are
+# never shared between threads. PLY sets module level variables while building
+# the tables, so construction is serialized.
+_thread_parsers = threading.local()
+_parser_construction_lock = threading.Lock()
+
+
+def _create_parser():
+    from oclminify.parser import Parser
+    with _parser_construction_lock:
+        return Parser()
+
+
+def _get_parser(profiler=None, timings=None):
+    parser = getattr(_thread_parsers, "parser", None)
+    if parser is None:
+        parser = _run_stage(profiler, timings, "parse", "Parser.__init__", _create_parser)
+        _thread_parsers.parser = parser
+    return parser
+
+
+def _parse(data, profiler=None, timings=None, parse_cache=None):
+    from pycparser import plyparser
+    if parse_cache is not None:
+        key = parse_cache.key(data)
+        ast = _run_stage(profiler, timings, "parse", "ParseCache.get", parse_cache.get, key)
+        if ast is not None:
+            return ast
+
+    parser = _get_parser(profiler, timings)
+    try:
+        ast = _run_stage(profiler, timings, "parse", "Parser.parse", parser.parse, data)
+    except plyparser.ParseError as e:
+        # The lexer can be left in the middle of a directive after an error,
+        # so the parser is replaced instead of being reused.
+        _thread_parsers.parser = None
+        raise ParseError.from_pycparser(e)
+    if parse_cache is not None:
+        _run_stage(profiler, timings, "parse", "ParseCache.put", parse_cache.put, key, ast)
+    return ast
+
+
+def _run_stage(profiler, timings, stage, name, func, *args):
+    # Time func as part of stage, which is accumulated into timings when it is
+    # not None.
+    start = timeit.default_timer()
+    result = _profile_call(profiler, name, func, *args)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + timeit.default_timer() - start
+    return result
+
+
+def _minify_preprocessed(data,
+                         minify=DEFAULT_MINIFY,
+                         minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
+                         global_postfix=DEFAULT_GLOBAL_POSTFIX,
+                         fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+                         remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+                         profiler=None,
+                         diagnostics=None,
+                         timings=None,
+                         minifier=None,
+                         parse_cache=None):
+    from oclminify.generator import Generator
+    from oclminify.minifier import Minifier
     preprocessed_data = data
 
-    parser = Parser()
-    ast = parser.parse(data)
+    ast = _parse(data, profiler, timings, parse_cache)
 
     # Uncomment when debugging to show the parsed graph.
     # ast.show()
 
     # Walk source tree graph and apply minification. The minifier is run even
     # when not minifying so we can collect kernel names for header output.
-    minifier = Minifier(minify_kernel_names, global_postfix)
-    minifier.visit(ast)
+    if minifier is None:
+        minifier = Minifier(minify_kernel_names, global_postfix, diagnostics, fold_float_constants=fold_float_constants, remove_dead_code=remove_dead_code)
+        if profiler:
+            profiler.instrument(minifier, "Minifier", Profiler.MINIFIER_HELPERS)
+    _run_stage(profiler, timings, "minify", "Minifier.visit", minifier.visit, ast)
     if minify:
-        data = Generator().visit(ast)
+        generator = Generator()
+        if profiler:
+            profiler.instrument(generator, "Generator", Profiler.GENERATOR_HELPERS)
+        data = _run_stage(profiler, timings, "generate", "Generator.visit", generator.visit, ast)
     else:
         data = preprocessed_data
     return (minifier, data)
 
 
+def _do_minify(data,
+               preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
+               preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
+               minify=DEFAULT_MINIFY,
+               minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
+               global_postfix=DEFAULT_GLOBAL_POSTFIX,
+               fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+               remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+               profiler=None,
+               diagnostics=None,
+               timings=None,
+               dependencies=None,
+               parse_cache=None):
+    data = _run_stage(profiler, timings, "preprocess", "preprocess", _preprocess, data, preprocessor_command, preprocessor_no_stdin, dependencies)
+    return _minify_preprocessed(data, minify, minify_kernel_names, global_postfix, fold_float_constants, remove_dead_code, profiler, diagnostics, timings, parse_cache=parse_cache)
+
+
 def minify(data,
            preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
            preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
            minify=DEFAULT_MINIFY,
            minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
-           global_postfix=DEFAULT_GLOBAL_POSTFIX):
+           global_postfix=DEFAULT_GLOBAL_POSTFIX,
+           fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+           remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+           profiler=None,
+           diagnostics=None,
+           parse_cache=None):
+    """Minify data, an OpenCL source, and return the minified source.
+
+    parse_cache is an optional ParseCache from oclminify.parse_cache that lets
+    a source that is minified more than once, like with different options,
+    be parsed only once.
+    """
+
     return _do_minify(data,
                       preprocessor_command=preprocessor_command,
                       preprocessor_no_stdin=preprocessor_no_stdin,
                       minify=minify,
                       minify_kernel_names=minify_kernel_names,
-                      global_postfix=global_postfix)[1]
+                      global_postfix=global_postfix,
+                      fold_float_constants=fold_float_constants,
+                      remove_dead_code=remove_dead_code,
+                      profiler=profiler,
+                      diagnostics=diagnostics,
+                      parse_cache=parse_cache)[1]
+
+
+def minify_result(data,
+                  preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
+                  preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
+                  minify=DEFAULT_MINIFY,
+                  minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
+                  global_postfix=DEFAULT_GLOBAL_POSTFIX,
+                  fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+                  remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+                  profiler=None,
+                  diagnostics=None,
+                  dependencies=False,
+                  parse_cache=None):
+    """Same as minify() but returns a MinifyResult with the kernel and
+    argument name mappings, sizes, and the time spent in each stage. When
+    dependencies is True, the files read by the preprocessor are also listed.
+    This requires a GCC or Clang compatible preprocessor. The MinifyError
+    raised when minifying fails then has a dependencies attribute with the
+    files that were read before it failed.
+    """
+
+    timings = {}
+    dependency_list = [] if dependencies else None
+    try:
+        (minifier, output) = _do_minify(data,
+                                        preprocessor_command=preprocessor_command,
+                                        preprocessor_no_stdin=preprocessor_no_stdin,
+                                        minify=minify,
+                                        minify_kernel_names=minify_kernel_names,
+                                        global_postfix=global_postfix,
+                                        fold_float_constants=fold_float_constants,
+                                        remove_dead_code=remove_dead_code,
+                                        profiler=profiler,
+                                        diagnostics=diagnostics,
+                                        timings=timings,
+                                        dependencies=dependency_list,
+                                        parse_cache=parse_cache)
+    except MinifyError as e:
+        e.dependencies = dependency_list
+        raise
+    return MinifyResult.from_minifier(minifier, output, len(data), timings, dependency_list)
+
+
+def _whole_program_minifier(minify_kernel_names, fold_float_constants, remove_dead_code, profiler, diagnostics):
+    from oclminify.minifier import Minifier
+    minifier = Minifier(minify_kernel_names, "", diagnostics, share_global_names=True, fold_float_constants=fold_float_constants, remove_dead_code=remove_dead_code)
+    if profiler:
+        profiler.instrument(minifier, "Minifier", Profiler.MINIFIER_HELPERS)
+    return minifier
+
+
+def minify_whole_program(sources,
+                         preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
+                         preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
+                         minify=DEFAULT_MINIFY,
+                         minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
+                         fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+                         remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+                         profiler=None,
+                         diagnostics=None,
+                         dependencies=False,
+                         parse_cache=None):
+    """Minify a list of sources that are loaded into the same context and
+    return a MinifyResult for each in the same order. Global names are
+    allocated once from a table shared by every source, so names never collide
+    across sources and no postfix is needed. A global symbol with the same name
+    in several sources, like a helper from a shared header, gets the same new
+    name in each.
+
+    When a source fails, the MinifyError raised has a source_index attribute
+    with the position of the source in sources, and a dependencies attribute
+    like minify_result() for that source.
+    """
+
+    minifier = _whole_program_minifier(minify_kernel_names, fold_float_constants, remove_dead_code, profiler, diagnostics)
+    results = []
+    for (index, data) in enumerate(sources):
+        timings = {}
+        dependency_list = [] if dependencies else None
+        # Kernels are collected by the shared minifier so only the ones added
+        # by this source belong to its result.
+        first_kernel = len(minifier.kernel_functions)
+        try:
+            preprocessed = _run_stage(profiler, timings, "preprocess", "preprocess", _preprocess, data, preprocessor_command, preprocessor_no_stdin, dependency_list)
+            (minifier, output) = _minify_preprocessed(preprocessed, minify, minify_kernel_names, "", fold_float_constants, remove_dead_code, profiler, diagnostics, timings, minifier, parse_cache)
+        except MinifyError as e:
+            e.source_index = index
+            e.dependencies = dependency_list
+            raise
+        result = MinifyResult.from_minifier(minifier, output, len(data), timings, dependency_list, minifier.kernel_functions[first_kernel:])
+        results.append(result)
+    return results
+
+
+def minify_bundle(sources,
+                  preprocessor_command=DEFAULT_PREPROCESSOR_COMMAND,
+                  preprocessor_no_stdin=DEFAULT_PREPROCESSOR_NO_STDIN,
+                  minify_kernel_names=DEFAULT_MINIFY_KERNEL_NAMES,
+                  fold_float_constants=DEFAULT_FOLD_FLOAT_CONSTANTS,
+                  remove_dead_code=DEFAULT_REMOVE_DEAD_CODE,
+                  profiler=None,
+                  diagnostics=None,
+                  dependencies=False,
+                  parse_cache=None):
+    """Minify a list of sources like minify_whole_program() but combine them
+    into a single program and return one MinifyResult for it. Declarations
+    repeated by several sources, like everything from a header that each of
+    them includes, are only kept once. Functions that are identical apart from
+    their names are merged and calls to the removed copies are pointed at the
+    one that was kept.
+
+    Raises the same errors as minify_whole_program(), and a MinifyError when
+    a function is defined more than once with different bodies.
+    """
+
+    from pycparser import c_ast
+    from oclminify.bundle import deduplicate
+    from oclminify.generator import Generator
+    minifier = _whole_program_minifier(minify_kernel_names, fold_float_constants, remove_dead_code, profiler, diagnostics)
+    timings = {}
+    dependency_list = [] if dependencies else None
+    ast = c_ast.FileAST([])
+    for (index, data) in enumerate(sources):
+        try:
+            preprocessed = _run_stage(profiler, timings, "preprocess", "preprocess", _preprocess, data, preprocessor_command, preprocessor_no_stdin, dependency_list)
+            source_ast = _parse(preprocessed, profiler, timings, parse_cache)
+            _run_stage(profiler, timings, "minify", "Minifier.visit", minifier.visit, source_ast)
+        except MinifyError as e:
+            e.source_index = index
+            e.dependencies = dependency_list
+            raise
+        ast.ext.extend(source_ast.ext)
+
+    generator = Generator()
+    if profiler:
+        profiler.instrument(generator, "Generator", Profiler.GENERATOR_HELPERS)
+    _run_stage(profiler, timings, "minify", "deduplicate", deduplicate, ast, generator)
+    output = _run_stage(profiler, timings, "generate", "Generator.visit", generator.visit, ast)
+    if dependency_list is not None:
+        # Sources often include the same headers.
+        dependency_list = [path for (index, path) in enumerate(dependency_list) if path not in dependency_list[:index]]
+    return MinifyResult.from_minifier(minifier, output, sum(len(data) for data in sources), timings, dependency_list)
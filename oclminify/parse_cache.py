@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+import hashlib
+import pickle
+import threading
+
+
+DEFAULT_MAX_ENTRIES = 32
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ParseCache(object):
+    """Keep parsed sources in memory so minifying the same preprocessed source
+    again, like producing several variants of it with different options, skips
+    the parser. The minifier modifies the AST it's given, so each entry is
+    stored pickled and every lookup returns a new copy. Unpickling is several
+    times faster than parsing but pickling costs about half as much as
+    parsing, so a cache only pays off when sources are minified more than
+    once.
+
+    Entries are keyed by a hash of the preprocessed source and evicted least
+    recently used first once there are more than max_entries or they take
+    more than max_bytes. A cache can be shared between threads.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data):
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8", "ignore")
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key):
+        """Return a new copy of the AST stored for key or None if there is no
+        entry.
+        """
+
+        with self._lock:
+            blob = self._entries.pop(key, None)
+            if blob is None:
+                self.misses += 1
+                return None
+            self._entries[key] = blob  # Mark as recently used.
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, ast):
+        # Pickle before the AST is modified and outside of the lock so other
+        # threads aren't blocked.
+        try:
+            blob = pickle.dumps(ast, pickle.HIGHEST_PROTOCOL)
+        except RuntimeError:
+            return  # Too deeply nested to pickle. The cache is only an optimization.
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = blob
+            self._size += len(blob)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
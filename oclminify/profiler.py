@@ -0,0 +1,153 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import functools
+import marshal
+import timeit
+
+
+class Profiler(object):
+    """Count calls and accumulate time spent in the visitor methods and helper
+    functions of each pipeline stage.
+
+    Methods are only wrapped on the instances passed to instrument() so there
+    is no overhead when profiling is not used.
+    """
+
+    # Helper methods that are profiled in addition to every visit_* method.
+    # Maps the method name to the name it's reported as.
+    MINIFIER_HELPERS = {
+        "_generate_unique_declaration_name": "Minifier._generate_unique_declaration_name",
+        "_get_new_declaration_name": "Minifier._get_new_declaration_name",
+        "_get_declaration_by_name": "Minifier._get_declaration_by_name",
+        "_get_declaration_by_new_name": "Minifier._get_declaration_by_new_name",
+        "_get_structref_type": "Minifier._get_structref_type",
+        "_struct_to_declaration": "Minifier._struct_to_declaration",
+        "_shorten_vector_access": "Minifier._shorten_vector_access",
+        "_get_builtin_func_return_type": "BUILTIN.get_func_return_type",
+    }
+    GENERATOR_HELPERS = {
+        "_generate_type": "Generator._generate_type",
+        "_generate_grouped_stmts": "Generator._generate_grouped_stmts",
+    }
+
+    class Stat(object):
+        def __init__(self):
+            self.primitive_calls = 0
+            self.calls = 0
+            self.own_time = 0.0
+            self.cumulative_time = 0.0
+
+        def add(self, primitive, own_time, elapsed):
+            self.calls += 1
+            self.own_time += own_time
+            if primitive:
+                self.primitive_calls += 1
+                self.cumulative_time += elapsed
+
+    def __init__(self):
+        self.stats = {}
+        self.edges = {}
+        self.stacks = {}
+        self._stack = []
+        self._active = {}
+
+    def instrument(self, obj, prefix, helpers=None):
+        """Wrap every visit_* method and the given helper methods of obj so
+        calls to them are recorded.
+        """
+
+        names = {}
+        for attr in dir(obj):
+            if attr.startswith("visit_"):
+                names[attr] = "%s.%s" % (prefix, attr)
+        names.update(helpers or {})
+        for (attr, name) in names.items():
+            if hasattr(obj, attr):
+                setattr(obj, attr, self.wrap(name, getattr(obj, attr)))
+        return obj
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(name, func, *args, **kwargs)
+        return wrapper
+
+    def call(self, name, func, *args, **kwargs):
+        # Each frame is [name, start time, time spent in child calls].
+        frame = [name, timeit.default_timer(), 0.0]
+        self._stack.append(frame)
+        self._active[name] = self._active.get(name, 0) + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = timeit.default_timer() - frame[1]
+            own_time = elapsed - frame[2]
+            self._active[name] -= 1
+            primitive = self._active[name] == 0
+
+            stack_key = ";".join(f[0] for f in self._stack)
+            self.stacks[stack_key] = self.stacks.get(stack_key, 0.0) + own_time
+            self._stack.pop()
+
+            self.stats.setdefault(name, Profiler.Stat()).add(primitive, own_time, elapsed)
+            if self._stack:
+                self._stack[-1][2] += elapsed
+                edge = (self._stack[-1][0], name)
+                self.edges.setdefault(edge, Profiler.Stat()).add(primitive, own_time, elapsed)
+
+    def report(self, sort="own"):
+        """Format collected stats as a table sorted by own time (time spent in
+        the call itself, excluding calls it made), cumulative time, or number
+        of calls.
+        """
+
+        sort_keys = {
+            "own": lambda item: item[1].own_time,
+            "cumulative": lambda item: item[1].cumulative_time,
+            "calls": lambda item: item[1].calls,
+        }
+        lines = ["%10s %12s %12s %12s  %s" % ("calls", "own (s)", "cumul. (s)", "per call (us)", "name")]
+        for (name, stat) in sorted(self.stats.items(), key=sort_keys[sort], reverse=True):
+            per_call = stat.own_time / stat.calls * 1000000.0 if stat.calls else 0.0
+            lines.append("%10i %12.6f %12.6f %12.2f  %s" % (stat.calls, stat.own_time, stat.cumulative_time, per_call, name))
+        return "\n".join(lines)
+
+    def write_collapsed(self, path):
+        """Write call stacks in the collapsed format used by flamegraph.pl and
+        speedscope. Sample counts are in microseconds.
+        """
+
+        with open(path, "w") as fd:
+            for (stack, own_time) in sorted(self.stacks.items()):
+                fd.write("%s %i\n" % (stack, int(round(own_time * 1000000.0))))
+
+    def write_pstats(self, path):
+        """Write stats in the marshaled format read by the pstats module,
+        snakeviz, gprof2dot, etc.
+        """
+
+        def key(name):
+            return ("oclminify", 0, name)
+
+        stats = {}
+        for (name, stat) in self.stats.items():
+            callers = {}
+            for ((caller, callee), edge) in self.edges.items():
+                if callee == name:
+                    callers[key(caller)] = (edge.primitive_calls, edge.calls, edge.own_time, edge.cumulative_time)
+            stats[key(name)] = (stat.primitive_calls, stat.calls, stat.own_time, stat.cumulative_time, callers)
+        with open(path, "wb") as fd:
+            marshal.dump(stats, fd)
+
+    def write(self, path):
+        if path.endswith(".prof") or path.endswith(".pstats"):
+            self.write_pstats(path)
+        else:
+            self.write_collapsed(path)
+
+
+def _profile_call(profiler, name, func, *args, **kwargs):
+    if profiler is None:
+        return func(*args, **kwargs)
+    return profiler.call(name, func, *args, **kwargs)
@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+
+
+class MinifyResult(object):
+    """Everything produced by minifying a source without any references to
+    the parsed source or the visitors, so results are cheap to pickle, cache,
+    and pass between processes.
+
+    data is the minified source as UTF-8 encoded bytes. kernel_names maps the
+    original name of each kernel to its new name in declaration order and
+    kernel_args maps the original name of each kernel to an ordered mapping of
+    its original argument names to new argument names. kernel_arg_info maps
+    the original name of each kernel to a list describing each argument, see
+    oclminify.kernel_args.describe_argument(), with its new name added as
+    minified_name. timings maps each
+    stage (preprocess, parse, minify, and generate) to the seconds spent in
+    it. dependencies lists the files read by the preprocessor when they were
+    requested.
+    """
+
+    __slots__ = ("data", "kernel_names", "kernel_args", "kernel_arg_info", "original_size", "minified_size", "timings", "dependencies")
+
+    def __init__(self, data, kernel_names=None, kernel_args=None, original_size=0, timings=None, dependencies=None, kernel_arg_info=None):
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8", "ignore")
+        self.data = data
+        self.kernel_names = OrderedDict(kernel_names or [])
+        self.kernel_args = OrderedDict((name, OrderedDict(args)) for (name, args) in (kernel_args or {}).items())
+        self.kernel_arg_info = OrderedDict((name, [OrderedDict(arg) for arg in args]) for (name, args) in (kernel_arg_info or {}).items())
+        self.original_size = original_size
+        self.minified_size = len(data)
+        self.timings = dict(timings or {})
+        self.dependencies = list(dependencies or [])
+
+    @classmethod
+    def from_minifier(cls, minifier, data, original_size=0, timings=None, dependencies=None, kernel_functions=None):
+        # Kernels in declaration order without duplicates from prototypes.
+        kernel_names = OrderedDict()
+        for name in (minifier.kernel_functions if kernel_functions is None else kernel_functions):
+            if name in minifier.functions and name not in kernel_names:
+                kernel_names[name] = minifier.functions[name].name
+        kernel_args = OrderedDict()
+        kernel_arg_info = OrderedDict()
+        for name in kernel_names:
+            kernel_args[name] = OrderedDict((arg, minifier.functions_args[name][arg].name) for arg in minifier.functions_arg_order[name])
+            kernel_arg_info[name] = []
+            for info in minifier.functions_arg_info.get(name, []):
+                # The new name follows the original name.
+                items = list(info.items())
+                items.insert(2, ("minified_name", kernel_args[name][info["name"]]))
+                kernel_arg_info[name].append(OrderedDict(items))
+        return cls(data, kernel_names, kernel_args, original_size, timings, dependencies, kernel_arg_info)
+
+    def text(self):
+        return self.data.decode("utf-8")
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for (name, value) in state.items():
+            setattr(self, name, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, MinifyResult):
+            return False
+        return self.__getstate__() == other.__getstate__()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "MinifyResult(minified_size=%i, kernels=%r)" % (self.minified_size, list(self.kernel_names.keys()))
+
+    def to_dict(self):
+        """Convert to a dict containing only JSON compatible types. The
+        minified source is stored as text.
+        """
+
+        state = self.__getstate__()
+        state["data"] = self.text()
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        result = cls(state["data"], state["kernel_names"], state["kernel_args"], state["original_size"], state["timings"], state.get("dependencies"), state.get("kernel_arg_info"))
+        result.minified_size = state["minified_size"]
+        return result
+
+    def to_json(self, **kwargs):
+        import json
+        return json.dumps(self.to_dict(), **kwargs)
+
+    @classmethod
+    def from_json(cls, text):
+        # Keep kernels and arguments in declaration order.
+        import json
+        return cls.from_dict(json.loads(text, object_pairs_hook=OrderedDict))
@@ -0,0 +1,152 @@
+"""Vector component accessors, also known as swizzles, and their shortest
+spellings. Accessors are handled as the tuple of component indices they
+select so different spellings of the same components, and accessors applied
+one after another, can be compared.
+"""
+from __future__ import absolute_import
+import itertools
+
+
+SCALAR_TYPES = ("char", "uchar", "short", "ushort", "int", "uint", "long", "ulong", "float", "double", "half")
+VECTOR_WIDTHS = (2, 3, 4, 8, 16)
+
+# Vector type name to its scalar type and width.
+_VECTOR_TYPES = dict(("%s%i" % (scalar, width), (scalar, width)) for scalar in SCALAR_TYPES for width in VECTOR_WIDTHS)
+
+_XYZW = "xyzw"
+_HEX_DIGITS = "0123456789abcdef"
+
+# Named accessors in the order they're preferred when spellings are the same
+# length.
+_NAMES = ("lo", "hi", "even", "odd")
+
+
+def _named_components(width):
+    # Components selected by each named accessor. A vector with 3 components
+    # is treated as having 4 where the last is undefined, so accessors
+    # including it aren't listed.
+    padded = 4 if width == 3 else width
+    indices = tuple(range(padded))
+    half = padded // 2
+    named = {
+        "lo": indices[:half],
+        "hi": indices[half:],
+        "even": indices[::2],
+        "odd": indices[1::2],
+    }
+    return dict((name, components) for (name, components) in named.items() if max(components) < width)
+
+
+_NAMED = dict((width, _named_components(width)) for width in VECTOR_WIDTHS)
+
+
+def parse_vector_type(name):
+    """Return (scalar type, width) for a vector type name such as float4 or
+    None when name isn't a vector type.
+    """
+
+    return _VECTOR_TYPES.get(name)
+
+
+def vector_type(scalar, width):
+    return scalar if width == 1 else "%s%i" % (scalar, width)
+
+
+def _parse(width, accessor):
+    if accessor in _NAMED.get(width, ()):
+        return _NAMED[width][accessor]
+    if len(accessor) > 1 and accessor[0] in "sS":
+        components = tuple(_HEX_DIGITS.find(char) for char in accessor[1:].lower())
+    elif width <= 4 and len(accessor) <= 4:
+        # .xyzw is only allowed for vectors with up to 4 components.
+        components = tuple(_XYZW.find(char) for char in accessor)
+    else:
+        return None
+    if not components or min(components) < 0 or max(components) >= width:
+        return None
+    return components
+
+
+def _spell(width, components):
+    if components == tuple(range(width)):
+        return ""
+    # The first spelling wins ties: .xyzw, then named, then .sN.
+    spellings = []
+    if width <= 4:
+        spellings.append("".join(_XYZW[index] for index in components))
+    named = _NAMED.get(width, {})
+    spellings.extend(name for name in _NAMES if named.get(name) == components)
+    spellings.append("s" + "".join(_HEX_DIGITS[index] for index in components))
+    return min(spellings, key=len)
+
+
+def _tables():
+    # Every accessor with up to _TABLE_LENGTHS[width] components, keyed by
+    # (width, accessor) and (width, components). The tables are only read
+    # after this, so they can be shared by threads. Accessors with more
+    # components are rare and there are far too many to list, so they're
+    # worked out when needed instead.
+    accessors = {}
+    spellings = {}
+    for width in VECTOR_WIDTHS:
+        for (name, components) in _NAMED[width].items():
+            accessors[(width, name)] = components
+        for length in range(1, _TABLE_LENGTHS[width] + 1):
+            for components in itertools.product(range(width), repeat=length):
+                if width <= 4:
+                    accessors[(width, "".join(_XYZW[index] for index in components))] = components
+                accessors[(width, "s" + "".join(_HEX_DIGITS[index] for index in components))] = components
+                spellings[(width, components)] = _spell(width, components)
+    return (accessors, spellings)
+
+
+_TABLE_LENGTHS = {2: 4, 3: 4, 4: 4, 8: 2, 16: 2}
+(_ACCESSORS, _SPELLINGS) = _tables()
+
+
+def parse_accessor(width, accessor):
+    """Return the tuple of component indices that accessor selects from a
+    vector with width components or None when it isn't a valid accessor.
+    """
+
+    components = _ACCESSORS.get((width, accessor))
+    if components is None:
+        return _parse(width, accessor)
+    return components
+
+
+def shortest_accessor(width, components):
+    """Return the shortest accessor selecting components from a vector with
+    width components. An empty string means the accessor selects every
+    component in order and can be left out.
+    """
+
+    spelling = _SPELLINGS.get((width, components))
+    if spelling is None:
+        return _spell(width, components)
+    return spelling
+
+
+def shorten_accessor(width, accessor):
+    """Return the shortest accessor selecting the same components as
+    accessor, or accessor itself when it isn't understood.
+    """
+
+    components = parse_accessor(width, accessor)
+    if components is None:
+        return accessor
+    spelling = shortest_accessor(width, components)
+    return spelling if len(spelling) <= len(accessor) else accessor
+
+
+def compose(components, outer_accessor):
+    """Return the components of the original vector selected by applying
+    outer_accessor to the vector selected by components, such as .lo.hi
+    selecting components 2 and 3 of an 8 component vector, or None when
+    outer_accessor isn't valid for that vector.
+    """
+
+    outer = parse_accessor(len(components), outer_accessor)
+    if outer is None:
+        return None
+    return tuple(components[index] for index in outer)
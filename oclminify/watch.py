@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+import os
+import time
+import timeit
+
+
+DEFAULT_INTERVAL = 0.2  # Seconds between polls.
+DEFAULT_DEBOUNCE = 0.1  # Seconds files must stop changing before rebuilding.
+
+
+class Watcher(object):
+    """Poll files for changes by comparing their inode, size, and modification
+    time. Editors often save by writing a new file and renaming it over the
+    old one, which changes the inode but not necessarily the modification
+    time, so the inode is compared as well. No file system notification
+    service is needed.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        self.interval = interval
+        self.debounce = debounce
+        self._stats = {}
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None  # Missing files are tracked so they're noticed when they come back.
+        return (stat.st_ino, stat.st_size, getattr(stat, "st_mtime_ns", stat.st_mtime))
+
+    def _changed(self, paths):
+        changed = set()
+        for path in paths:
+            stat = self._stat(path)
+            if path not in self._stats:
+                # Newly watched files are recorded without counting as a
+                # change.
+                self._stats[path] = stat
+            elif self._stats[path] != stat:
+                self._stats[path] = stat
+                changed.add(path)
+        return changed
+
+    def update(self, paths):
+        """Record the current state of paths so only later changes are
+        reported by wait().
+        """
+
+        self._changed(paths)
+
+    def wait(self, paths):
+        """Block until at least one of paths changes and return the set of
+        changed paths. Changes are collected until none have happened for
+        debounce seconds so a burst of writes, like saving several files at
+        once, is reported together.
+        """
+
+        changed = set()
+        while not changed:
+            time.sleep(self.interval)
+            changed = self._changed(paths)
+
+        quiet_since = timeit.default_timer()
+        while timeit.default_timer() - quiet_since < self.debounce:
+            time.sleep(min(self.interval, self.debounce))
+            latest = self._changed(paths)
+            if latest:
+                changed |= latest
+                quiet_since = timeit.default_timer()
+        return changed
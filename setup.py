@@ -1,4 +1,6 @@
+import sys
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 try:
     import pypandoc
     long_description = pypandoc.convert("README.md", "rst")
@@ -7,6 +9,16 @@ except:
     long_description = open("README.md").read()
 
 
+class BuildPy(build_py):
+    # oclminify.aio uses async def which can't even be compiled before Python
+    # 3.5, so it's left out of older installs.
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 5):
+            modules = [module for module in modules if (module[0], module[1]) != ("oclminify", "aio")]
+        return modules
+
+
 setup(
     name = "oclminify",
     description = "Minify OpenCL source files.",
@@ -39,4 +51,5 @@ setup(
         ],
     },
     test_suite = "tests.test_minifier",
+    cmdclass = {"build_py": BuildPy},
 )
@@ -1,18 +1,58 @@
 from __future__ import absolute_import
+from multiprocessing.pool import ThreadPool
+import json
+import os
+import pickle
+import re
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 import unittest
+import warnings
+import zlib
 sys.path.insert(0, "..")
-from oclminify.build import try_build
-from oclminify.minify import minify
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from corpus import generate_kernel
+from pycparser import c_ast
+from pycparser.plyparser import Coord
+from oclminify.__main__ import main
+from oclminify.build import BuildChecker, BuildResult
+from oclminify.build_cache import BuildCache
+from oclminify.diagnostics import Diagnostics
+from oclminify.errors import MinifyError, ParseError, PreprocessError, UnsupportedNodeError
+from oclminify.header import generate_header
+from oclminify.lexical import minify_lexical, minify_lexical_result
+from oclminify.manifest import generate_manifest_header
+from oclminify.minifier import Minifier
+from oclminify.minify import minify, minify_bundle, minify_result, minify_whole_program
+from oclminify.parse_cache import ParseCache
+from oclminify.profiler import Profiler
+from oclminify.result import MinifyResult
+from oclminify.watch import Watcher
+if sys.version_info >= (3, 5):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+    from oclminify.aio import AsyncMinifier, minify_async, minify_result_async
 
 
 class TestMinifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Share one set of OpenCL contexts between every test.
+        cls.build_checker = BuildChecker()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.build_checker.close()
+
     def assert_minify(self, data, expected_result, **kwargs):
-        if not try_build(data):
+        if not self.build_checker.try_build(data):
             raise AssertionError("Input OpenCL code could not be built.")
         result = minify(data, **kwargs)
         self.assertEqual(result, expected_result)
-        if not try_build(result):
+        if not self.build_checker.try_build(result):
             raise AssertionError("Minified OpenCL code could not be built.")
 
     def test_simple(self):
@@ -29,7 +69,7 @@ class TestMinifier(unittest.TestCase):
                 ushort4 test = (ushort4)(0,1,2,3);
                 ushort test2 = (ushort)1.0f;
             }"""
-        self.assert_minify(data, "__kernel void a(){ushort4 b=(ushort4)(0,1,2,3);ushort c=(ushort)1.0f;}")
+        self.assert_minify(data, "__kernel void a(){ushort4 b=(ushort4)(0,1,2,3);ushort c=(ushort)1.f;}")
         data = r"""
             __kernel void main()
             {
@@ -37,7 +77,7 @@ class TestMinifier(unittest.TestCase):
                 ushort4 test2 = convert_ushort4(test1 - (float4)(0.0f,1.0f,2.0f,3.0f));
                 test2 = convert_ushort4((float4)(0.0f,1.0f,2.0f,3.0f) - (float4)(0.0f,1.0f,2.0f,3.0f));
             }"""
-        self.assert_minify(data, "__kernel void a(){float4 b=(float4)(0.0f,1.0f,2.0f,3.0f);ushort4 c=convert_ushort4(b-(float4)(0.0f,1.0f,2.0f,3.0f));c=convert_ushort4((float4)(0.0f,1.0f,2.0f,3.0f)-(float4)(0.0f,1.0f,2.0f,3.0f));}")
+        self.assert_minify(data, "__kernel void a(){float4 b=(float4)(0.f,1.f,2.f,3.f);ushort4 c=convert_ushort4(b-(float4)(0.f,1.f,2.f,3.f));c=convert_ushort4((float4)(0.f,1.f,2.f,3.f)-(float4)(0.f,1.f,2.f,3.f));}")
 
     def test_simple_operator_precedence(self):
         data = r"""
@@ -47,7 +87,7 @@ class TestMinifier(unittest.TestCase):
                 int test2 = 2;
                 float test3 = test1 / (2.0f * (float)test2);
             }"""
-        self.assert_minify(data, "__kernel void a(){float b=1.0f;int c=2;float d=b/(2.0f*(float)c);}")
+        self.assert_minify(data, "__kernel void a(){float b=1.f;int c=2;float d=b/(2.f*(float)c);}")
 
     def test_no_brackets_when_implied_operator_precedence(self):
         data = r"""
@@ -151,7 +191,7 @@ class TestMinifier(unittest.TestCase):
                 ts.test6.xy = (float2)0.0f;
                 ts.test7 = 0;
             }"""
-        self.assert_minify(data, "typedef uint a;struct b{uchar a;ushort b;uint c;ulong d;a e;float4 f;uint g __attribute__((alligned(8)));};__kernel void c(){struct b d;d.a=0;d.b=0;d.c=0;d.d=0;d.e=0;d.f.xy=(float2)0.0f;d.g=0;}")
+        self.assert_minify(data, "typedef uint a;struct b{uchar a;ushort b;uint c;ulong d;a e;float4 f;uint g __attribute__((alligned(8)));};__kernel void c(){struct b d;d.a=0;d.b=0;d.c=0;d.d=0;d.e=0;d.f.xy=(float2)0.f;d.g=0;}")
         data = r"""
             __kernel void main()
             {
@@ -226,7 +266,7 @@ class TestMinifier(unittest.TestCase):
                 unsigned short value1 = Func().value1;
                 float4 value2 = Func().value2.s0123;
             }"""
-        self.assert_minify(data, "struct a{ushort a;float8 b;};struct a b(){struct a c;c.a=0;c.b=(float8)0.0f;return c;}__kernel void c(){ushort d=b().a;float4 e=b().b.lo;}")
+        self.assert_minify(data, "struct a{ushort a;float8 b;};struct a b(){struct a c;c.a=0;c.b=(float8)0.f;return c;}__kernel void c(){ushort d=b().a;float4 e=b().b.lo;}")
         # Built-in functions.
         data = r"""
             __kernel void main()
@@ -245,7 +285,7 @@ class TestMinifier(unittest.TestCase):
                 sin(test + (float8)1.0f).s0123;
                 sin(test + convert_float8((int8)0)).s0123;
             }"""
-        self.assert_minify(data, "__kernel void a(){float8 b=(float8)0.0f;sin(b).lo;sin(b+(float8)1.0f).lo;sin(b+convert_float8((int8)0)).lo;}")
+        self.assert_minify(data, "__kernel void a(){float8 b=(float8)0.f;sin(b).lo;sin(b+(float8)1.f).lo;sin(b+convert_float8((int8)0)).lo;}")
 
     def test_shrink_vector_indices(self):
         data = r"""
@@ -263,7 +303,24 @@ class TestMinifier(unittest.TestCase):
                 float2 test4 = test.even; //.xz
                 test4 = test.odd; //.yw
             }"""
-        self.assert_minify(data, "__kernel void a(){float4 b=(float4)(0.0f,1.0f,2.0f,3.0f);b=b;uchar16 c=(uchar16)1;uchar8 d=c.lo;d=c.hi;d=c.even;d=c.odd;float2 e=b.xz;e=b.yw;}")
+        self.assert_minify(data, "__kernel void a(){float4 b=(float4)(0.f,1.f,2.f,3.f);b=b;uchar16 c=(uchar16)1;uchar8 d=c.lo;d=c.hi;d=c.even;d=c.odd;float2 e=b.xz;e=b.yw;}")
+
+    def test_combine_vector_accessors(self):
+        data = r"""
+            __kernel void main(__global float* output)
+            {
+                float8 test = (float8)(1.0f);
+                float2 test2 = test.lo.hi; //.s23
+                float4 test3 = test.even.s0123; //.even
+                float test4 = test.hi.odd.y; //.s7
+                float4 test5 = (float4)(1.0f);
+                float2 test6 = test5.s01.s10; //.yx
+                float test7 = test5.S3; //.w
+                uchar16 test8 = (uchar16)(1);
+                uchar4 test9 = test8.lo.lo; //.s0123
+                output[0] = test2.x + test3.x + test4 + test6.x + test7 + test9.x;
+            }"""
+        self.assert_minify(data, "__kernel void a(__global float*b){float8 c=(float8)1.f;float2 d=c.s23;float4 e=c.even;float f=c.s7;float4 g=(float4)1.f;float2 h=g.yx;float i=g.w;uchar16 j=(uchar16)1;uchar4 k=j.s0123;b[0]=d.x+e.x+f+h.x+i+k.x;}")
 
     def test_enum(self):
         data = r"""
@@ -295,6 +352,56 @@ class TestMinifier(unittest.TestCase):
             }"""
         self.assert_minify(data, "enum{a,b=100};enum c{d,e=100};__kernel void f(){int g=a;g=b;enum c h=d;h=e;enum{i,j=100}k;k=i;k=j;}")
 
+    def test_literals(self):
+        data = r"""
+            __kernel void main(__global float* output)
+            {
+                output[0] = 1.0f + 0.50000f + 100.0f + 0.000001f + 0.100000001f;
+                output[1] = 0x0000FF + 0xFFFFFFFF + 0xFFu + 010 + 10l;
+                output[2] = (2 * 4) + (1 << 20) + (3 - 5) + (7 / 2) + (1 << 31);
+                output[3] = 0.1f * 3.0f;
+                output[4] = 1.5f * 2.0f + output[3];
+            }"""
+        self.assert_minify(data, "__kernel void a(__global float*b){b[0]=1.f+.5f+1e2f+1e-6f+.1f;b[1]=255+0xFFFFFFFF+255u+8+10l;b[2]=8+(1<<20)+(3-5)+3+(1<<31);b[3]=.1f*3.f;b[4]=1.5f*2.f+b[3];}")
+
+        # The multiplication is left alone when it could be contracted into a
+        # fused multiply-add.
+        self.assert_minify(data, "__kernel void a(__global float*b){b[0]=101.6f;b[1]=255+0xFFFFFFFF+255u+8+10l;b[2]=8+(1<<20)+(3-5)+3+(1<<31);b[3]=.3f;b[4]=1.5f*2.f+b[3];}", fold_float_constants=True)
+
+    def test_remove_dead_code(self):
+        data = r"""
+            __kernel void main(__global float* output, float input)
+            {
+                float unused = input * 2.0f;
+                unused += 1.0f;
+                float overwritten = 0.0f;
+                overwritten = input;
+                float read = 1.0f;
+                if (input > 0.0f)
+                    return;
+                read = 2.0f;
+                float call = sin(input);
+                float shadowed = 1.0f;
+                {
+                    float shadowed = 2.0f;
+                    output[1] = shadowed;
+                }
+                output[0] = overwritten + read;
+            }"""
+        self.assert_minify(data, "__kernel void a(__global float*b,float c){float d;d=c;float e=1.f;if(c>0.f)return;e=2.f;float f=sin(c);{float g=2.f;b[1]=g;}b[0]=d+e;}", remove_dead_code=True)
+
+        # Unused variables whose declaration also defines a type are kept.
+        data = r"""
+            __kernel void main(__global int* output)
+            {
+                struct data { int value; } unused;
+                struct data used;
+                used.value = 1;
+                enum { FIRST = 3, SECOND } unused_enum;
+                output[0] = used.value + SECOND;
+            }"""
+        self.assert_minify(data, "__kernel void a(__global int*b){struct c{int a;}d;struct c e;e.a=1;enum{f=3,g}h;b[0]=e.a+g;}", remove_dead_code=True)
+
     def test_do_while(self):
         data = r"""
             __kernel void main()
@@ -331,7 +438,7 @@ class TestMinifier(unittest.TestCase):
                 int test1 = 5;
                 int test2 = test1 < 6 ? 1 + 1 : 10 * 10;
             }"""
-        self.assert_minify(data, "__kernel void a(){int b=5,c=b<6?1+1:10*10;}")
+        self.assert_minify(data, "__kernel void a(){int b=5,c=b<6?2:100;}")
 
     def test_init_list(self):
         data = r"""
@@ -344,7 +451,7 @@ class TestMinifier(unittest.TestCase):
                     3.0f
                 };
             }"""
-        self.assert_minify(data, "__kernel void a(){float b[4]={0.0f,1.0f,2.0f,3.0f};}")
+        self.assert_minify(data, "__kernel void a(){float b[4]={0.f,1.f,2.f,3.f};}")
 
     def test_preserve_pragmas(self):
         data = r"""
@@ -458,7 +565,7 @@ class TestMinifier(unittest.TestCase):
                 int fourth;
                 float fifth;
             }"""
-        self.assert_minify(data, "__kernel void a(){struct b{float a,b,c;int d;float e;};float c,d=1.0f,e;int f;float g;}")
+        self.assert_minify(data, "__kernel void a(){struct b{float a,b,c;int d;float e;};float c,d=1.f,e;int f;float g;}")
         data = r"""
             __kernel void main()
             {
@@ -511,6 +618,105 @@ class TestMinifier(unittest.TestCase):
             }"""
         self.assert_minify(data, "typedef uint a_global;struct b_global{a_global a;};void c_global(){}__kernel void d_global(){typedef uint a;struct b{a_global a;a b;};}", global_postfix="_global")
 
+    def test_many_declarations(self):
+        # More declarations than there are one and two letter names starting
+        # with "a", so names starting with "b" are needed, and enough to reach
+        # names like "do" and "if" that must be skipped.
+        count = 500
+        lines = ["__kernel void main(__global float* output)", "{", "float value0 = 1.0f;"]
+        for index in range(1, count):
+            lines.append("float value%i = value%i + 1.0f;" % (index, index - 1))
+        lines.extend(["output[0] = value%i;" % (count - 1), "}"])
+        result = minify("\n".join(lines))
+        names = re.findall(r"[ ,]([a-zA-Z]+)=", result)
+        self.assertEqual(len(set(names)), count)
+        self.assertIn("ba", names)
+        for name in ["do", "if", "int", "for", "min", "sin"]:
+            self.assertNotIn(name, names)
+        minify(result)  # Still parses.
+        if not self.build_checker.try_build(result):
+            raise AssertionError("Minified OpenCL code could not be built.")
+
+    def test_many_struct_members(self):
+        count = 300
+        members = "".join("float member%i;" % index for index in range(count))
+        data = "struct s {%s}; __kernel void main(__global float* output) { struct s v; v.member%i = 1.0f; output[0] = v.member%i; }" % (members, count - 1, count - 1)
+        result = minify(data)
+        names = result.split("{float ")[1].split(";")[0].split(",")
+        self.assertEqual(len(set(names)), count)
+        for name in ["do", "if", "int", "for", "min", "sin"]:
+            self.assertNotIn(name, names)
+        minify(result)  # Still parses.
+        if not self.build_checker.try_build(result):
+            raise AssertionError("Minified OpenCL code could not be built.")
+
+    def test_whole_program(self):
+        first = r"""
+            float helper(float v)
+            {
+                return v;
+            }
+            __constant float scale = 2.0f;
+            __kernel void first(__global float* data)
+            {
+                data[0] = helper(data[0]) * scale;
+            }"""
+        second = r"""
+            float helper(float v)
+            {
+                return v;
+            }
+            float other(float v)
+            {
+                return v;
+            }
+            __kernel void second(__global float* data)
+            {
+                data[0] = other(helper(data[0]));
+            }"""
+        results = minify_whole_program([first, second], minify_kernel_names=True)
+        self.assertEqual(results[0].text(), "float a(float b){return b;}__constant float b=2.f;__kernel void c(__global float*d){d[0]=a(d[0])*b;}")
+        self.assertEqual(results[1].text(), "float a(float d){return d;}float d(float e){return e;}__kernel void e(__global float*f){f[0]=d(a(f[0]));}")
+        self.assertEqual(list(results[0].kernel_names.items()), [("first", "c")])
+        self.assertEqual(list(results[1].kernel_names.items()), [("second", "e")])
+        with self.assertRaises(ParseError) as context:
+            minify_whole_program([first, "int x("])
+        self.assertEqual(context.exception.source_index, 1)
+
+    def test_bundle(self):
+        helpers = r"""
+            struct pair
+            {
+                float x;
+            };
+            float helper(float v)
+            {
+                float t = v * 2.0f;
+                return t;
+            }"""
+        first = helpers + r"""
+            float twice(float q)
+            {
+                float u = q * 2.0f;
+                return u;
+            }
+            __kernel void first(__global float* data)
+            {
+                struct pair p;
+                p.x = twice(data[0]);
+                data[0] = helper(p.x);
+            }"""
+        second = helpers + r"""
+            __kernel void second(__global float* data)
+            {
+                data[0] = helper(data[0]);
+            }"""
+        result = minify_bundle([first, second])
+        self.assertEqual(result.text(), "struct a{float a;};float b(float c){float d=c*2.f;return d;}__kernel void d(__global float*e){struct a f;f.a=b(e[0]);e[0]=b(f.a);}__kernel void e(__global float*f){f[0]=b(f[0]);}")
+        self.assertEqual(list(result.kernel_names.items()), [("first", "d"), ("second", "e")])
+        with self.assertRaises(MinifyError):
+            minify_bundle(["float helper(){return 1.0f;}", "float helper(){return 2.0f;}"])
+
     def test_function_args(self):
         data = r"""
             void func(__global float* arg0,int arg1,float arg2[10])
@@ -526,7 +732,506 @@ class TestMinifier(unittest.TestCase):
                 float4 test2 = test.xyzw;
                 test2 = test.s0123;
             }"""
-        self.assert_minify(data, "__kernel void a(){float4 b=(float4)(0.0f,1.0f,2.0f,3.0f),c=b;c=b;}")
+        self.assert_minify(data, "__kernel void a(){float4 b=(float4)(0.f,1.f,2.f,3.f),c=b;c=b;}")
+
+    def test_profiler(self):
+        data = r"""
+            __kernel void main()
+            {
+                float4 test = (float4)(0.0f,1.0f,2.0f,3.0f);
+                float test2 = test.x;
+            }"""
+        profiler = Profiler()
+        self.assertEqual(minify(data, profiler=profiler), minify(data))
+        for name in ["preprocess", "Parser.parse", "Minifier.visit_FuncDef", "Minifier._get_structref_type", "Generator.visit_Compound"]:
+            self.assertIn(name, profiler.stats)
+        self.assertEqual(profiler.stats["Minifier.visit_FuncDef"].calls, 1)
+
+    def test_diagnostics(self):
+        data = r"""
+            __kernel void main()
+            {
+                int test = UNDEFINED + UNDEFINED * OTHER;
+            }"""
+        diagnostics = Diagnostics()
+        self.assertEqual(minify(data, diagnostics=diagnostics), "__kernel void a(){int b=UNDEFINED+UNDEFINED*OTHER;}")
+        self.assertEqual(diagnostics.symbols(), ["UNDEFINED", "OTHER"])
+        self.assertEqual([diagnostic.count for diagnostic in diagnostics], [2, 1])
+
+    def test_result(self):
+        data = r"""
+            __kernel void main(__global float* input, __global float* output)
+            {
+                output[0] = input[0];
+            }"""
+        result = minify_result(data)
+        self.assertEqual(result.text(), minify(data))
+        self.assertEqual(result.original_size, len(data))
+        self.assertEqual(result.minified_size, len(result.data))
+        self.assertEqual(list(result.kernel_names.items()), [("main", "a")])
+        self.assertEqual(list(result.kernel_args["main"].items()), [("input", "b"), ("output", "c")])
+        self.assertEqual(sorted(result.timings.keys()), ["generate", "minify", "parse", "preprocess"])
+        self.assertFalse(hasattr(result, "__dict__"))
+        self.assertEqual(pickle.loads(pickle.dumps(result)), result)
+        self.assertEqual(MinifyResult.from_json(result.to_json()), result)
+
+    def test_kernel_arg_info(self):
+        data = r"""
+            typedef __global float4* vec_ptr;
+            typedef struct { float x; } pair_t;
+            __kernel void main(vec_ptr a, __read_write image2d_t b, __local float* c, float3 d, pair_t e, unsigned int f)
+            {
+            }"""
+        result = minify_result(data)
+        args = [tuple(arg.values()) for arg in result.kernel_arg_info["main"]]
+        self.assertEqual([arg[3:] for arg in args], [
+            ("global", "none", "float4", True, 4, 16),
+            ("global", "read_write", "image2d_t", False, 1, None),
+            ("local", "none", "float", True, 1, 4),
+            ("private", "none", "float3", False, 3, 16),
+            ("private", "none", "pair_t", False, 1, None),
+            ("private", "none", "uint", False, 1, 4),
+        ])
+        self.assertEqual([arg[2] for arg in args], list(result.kernel_args["main"].values()))
+
+        header = generate_manifest_header("test.cl", result)
+        self.assertIn("#define TEST_MANIFEST_KERNEL_MAIN_ARG_C_ADDRESS_QUALIFIER 0x119C /* CL_KERNEL_ARG_ADDRESS_LOCAL */\n", header)
+        self.assertIn("#define TEST_MANIFEST_KERNEL_MAIN_ARG_D_SIZE 16\n", header)
+        self.assertNotIn("ARG_E_SIZE", header)
+
+    def test_header_index_tables(self):
+        data = r"""
+            __kernel void second(__global int* values);
+            __kernel void first(__global float* input, int count)
+            {
+            }
+            __kernel void second(__global int* values)
+            {
+            }"""
+        result = minify_result(data)
+        header = generate_header("test.cl", result.data, result, function_args=True)
+        self.assertIn("#define TEST_FUNCTION_FIRST_ARG_COUNT \"%s\"\n" % result.kernel_args["first"]["count"], header)
+        self.assertIn("    TEST_KERNEL_SECOND = 0,\n    TEST_KERNEL_FIRST = 1,\n    TEST_NUM_KERNELS = 2\n", header)
+        self.assertIn("TEST_NAMES_OF_KERNELS[] = {\"%s\",\"%s\"};" % (result.kernel_names["second"], result.kernel_names["first"]), header)
+        self.assertIn("    TEST_FIRST_ARG_INPUT = 0,\n    TEST_FIRST_ARG_COUNT = 1,\n    TEST_NUM_ARGS_FIRST = 2\n", header)
+
+    def test_header_without_kernels(self):
+        result = minify_result("float helper(float value) { return value * 2.0f; }")
+        header = generate_header("test.cl", result.data, result)
+        self.assertNotIn("NAMES_OF_KERNELS", header)
+        self.assertIn("    TEST_NUM_KERNELS = 0\n", header)
+        p = subprocess.Popen(["gcc", "-std=c99", "-pedantic-errors", "-fsyntax-only", "-x", "c", "-"],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (_, err) = p.communicate(("#include <stddef.h>\n%s\n" % header).encode("utf-8"))
+        self.assertEqual(p.returncode, 0, err)
+
+    def test_header_index_names_are_unique(self):
+        data = r"""
+            __kernel void a_b(int c) {}
+            __kernel void a(int b_c) {}
+            __kernel void names(int value) {}"""
+        result = minify_result(data)
+        header = generate_header("test.cl", result.data, result)
+        names = re.findall(r"(TEST_\w+)(?: =|\[\])", header)
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn("    TEST_A_B_ARG_C = 0,\n", header)
+        self.assertIn("    TEST_A_ARG_B_C = 0,\n", header)
+        self.assertIn("    TEST_KERNEL_NAMES = 2,\n", header)
+
+        # Names that are still the same after being joined.
+        for (data, name) in [("__kernel void kernel_x(int y) {} __kernel void x_arg_y() {}", "TEST_KERNEL_X_ARG_Y"),
+                             ("__kernel void function_x(int y) {} __kernel void x(int y) {}", "TEST_FUNCTION_X_ARG_Y")]:
+            result = minify_result(data)
+            with self.assertRaises(MinifyError) as context:
+                generate_header("test.cl", result.data, result, function_args=True)
+            self.assertIn(name, str(context.exception))
+
+
+class TestLexical(unittest.TestCase):
+    def test_lexical_only(self):
+        data = r"""
+            // Comment
+            #define SCALE(x)  ((x) * 2.0f) /* multiline
+            comment */
+              #  pragma unroll
+            __kernel __attribute__((reqd_work_group_size(64, 1, 1))) void main(__global float* output, const int count)
+            {
+                output[0] = SCALE(output[1]) + 0x1E - 1 - -count; // Comment
+                output[1] += count++ + ++count;
+                char c = '/'; /* Comment */ const char* s = "/* text */ //";
+            }"""
+        result = minify_lexical_result(data)
+        self.assertEqual(result.text(),
+                         "#define SCALE(x) ((x) * 2.0f)\n#pragma unroll\n"
+                         "__kernel __attribute__((reqd_work_group_size(64,1,1)))void main(__global float*output,const int count)"
+                         "{output[0]=SCALE(output[1])+0x1E -1- -count;output[1]+=count++ + ++count;char c='/';const char*s=\"/* text */ //\";}")
+        self.assertEqual(list(result.kernel_names.items()), [("main", "main")])
+        self.assertEqual(list(result.kernel_args["main"].items()), [("output", "output"), ("count", "count")])
+
+        with self.assertRaises(ParseError) as context:
+            minify_lexical("int a;\n/*\n*/ int @b;")
+        self.assertEqual((context.exception.line, context.exception.column), (3, 8))
+
+        # Directives only preceded by comments on their line.
+        self.assertEqual(minify_lexical("/* c */ #define F(x) x\n/* a\nb */ /**/ # pragma unroll\nint a = F(1);"),
+                         "#define F(x) x\n#pragma unroll\nint a=F(1);")
+
+        for (data, location) in [("int a;\n  /* open", (2, 3)), ("#define A 1 /* open\nint a;", (1, 13))]:
+            with self.assertRaises(ParseError) as context:
+                minify_lexical(data)
+            self.assertEqual((context.exception.line, context.exception.column), location)
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.data = generate_kernel(function_count=2, seed=3)
+
+    def test_variants(self):
+        parse_cache = ParseCache()
+        variants = [
+            dict(minify_kernel_names=True),
+            dict(minify_kernel_names=False),
+            dict(global_postfix="_1"),
+        ]
+        for options in variants:
+            expected = minify(self.data, **options)
+            self.assertEqual(minify(self.data, parse_cache=parse_cache, **options), expected)
+        self.assertEqual((parse_cache.misses, parse_cache.hits), (1, 2))
+
+    def test_evict_least_recently_used(self):
+        parse_cache = ParseCache(max_entries=2)
+        parse_cache.put("first", c_ast.FileAST([]))
+        parse_cache.put("second", c_ast.FileAST([]))
+        parse_cache.get("first")
+        parse_cache.put("third", c_ast.FileAST([]))
+        self.assertIsNotNone(parse_cache.get("first"))
+        self.assertIsNone(parse_cache.get("second"))
+        self.assertIsNot(parse_cache.get("first"), parse_cache.get("first"))
+
+        parse_cache = ParseCache(max_bytes=0)
+        parse_cache.put("first", c_ast.FileAST([]))
+        self.assertEqual(len(parse_cache), 0)
+
+
+class TestThreadSafety(unittest.TestCase):
+    THREAD_COUNT = 16
+
+    def test_concurrent_minify(self):
+        # Minify the benchmark corpus with a mix of options from many threads
+        # at once and make sure every result matches a serial run.
+        jobs = []
+        for seed in range(48):
+            data = generate_kernel(function_count=3, statement_count=6, seed=seed)
+            jobs.append((data, {"minify_kernel_names": seed % 2 == 0, "global_postfix": "_%i" % seed if seed % 3 == 0 else ""}))
+        expected = [minify(data, **kwargs) for (data, kwargs) in jobs]
+
+        def run(job):
+            (data, kwargs) = job
+            return minify(data, **kwargs)
+
+        pool = ThreadPool(self.THREAD_COUNT)
+        try:
+            results = pool.map(run, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(results, expected)
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires Python 3.7 or newer.")
+class TestImportTime(unittest.TestCase):
+    # Modules that are slow to import and should only be loaded by the stages
+    # that need them.
+    DEFERRED_MODULES = ["pycparser", "pycparserext", "oclminify.parser", "oclminify.minifier", "oclminify.generator",
+                        "oclminify.functions", "oclminify.build", "multiprocessing", "subprocess"]
+
+    def imported_modules(self, *args):
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+        process = subprocess.Popen([sys.executable, "-X", "importtime"] + list(args),
+                                   cwd=root,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        (_, err) = process.communicate()
+        self.assertEqual(process.returncode, 0)
+
+        # Each line is "import time: self | cumulative | module" with the
+        # module indented by its depth in the import tree.
+        modules = {}
+        for line in err.decode("utf-8").splitlines():
+            parts = line.split("|")
+            if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+                modules[parts[2].strip()] = int(parts[1])
+        return modules
+
+    def test_help(self):
+        modules = self.imported_modules("-m", "oclminify", "--help")
+        self.assertIn("oclminify.minify", modules)
+        for module in self.DEFERRED_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_import_minify(self):
+        modules = self.imported_modules("-c", "import oclminify.minify")
+        for module in self.DEFERRED_MODULES:
+            self.assertNotIn(module, modules)
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as fd:
+            fd.write(text)
+        return path
+
+    def test_dependencies(self):
+        self.write("constants.h", "#define VALUE 2\n")
+        data = "#include \"constants.h\"\n__kernel void main(){int value = VALUE;}\n"
+        result = minify_result(data, preprocessor_command="gcc -E -undef -P -std=c99 -I%s -" % self.directory, dependencies=True)
+        self.assertEqual(result.text(), "__kernel void a(){int b=2;}")
+        self.assertIn(os.path.join(self.directory, "constants.h"), result.dependencies)
+        self.assertEqual(minify_result(data, preprocessor_command="gcc -E -undef -P -std=c99 -I%s -" % self.directory).dependencies, [])
+
+    def test_dependencies_after_error(self):
+        # Fixing an error in an included file has to minify the input again
+        # when watching.
+        header = self.write("constants.h", "#define VALUE @\n")
+        data = "#include \"constants.h\"\n__kernel void main(){int value = VALUE;}\n"
+        command = "gcc -E -undef -P -std=c99 -I%s -" % self.directory
+        with self.assertRaises(ParseError) as context:
+            minify_result(data, preprocessor_command=command, dependencies=True)
+        self.assertIn(header, context.exception.dependencies)
+        self.write("constants.h", "#error Not ready\n")
+        with self.assertRaises(PreprocessError) as context:
+            minify_result(data, preprocessor_command=command, dependencies=True)
+        self.assertIn(header, context.exception.dependencies)
+
+        from oclminify import __main__ as cli
+        input_path = self.write("input.cl", data)
+        args = cli._parse_args(["--preprocessor-command", command, "--watch", "--output-file", os.path.join(self.directory, "out.cl"), input_path])
+        job = cli._Job(input_path, args.output_file[0], "")
+        self.assertFalse(cli._process(args, job, None, None))
+        self.assertIn(header, job.dependencies)
+
+    def test_depfile(self):
+        self.write("constants.h", "#define VALUE 2\n")
+        first = self.write("first.cl", "#include \"constants.h\"\n__kernel void first(){int value = VALUE;}\n")
+        second = self.write("second.cl", "__kernel void second(){}\n")
+        outputs = [os.path.join(self.directory, "first out.cl"), os.path.join(self.directory, "second.cl.min")]
+        depfile = os.path.join(self.directory, "out.d")
+        main(["--preprocessor-command", "gcc -E -undef -P -std=c99 -I%s -" % self.directory,
+              "--depfile", depfile,
+              "--output-file", outputs[0], "--global-postfix", "_1",
+              "--output-file", outputs[1], "--global-postfix", "_2",
+              first, second])
+        with open(outputs[0], "r") as fd:
+            self.assertEqual(fd.read(), "__kernel void a_1(){int a=2;}")
+        with open(depfile, "r") as fd:
+            (targets, dependencies) = fd.read().split(":", 1)
+        self.assertEqual(targets, "%s %s" % (outputs[0].replace(" ", "\\ "), outputs[1]))
+        dependencies = dependencies.replace("\\\n", "").split()
+        self.assertEqual([dependencies[0], dependencies[-1]], [first, second])
+        self.assertIn(os.path.join(self.directory, "constants.h"), dependencies)
+
+    def test_emit(self):
+        first = self.write("first.cl", "__kernel void first(__global float* output){output[0] = 1.0f;}\n")
+        second = self.write("second.cl", "__kernel void second(){}\n")
+        depfile = os.path.join(self.directory, "out.d")
+        main(["--minify-kernel-names",
+              "--depfile", depfile,
+              "--emit", "minified=%s" % os.path.join(self.directory, "{name}.min.cl"),
+              "--emit", "header+compress=%s" % os.path.join(self.directory, "{name}.h"),
+              "--emit", "manifest=%s" % os.path.join(self.directory, "{name}.json"),
+              first, second])
+        with open(os.path.join(self.directory, "first.min.cl"), "r") as fd:
+            minified = fd.read()
+        self.assertEqual(minified, "__kernel void a(__global float*b){b[0]=1.f;}")
+        with open(os.path.join(self.directory, "first.h"), "r") as fd:
+            self.assertIn("static const size_t FIRST_SIZE = %i;" % len(zlib.compress(minified.encode("utf-8"), 9)), fd.read())
+        with open(os.path.join(self.directory, "first.json"), "r") as fd:
+            manifest = json.load(fd)
+        self.assertEqual(manifest["kernels"], [{"name": "first", "minified_name": "a", "args": [{
+            "index": 0, "name": "output", "minified_name": "b", "address_qualifier": "global", "access_qualifier": "none",
+            "type": "float", "pointer": True, "vector_width": 1, "size": 4}]}])
+        with open(depfile, "r") as fd:
+            targets = fd.read().split(":", 1)[0].split()
+        self.assertEqual(len(targets), 6)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "second.json")))
+
+    def test_header_binaries(self):
+        input_path = self.write("input.cl", "__kernel void main(){}\n")
+        output_path = os.path.join(self.directory, "input.h")
+        results = [BuildResult("Platform", "First \"GPU\"", "1.0", True, "", binary=b"\x01\x02"),
+                   BuildResult("Platform", "Second", "2.0", True, "", binary=b"\x03")]
+        build = BuildChecker.build
+        BuildChecker.build = lambda self, data, options="", binaries=False: results
+        try:
+            main(["--header-binaries", "--no-build-cache", "--output-file", output_path, input_path])
+            with open(output_path, "r") as fd:
+                header = fd.read()
+            self.assertIn("static const unsigned char INPUT_BINARY_0_DATA[] = {0x1,0x2};\n", header)
+            self.assertIn("#define INPUT_BINARY_COUNT 2\n", header)
+            self.assertIn("INPUT_BINARY_DEVICE_NAMES[] = {\"First \\\"GPU\\\"\",\"Second\"};\n", header)
+            self.assertIn("INPUT_BINARY_SIZES[] = {2,1};\n", header)
+
+            # A failed build is reported and nothing is written.
+            os.remove(output_path)
+            results[1].success = False
+            with self.assertRaises(SystemExit):
+                main(["--header-binaries", "--no-build-cache", "--output-file", output_path, input_path])
+            self.assertFalse(os.path.exists(output_path))
+        finally:
+            BuildChecker.build = build
+
+    def test_watcher(self):
+        first = self.write("first.cl", "first")
+        second = self.write("second.cl", "second")
+        watcher = Watcher(interval=0.01, debounce=0.05)
+        watcher.update([first, second])
+
+        # Replace the file like an editor that saves to a temporary file and
+        # renames it. Only the inode changes.
+        stat = os.stat(second)
+        replacement = self.write("replacement.cl", "second")
+        os.utime(replacement, (stat.st_atime, stat.st_mtime))
+        os.rename(replacement, second)
+        self.assertEqual(watcher.wait([first, second]), set([second]))
+
+        os.remove(first)
+        self.assertEqual(watcher.wait([first, second]), set([first]))
+
+
+class TestErrors(unittest.TestCase):
+    def test_preprocess_error(self):
+        with self.assertRaises(PreprocessError) as context:
+            minify("#error broken\n")
+        self.assertNotEqual(context.exception.returncode, 0)
+        self.assertIn("broken", context.exception.stderr)
+
+    def test_parse_error(self):
+        data = "__kernel void main()\n{\n    int test = ;\n}\n"
+        with self.assertRaises(ParseError) as context:
+            minify(data, preprocessor_command="cat")
+        self.assertEqual(context.exception.line, 3)
+        self.assertEqual(context.exception.column, 16)
+        self.assertTrue(str(context.exception).startswith("<input>:3:16: "))
+
+        error = pickle.loads(pickle.dumps(context.exception))
+        self.assertEqual((str(error), error.line), (str(context.exception), 3))
+
+    def test_unsupported_node(self):
+        class UnknownNode(c_ast.Node):
+            __slots__ = ("coord", )
+            attr_names = ()
+
+            def __init__(self, coord):
+                self.coord = coord
+
+            def children(self):
+                return ()
+
+        with self.assertRaises(UnsupportedNodeError) as context:
+            Minifier(True, "").visit(UnknownNode(Coord("kernel.cl", 4, 2)))
+        self.assertEqual(context.exception.node_type, "UnknownNode")
+        self.assertEqual(str(context.exception), "kernel.cl:4:2: Could not find method Minifier.visit_UnknownNode")
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio API requires Python 3.5 or newer.")
+class TestMinifyAsync(unittest.TestCase):
+    data = r"""
+        #define SCALE 2.0f
+        __kernel void main(__global float* values)
+        {
+            values[get_global_id(0)] *= SCALE;
+        }"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_minify_async(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            result = self.loop.run_until_complete(minify_async(self.data))
+        self.assertEqual(result, minify(self.data))
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = self.loop.run_until_complete(minify_async(self.data, global_postfix="_a", executor=executor))
+        self.assertEqual(result, minify(self.data, global_postfix="_a"))
+
+    def test_result(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = self.loop.run_until_complete(minify_result_async(self.data, executor=executor))
+        self.assertEqual(result.text(), minify(self.data))
+        self.assertEqual(list(result.kernel_names.keys()), ["main"])
+        self.assertEqual(sorted(result.timings.keys()), ["generate", "minify", "parse", "preprocess"])
+
+    def test_bounded_concurrency(self):
+        async_minifier = AsyncMinifier(max_concurrency=2)
+        sources = [self.data.replace("2.0f", "%i.0f" % index) for index in range(6)]
+        results = self.loop.run_until_complete(asyncio.gather(*[async_minifier.minify(data) for data in sources]))
+        self.assertEqual(results, [minify(data) for data in sources])
+
+    def test_preprocess_error(self):
+        with self.assertRaises(PreprocessError) as context:
+            self.loop.run_until_complete(minify_async("#error broken\n"))
+        self.assertNotEqual(context.exception.returncode, 0)
+        self.assertIn("broken", context.exception.stderr)
+
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        identity = ("Platform", "OpenCL 1.2", "Device", "OpenCL 1.2", "1.0")
+        key = BuildCache.key("__kernel void a(){}", "", identity)
+        self.assertEqual(key, BuildCache.key(b"__kernel void a(){}", "", identity))
+        self.assertNotEqual(key, BuildCache.key("__kernel void b(){}", "", identity))
+        self.assertNotEqual(key, BuildCache.key("__kernel void a(){}", "-cl-fast-relaxed-math", identity))
+        self.assertNotEqual(key, BuildCache.key("__kernel void a(){}", "", identity[:-1] + ("1.1", )))
+
+    def test_get_put(self):
+        cache = BuildCache(self.directory)
+        self.assertIsNone(cache.get("missing"))
+        cache.put("success", True, "")
+        cache.put("failure", False, "error: expected expression")
+        self.assertEqual(cache.get("success"), (True, ""))
+        self.assertEqual(cache.get("failure"), (False, "error: expected expression"))
+
+    def test_evict_least_recently_used(self):
+        cache = BuildCache(self.directory, max_entries=2)
+        cache.put("first", True, "")
+        cache.put("second", True, "")
+        old_time = time.time() - 60
+        os.utime(os.path.join(self.directory, "first.json"), (old_time, old_time))
+        os.utime(os.path.join(self.directory, "second.json"), (old_time - 60, old_time - 60))
+        cache.get("second")  # Mark as recently used so first is evicted instead.
+        cache.put("third", True, "")
+        self.assertIsNone(cache.get("first"))
+        self.assertIsNotNone(cache.get("second"))
+        self.assertIsNotNone(cache.get("third"))
+
+    def test_evict_old_entries(self):
+        cache = BuildCache(self.directory, max_age=60)
+        cache.put("old", True, "")
+        old_time = time.time() - 120
+        os.utime(os.path.join(self.directory, "old.json"), (old_time, old_time))
+        cache.put("new", True, "")
+        self.assertIsNone(cache.get("old"))
+        self.assertIsNotNone(cache.get("new"))
 
 
 if __name__ == "__main__":